@@ -1020,23 +1020,11 @@ async def run_saved_model_db(
     import joblib, geopandas as gpd, pandas as pd, numpy as np
     import matplotlib.pyplot as plt
     from matplotlib.backends.backend_pdf import PdfPages
-    from sqlalchemy import create_engine
     from datetime import datetime
     import tempfile, os, zipfile
 
-    # === DB connection ===
-    DB_CONFIG = {
-        "host": "104.199.142.35",
-        "port": 5432,
-        "database": "PH04021",
-        "user": "postgres",
-        "password": "#IGDIwebapp",
-    }
-    DB_URL = (
-        f"postgresql://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
-        f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-    )
-    engine = create_engine(DB_URL)
+    # === DB connection (shared pooled engine) ===
+    engine = ml_db_engine()
 
     try:
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -1232,7 +1220,8 @@ async def download_file(file: str = Query(...)):
 # ============================================================
 # 🔹 5. Database Table + Field List + Train From DB
 # ============================================================
-import psycopg2
+from connection_pools import pooled_connection
+from pool_manager import pool_manager
 
 DB_CONFIG = {
     "host": "104.199.142.35",
@@ -1243,27 +1232,35 @@ DB_CONFIG = {
     "schema": "PH0402118"
 }
 
+
+def ml_db_connection():
+    """Borrow a pooled psycopg connection to the DB_CONFIG database."""
+    return pooled_connection(
+        DB_CONFIG["host"], DB_CONFIG["port"], DB_CONFIG["database"],
+        DB_CONFIG["user"], DB_CONFIG["password"]
+    )
+
+
+def ml_db_engine():
+    """Shared (pooled) SQLAlchemy engine of the DB_CONFIG database, for pandas/GeoPandas."""
+    return pool_manager.get_engine(
+        DB_CONFIG["host"], DB_CONFIG["port"], DB_CONFIG["database"],
+        DB_CONFIG["user"], DB_CONFIG["password"]
+    )
+
 @router.get("/db-tables")
 def get_db_tables():
     """Fetch all tables across all barangay schemas."""
     try:
-        conn = psycopg2.connect(
-            host=DB_CONFIG["host"],
-            port=DB_CONFIG["port"],
-            database=DB_CONFIG["database"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"]
-        )
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT table_schema || '.' || table_name
-            FROM information_schema.tables
-            WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
-              AND table_schema LIKE 'PH0402%'  -- ✅ only your barangay/province schemas
-            ORDER BY table_schema, table_name;
-        """)
-        tables = [r[0] for r in cur.fetchall()]
-        cur.close(); conn.close()
+        with ml_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT table_schema || '.' || table_name
+                FROM information_schema.tables
+                WHERE table_schema NOT IN ('pg_catalog', 'information_schema')
+                  AND table_schema LIKE 'PH0402%'  -- ✅ only your barangay/province schemas
+                ORDER BY table_schema, table_name;
+            """)
+            tables = [r[0] for r in cur.fetchall()]
         return {"tables": tables}
     except Exception as e:
         print(f"❌ DB TABLES ERROR: {e}")
@@ -1284,21 +1281,13 @@ def get_db_fields(table: str):
             parts = table_name.split(".", 1)
             schema, table_name = parts[0], parts[1]
 
-        conn = psycopg2.connect(
-            host=DB_CONFIG["host"],
-            port=DB_CONFIG["port"],
-            database=DB_CONFIG["database"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"]
-        )
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT column_name
-            FROM information_schema.columns
-            WHERE table_schema = %s AND table_name = %s;
-        """, (schema, table_name))
-        fields = [r[0] for r in cur.fetchall()]
-        cur.close(); conn.close()
+        with ml_db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_schema = %s AND table_name = %s;
+            """, (schema, table_name))
+            fields = [r[0] for r in cur.fetchall()]
 
         print(f"✅ Fetched {len(fields)} fields from {schema}.{table_name}")
         return {"fields": fields}
@@ -1341,17 +1330,9 @@ async def train_linear_regression_db(
         if "." in table_part:
             schema_part, table_part = table_part.split(".", 1)
 
-        conn = psycopg2.connect(
-            host=DB_CONFIG["host"],
-            port=DB_CONFIG["port"],
-            database=DB_CONFIG["database"],
-            user=DB_CONFIG["user"],
-            password=DB_CONFIG["password"]
-        )
         sql = f'SELECT * FROM "{schema_part}"."{table_part}"'
         print(f"📊 Fetching DB table: {sql}")
-        df_full = pd.read_sql(sql, conn)
-        conn.close()
+        df_full = pd.read_sql(sql, ml_db_engine())
 
         # ============================================================
         # 🧮 2. Parse Variables
@@ -1590,7 +1571,6 @@ async def save_to_db(payload: dict):
     """
     import geopandas as gpd
     import zipfile, tempfile, os
-    from sqlalchemy import create_engine
     from fastapi.responses import JSONResponse
 
     shapefile_url = payload.get("shapefile_url")
@@ -1617,11 +1597,8 @@ async def save_to_db(payload: dict):
             shp_path = shp_files[0]
             gdf = gpd.read_file(shp_path)
 
-            # ✅ Build SQLAlchemy engine (GeoPandas-compatible)
-            engine = create_engine(
-                f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
-                f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-            )
+            # ✅ Shared SQLAlchemy engine (GeoPandas-compatible)
+            engine = ml_db_engine()
 
             # ✅ Verify schema exists before writing
             from sqlalchemy import text
@@ -1643,7 +1620,6 @@ async def save_to_db(payload: dict):
                 if_exists="replace",   # overwrite if exists
                 index=False
             )
-            engine.dispose()
 
         print(f"✅ Saved shapefile to DB table: {DB_CONFIG['schema']}.{table_name}")
         return {
@@ -1662,17 +1638,11 @@ def get_predicted_geojson(table: str = "Predicted_Output"):
     Serve the predicted PostGIS table as GeoJSON for thematic display.
     """
     import geopandas as gpd
-    from sqlalchemy import create_engine
     import json
 
     try:
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_CONFIG['user']}:{DB_CONFIG['password']}@"
-            f"{DB_CONFIG['host']}:{DB_CONFIG['port']}/{DB_CONFIG['database']}"
-        )
         sql = f'SELECT * FROM "{DB_CONFIG["schema"]}"."{table}"'
-        gdf = gpd.read_postgis(sql, engine, geom_col="geometry")
-        engine.dispose()
+        gdf = gpd.read_postgis(sql, ml_db_engine(), geom_col="geometry")
 
         return json.loads(gdf.to_json())
 
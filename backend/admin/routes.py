@@ -5,10 +5,17 @@ from sqlalchemy.pool import NullPool
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
+from starlette.concurrency import run_in_threadpool
 
-from auth.dependencies import get_current_admin
+from auth.dependencies import get_current_admin, invalidate_principal
 from auth.models import Admin, User, UserRegistrationRequest, Credentials
-from db import get_auth_db
+from db import get_auth_db, invalidate_credentials_cache
+from pool_manager import pool_manager
+from connection_pools import pool_stats as psycopg_pool_stats
+import query_profiler
+from catalog import invalidate_cached_database
+from snapshots import snapshot_store
+from tile_cache import tile_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -125,6 +132,7 @@ async def update_user_access(
     
     db.commit()
     db.refresh(user)
+    invalidate_principal("user", user.id)
     
     return {
         "message": "User access updated successfully",
@@ -171,6 +179,7 @@ async def update_user(
     try:
         db.commit()
         db.refresh(user)
+        invalidate_principal("user", user.id)
         
         return {
             "message": "User updated successfully",
@@ -203,6 +212,7 @@ async def delete_user(user_id: int,
     username = user.user_name
     db.delete(user)
     db.commit()
+    invalidate_principal("user", user_id)
 
     return {
         "message": f"User '{username}' deleted successfully",
@@ -210,6 +220,158 @@ async def delete_user(user_id: int,
         "timestamp": datetime.utcnow().isoformat()
     }
 
+@router.post("/credentials-cache/invalidate")
+async def invalidate_credentials(
+    provincial_access: Optional[str] = None,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Drop cached PSA code → database credentials (one code, or all) after credentials change."""
+    code = strip_suffix(provincial_access) if provincial_access else None
+    removed = invalidate_credentials_cache(code)
+    print(f"🔄 Credentials cache invalidated by {current_admin.user_name}: {code or 'all'} ({removed} entries)")
+    return {
+        "message": "Credentials cache invalidated",
+        "provincial_access": code,
+        "removed": removed,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.post("/schema-cache/invalidate")
+async def invalidate_schema_cache(
+    database: Optional[str] = None,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Drop cached schema lists, table catalogs and snapshots (one database, or all) after schemas are added or removed."""
+    removed = invalidate_cached_database(database)
+    print(f"🔄 Schema cache invalidated by {current_admin.user_name}: {database or 'all'} ({removed} databases)")
+    return {
+        "message": "Schema cache invalidated",
+        "database": database,
+        "removed": removed,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/tile-cache")
+async def get_tile_cache_stats(current_admin: Admin = Depends(get_current_admin)):
+    """Size, hit/miss and eviction counters of the in-process vector tile cache."""
+    return {**tile_cache.stats(), "timestamp": datetime.utcnow().isoformat()}
+
+
+@router.get("/snapshots")
+async def get_snapshot_stats(current_admin: Admin = Depends(get_current_admin)):
+    """Entries and bytes of the bounds / boundary response snapshots."""
+    return {**snapshot_store.stats(), "timestamp": datetime.utcnow().isoformat()}
+
+
+@router.post("/snapshots/invalidate")
+async def invalidate_snapshots(
+    database: Optional[str] = None,
+    schema: Optional[str] = None,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Drop bounds / boundary snapshots (one database and/or schema, or all) after boundary edits."""
+    removed = snapshot_store.invalidate(database, schema)
+    print(f"🔄 Snapshots invalidated by {current_admin.user_name}: "
+          f"{database or 'all'}/{schema or 'all'} ({removed} entries)")
+    return {
+        "message": "Snapshots invalidated",
+        "database": database,
+        "schema": schema,
+        "removed": removed,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/pool-stats")
+async def get_pool_stats(current_admin: Admin = Depends(get_current_admin)):
+    """Pool size, checked-out / overflow connections and checkout wait times per provincial engine."""
+    return {
+        "engines": pool_manager.stats(),
+        "psycopg_pools": psycopg_pool_stats(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.post("/pool-stats/evict-idle")
+async def evict_idle_engines(
+    idle_seconds: int = 0,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Dispose provincial engines idle for at least idle_seconds with nothing checked out."""
+    evicted = pool_manager.evict_idle(idle_seconds)
+    return {
+        "message": f"Disposed {len(evicted)} idle engine(s)",
+        "evicted": evicted,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+class SlowQuerySettings(BaseModel):
+    enabled: Optional[bool] = None
+    threshold_ms: Optional[float] = None
+    explain_rate: Optional[float] = None
+
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = 100,
+    fingerprint: Optional[str] = None,
+    route: Optional[str] = None,
+    source: str = "memory",
+    include_plans: bool = False,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Newest queries over the profiler threshold (source=memory or file for the rotating store)."""
+    if source not in ("memory", "file"):
+        raise HTTPException(status_code=400, detail="source must be 'memory' or 'file'")
+    limit = max(1, min(limit, 1000))
+    if source == "file":
+        records = await run_in_threadpool(query_profiler.read_store, limit, fingerprint, route)
+    else:
+        records = query_profiler.recent(limit, fingerprint, route)
+    if not include_plans:
+        records = [{k: v for k, v in r.items() if k != "plan"} | {"has_plan": "plan" in r} for r in records]
+    return {
+        "profiler": query_profiler.status(),
+        "queries": records,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.get("/slow-queries/summary")
+async def get_slow_query_summary(current_admin: Admin = Depends(get_current_admin)):
+    """Captured slow queries grouped by normalised SQL, slowest total first."""
+    return {
+        "profiler": query_profiler.status(),
+        "fingerprints": query_profiler.summary(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@router.post("/slow-queries/settings")
+async def update_slow_query_settings(
+    payload: SlowQuerySettings,
+    current_admin: Admin = Depends(get_current_admin)
+):
+    """Turn the profiler on/off or change its threshold / EXPLAIN sample rate (until restart)."""
+    profiler = query_profiler.configure(payload.enabled, payload.threshold_ms, payload.explain_rate)
+    print(f"🔬 Query profiler updated by {current_admin.user_name}: {profiler}")
+    return {"profiler": profiler, "timestamp": datetime.utcnow().isoformat()}
+
+
+@router.delete("/slow-queries")
+async def clear_slow_queries(current_admin: Admin = Depends(get_current_admin)):
+    """Empty the in-memory buffer (the rotating files are kept)."""
+    removed = query_profiler.clear()
+    return {
+        "message": f"Cleared {removed} captured queries",
+        "removed": removed,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
 @router.get("/users/all")
 async def get_all_users_and_requests(
     current_admin: Admin = Depends(get_current_admin),
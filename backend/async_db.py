@@ -0,0 +1,64 @@
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+from typing import Dict
+
+from auth.models import Credentials
+from db import resolve_credentials
+from metrics import InstrumentedAsyncCursor
+from pool_manager import pool_manager
+
+# Session factories keyed by host:port/dbname (engines live in pool_manager)
+_async_session_factories: Dict[str, async_sessionmaker] = {}
+
+
+def engine_key(engine: AsyncEngine) -> str:
+    url = engine.url
+    return f"{url.host}:{url.port}/{url.database}"
+
+
+def get_async_engine_from_credentials(creds: Credentials) -> AsyncEngine:
+    """Get the pool manager's AsyncEngine for a credentials row."""
+    return pool_manager.get_async_engine(creds.host, creds.port, creds.dbname, creds.user, creds.password)
+
+
+async def get_user_async_session(provincial_access: str) -> AsyncSession:
+    """
+    Async counterpart of db.get_user_database_session. Credentials are
+    resolved through the same cache (off the event loop on a miss).
+    """
+    if not provincial_access:
+        raise ValueError("User has no provincial access assigned")
+
+    creds = await run_in_threadpool(resolve_credentials, provincial_access)
+    engine = get_async_engine_from_credentials(creds)
+    key = engine_key(engine)
+    factory = _async_session_factories.get(key)
+    # Rebuild when the pool manager has replaced an evicted engine
+    if factory is None or factory.kw.get("bind") is not engine:
+        factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+        _async_session_factories[key] = factory
+    return factory()
+
+
+def session_database_name(db: AsyncSession) -> str:
+    """Actual database name of the session's engine (no round trip)."""
+    return db.bind.url.database or "unknown"
+
+
+async def raw_connection(db: AsyncSession):
+    """
+    Return the session's underlying psycopg AsyncConnection, for routes that
+    run hand-written %s SQL. Commit/rollback it directly, as with psycopg2.
+    """
+    conn = await db.connection()
+    fairy = await conn.get_raw_connection()
+    return fairy.driver_connection
+
+
+def raw_cursor(conn, row_factory=None) -> InstrumentedAsyncCursor:
+    """
+    Cursor on a raw_connection() whose queries show up in /metrics and the
+    slow-query profiler. Use it instead of conn.cursor(): the connection's own
+    cursor_factory stays SQLAlchemy's so nothing is counted twice.
+    """
+    return InstrumentedAsyncCursor(conn, row_factory=row_factory)
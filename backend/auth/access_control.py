@@ -1,8 +1,20 @@
-from typing import List, Dict, Optional
+from bisect import bisect_left
+from functools import lru_cache
+from typing import List, Dict, Optional, Sequence
 from auth.models import User
 import re
 
 
+@lru_cache(maxsize=4096)
+def _access_prefix(provincial_access: Optional[str], municipal_access: Optional[str]) -> Optional[str]:
+    """Schema-name prefix a user may see (None = no access). Computed once per access pair."""
+    if not provincial_access or not municipal_access:
+        return None
+    if municipal_access.strip().lower() == "all":
+        return AccessControl.normalize_code(provincial_access)
+    return AccessControl.normalize_code(municipal_access)
+
+
 class AccessControl:
     @staticmethod
     def normalize_code(code: str) -> str:
@@ -45,18 +57,24 @@ class AccessControl:
     # =====================================================
     @staticmethod
     def filter_schemas_by_access(all_schemas: List[str], user: User) -> List[str]:
-        if not user.provincial_access or not user.municipal_access:
+        # Province prefix for "All" users, otherwise municipal prefix (ignoring suffix)
+        prefix = _access_prefix(user.provincial_access, user.municipal_access)
+        if prefix is None:
             return []
+        return sorted([s for s in all_schemas if s.startswith(prefix)])
 
-        prov_code = AccessControl.normalize_code(user.provincial_access)
-        mun_code = AccessControl.normalize_code(user.municipal_access)
-
-        # Allow all municipalities under province
-        if user.municipal_access.strip().lower() == "all":
-            return sorted([s for s in all_schemas if s.startswith(prov_code)])
-
-        # Otherwise match by municipal prefix (ignoring suffix)
-        return sorted([s for s in all_schemas if s.startswith(mun_code)])
+    @staticmethod
+    def filter_sorted_schemas(sorted_schemas: Sequence[str], user: User) -> List[str]:
+        """Same as filter_schemas_by_access for an already sorted list (binary search on the prefix)."""
+        prefix = _access_prefix(user.provincial_access, user.municipal_access)
+        if prefix is None:
+            return []
+        result = []
+        for i in range(bisect_left(sorted_schemas, prefix), len(sorted_schemas)):
+            if not sorted_schemas[i].startswith(prefix):
+                break
+            result.append(sorted_schemas[i])
+        return result
 
     # =====================================================
     # ✅ VALIDATE SPECIFIC SCHEMA
@@ -78,10 +96,11 @@ class AccessControl:
     # ✅ HUMAN DESCRIPTION (UPDATED)
     # =====================================================
     @staticmethod
-    def get_access_description(user: User) -> str:
+    def get_access_description(user: User, db_name: Optional[str] = None) -> str:
         """
         Generates a human-readable description of the user's access level.
-        Dynamically fetches the actual provincial database name if access is 'All'.
+        For 'All' access, db_name (or the cached provincial engine's database
+        name) is used; no query is run.
         """
         if not user.provincial_access and not user.municipal_access:
             return "No access assigned"
@@ -90,20 +109,15 @@ class AccessControl:
             return f"Provincial access {user.provincial_access} only (no municipal access)"
 
         if user.municipal_access.strip().lower() == "all":
-            # ✅ Dynamically get the connected provincial DB name
-            try:
-                from sqlalchemy import text
-                # Delayed import to avoid circular dependency
-                from auth.dependencies import get_user_database_session
-
-                db = get_user_database_session(user.provincial_access)
-                result = db.execute(text("SELECT current_database()")).scalar()
-                db_name = result or user.provincial_access
-            except Exception:
-                db_name = user.provincial_access
-            finally:
-                if "db" in locals():
-                    db.close()
+            # ✅ Provincial DB name from the engine cache
+            if not db_name:
+                try:
+                    # Delayed import to avoid circular dependency
+                    from db import get_user_database_engine, get_engine_database_name
+
+                    db_name = get_engine_database_name(get_user_database_engine(user.provincial_access))
+                except Exception:
+                    db_name = user.provincial_access
 
             return f"Full access to all municipalities under {db_name}"
 
@@ -1,15 +1,21 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-from sqlalchemy import text
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
-from typing import Generator
+from typing import AsyncGenerator, Dict, Generator, Optional, Tuple
+import hmac
 import jwt
 import os
+import threading
+import time
 
-from db import get_auth_db, get_user_database_session
+from db import AuthSessionLocal, get_user_database_session, get_engine_database_name
+from async_db import get_user_async_session, session_database_name
 from auth.models import User, Admin
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth.access_control import AccessControl
+from metrics import annotate
 
 # ============================================================
 # 🔐 JWT and Security Setup
@@ -17,6 +23,59 @@ from auth.access_control import AccessControl
 security = HTTPBearer()
 SECRET_KEY = os.getenv("SECRET_KEY", "secret_ngani")
 ALGORITHM = "HS256"
+# Static bearer token for Prometheus scrapes of /metrics (admins may use their JWT)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+# ============================================================
+# ⚡ PRINCIPAL CACHE
+# ============================================================
+# How long a resolved user/admin row is reused for the same token
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 60))
+# Hard cap on cached principals (oldest dropped first)
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", 10000))
+
+# (user_type, user_id, token iat) → (column values, cached_at)
+_principal_cache: Dict[Tuple[str, int, Optional[int]], Tuple[dict, float]] = {}
+_principal_lock = threading.Lock()
+
+
+def _principal_values(row) -> dict:
+    return {c.key: getattr(row, c.key) for c in row.__table__.columns}
+
+
+def _load_principal(user_type: str, user_id: int) -> Optional[dict]:
+    """Read a user/admin row from the auth DB as a plain dict (None if missing)."""
+    model = Admin if user_type == "admin" else User
+    auth_db = AuthSessionLocal()
+    try:
+        row = auth_db.query(model).filter(model.id == user_id).first()
+        return _principal_values(row) if row else None
+    finally:
+        auth_db.close()
+
+
+def _cache_principal(key: Tuple[str, int, Optional[int]], values: dict):
+    """Store a principal, dropping expired entries (every login adds a new iat key)."""
+    now = time.monotonic()
+    with _principal_lock:
+        _principal_cache.pop(key, None)
+        _principal_cache[key] = (values, now)
+        # Insertion order is age order, so expired entries are at the front
+        for k in list(_principal_cache):
+            expired = now - _principal_cache[k][1] > PRINCIPAL_CACHE_TTL_SECONDS
+            if not expired and len(_principal_cache) <= PRINCIPAL_CACHE_MAX_ENTRIES:
+                break
+            del _principal_cache[k]
+
+
+def invalidate_principal(user_type: str, user_id: int) -> int:
+    """Drop every cached principal of a user/admin (call after access changes or deletion)."""
+    with _principal_lock:
+        keys = [k for k in _principal_cache if k[0] == user_type and k[1] == user_id]
+        for k in keys:
+            del _principal_cache[k]
+    return len(keys)
 
 
 # ============================================================
@@ -24,10 +83,14 @@ ALGORITHM = "HS256"
 # ============================================================
 
 async def get_current_user_or_admin(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    auth_db: Session = Depends(get_auth_db)
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
-    """Return the current authenticated user (regular or admin)."""
+    """
+    Return the current authenticated user (regular or admin).
+    The row is cached per (user_id, token iat) for PRINCIPAL_CACHE_TTL_SECONDS,
+    so the auth DB is only queried on the first request of each window.
+    A fresh, detached instance is returned on every call.
+    """
     token = credentials.credentials
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -40,19 +103,29 @@ async def get_current_user_or_admin(
                 detail="Invalid authentication token."
             )
 
+        key = (user_type, user_id, payload.get("iat"))
+        cached = _principal_cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] <= PRINCIPAL_CACHE_TTL_SECONDS:
+            values = cached[0]
+        else:
+            # Blocking auth DB query: keep it off the event loop
+            values = await run_in_threadpool(_load_principal, user_type, user_id)
+            if values is not None:
+                _cache_principal(key, values)
+
         # ✅ Handle Admin login
         if user_type == "admin":
-            admin = auth_db.query(Admin).filter(Admin.id == user_id).first()
-            if not admin:
+            if not values:
                 raise HTTPException(status_code=401, detail="Admin not found.")
+            admin = Admin(**values)
             admin.user_type = "admin"
             admin.provincial_access = "postgres"  # default for admin
             return admin
 
         # ✅ Handle Regular User login
-        user = auth_db.query(User).filter(User.id == user_id).first()
-        if not user:
+        if not values:
             raise HTTPException(status_code=401, detail="User not found.")
+        user = User(**values)
         user.user_type = "user"
         return user
 
@@ -62,23 +135,30 @@ async def get_current_user_or_admin(
         raise HTTPException(status_code=401, detail="Invalid token.")
 
 
+async def require_metrics_access(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+):
+    """Allow /metrics for the METRICS_TOKEN bearer token (scrapers) or an admin JWT."""
+    if METRICS_TOKEN and hmac.compare_digest(credentials.credentials, METRICS_TOKEN):
+        return
+    await get_current_admin(credentials)
+
+
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    auth_db: Session = Depends(get_auth_db)
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> User:
     """Return current user (non-admin)."""
-    user_or_admin = await get_current_user_or_admin(credentials, auth_db)
+    user_or_admin = await get_current_user_or_admin(credentials)
     if getattr(user_or_admin, "user_type", None) == "admin":
         raise HTTPException(status_code=403, detail="Admins not allowed for this route.")
     return user_or_admin
 
 
 async def get_current_admin(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    auth_db: Session = Depends(get_auth_db)
+    credentials: HTTPAuthorizationCredentials = Depends(security)
 ) -> Admin:
     """Return current admin (non-user)."""
-    user_or_admin = await get_current_user_or_admin(credentials, auth_db)
+    user_or_admin = await get_current_user_or_admin(credentials)
     if getattr(user_or_admin, "user_type", None) != "admin":
         raise HTTPException(status_code=403, detail="Admin access required.")
     return user_or_admin
@@ -107,21 +187,20 @@ def get_user_main_db(current_user: User = Depends(get_current_user)) -> Generato
         # ✅ Step 1. Connect using the provincial PSA code (e.g. PH04034)
         db = get_user_database_session(current_user.provincial_access)
 
-        # ✅ Step 2. Detect the actual DB name
-        result = db.execute(text("SELECT current_database()"))
-        actual_dbname = result.scalar() or "unknown"
+        # ✅ Step 2. Actual DB name (known per engine, no query)
+        actual_dbname = get_engine_database_name(db.get_bind())
 
         # ✅ Step 3. Attach to current_user for use in /list-schemas
         setattr(current_user, "actual_dbname", actual_dbname)
 
-        # ✅ Step 4. Logging
-        print("=== DATABASE CONNECTION ===")
-        print(f"User: {current_user.user_name}")
-        print(f"Provincial Access (PSA): {current_user.provincial_access}")
-        print(f"Connected Database: {actual_dbname}")
-        print(f"Municipal Access: {current_user.municipal_access}")
-        print(f"Access Status: {access_info['status']}")
-        print("============================")
+        # ✅ Step 4. Logging (sampled request log, see metrics.py)
+        annotate(
+            user=current_user.user_name,
+            provincial_access=current_user.provincial_access,
+            municipal_access=current_user.municipal_access,
+            database=actual_dbname,
+            access_status=access_info["status"],
+        )
 
         yield db
 
@@ -138,6 +217,38 @@ def get_user_main_db(current_user: User = Depends(get_current_user)) -> Generato
             db.close()
 
 
+async def get_user_main_async_db(current_user: User = Depends(get_current_user)) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Async counterpart of get_user_main_db for `async def` routes: yields an
+    AsyncSession on the user's provincial database (psycopg 3 async driver),
+    so slow PostGIS queries no longer block the event loop.
+    """
+    if not current_user.provincial_access:
+        raise HTTPException(
+            status_code=403,
+            detail="No provincial access assigned. Please contact administrator."
+        )
+
+    try:
+        db = await get_user_async_session(current_user.provincial_access)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    except Exception as e:
+        print(f"❌ Database connection error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Database connection error: {str(e)}"
+        )
+
+    actual_dbname = session_database_name(db)
+    setattr(current_user, "actual_dbname", actual_dbname)
+    annotate(user=current_user.user_name, database=actual_dbname)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+
 def get_user_or_admin_db(
     current_user_or_admin=Depends(get_current_user_or_admin)
 ) -> Generator[Session, None, None]:
@@ -151,11 +262,10 @@ def get_user_or_admin_db(
     db = None
     try:
         db = get_user_database_session(provincial_access)
-        result = db.execute(text("SELECT current_database()"))
-        current_db = result.scalar()
+        current_db = get_engine_database_name(db.get_bind())
         username = getattr(current_user_or_admin, "user_name", "Unknown")
 
-        print(f"✅ {username} connected to database: {current_db}")
+        annotate(user=username, database=current_db)
         yield db
 
     except Exception as e:
@@ -0,0 +1,345 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import asyncio
+import os
+import re
+import threading
+import time
+
+from search_index import ROAD_TABLES
+
+# Indexes older than this are rebuilt in the background (picks up outside edits)
+AUTOCOMPLETE_TTL_SECONDS = int(os.getenv("AUTOCOMPLETE_TTL_SECONDS", 900))
+# Least recently used (database, schema, kind) indexes beyond this are dropped
+AUTOCOMPLETE_MAX_INDEXES = int(os.getenv("AUTOCOMPLETE_MAX_INDEXES", 200))
+
+FUZZY_MIN_LENGTH = 3
+FUZZY_MIN_RATIO = 0.6
+FUZZY_MAX_CANDIDATES = 500
+
+def _column_value(column: str):
+    return lambda row: None if row.get(column) is None else str(row[column])
+
+
+def _owner_value(row: Dict) -> Optional[str]:
+    # Same as the SQL: concat_ws(', ', NULLIF(trim(last), ''), NULLIF(trim(first), ''))
+    parts = [str(row[c]).strip(" ") for c in ("l_lastname", "l_frstname") if row.get(c) is not None]
+    return ", ".join(p for p in parts if p)
+
+
+# kind → candidate tables (first existing wins), required columns, value
+# expression, and the same value computed from a row dict (in-place updates)
+AUTOCOMPLETE_KINDS: Dict[str, Dict] = {
+    "pin": {
+        "tables": ("JoinedTable",),
+        "columns": ("pin",),
+        "expr": '"pin"::text',
+        "value": _column_value("pin"),
+    },
+    "owner": {
+        "tables": ("JoinedTable",),
+        "columns": ("l_lastname", "l_frstname"),
+        "expr": "concat_ws(', ', NULLIF(trim(\"l_lastname\"::text), ''), NULLIF(trim(\"l_frstname\"::text), ''))",
+        "value": _owner_value,
+    },
+    "road": {
+        "tables": ROAD_TABLES,
+        "columns": ("road_name",),
+        "expr": '"road_name"::text',
+        "value": _column_value("road_name"),
+    },
+    "landmark": {
+        "tables": ("Landmarks",),
+        "columns": ("name",),
+        "expr": '"name"::text',
+        "value": _column_value("name"),
+    },
+}
+KIND_PATTERN = "^(" + "|".join(AUTOCOMPLETE_KINDS) + ")$"
+
+_SPACE_RE = re.compile(r"\s+")
+_WORD_SPLIT_RE = re.compile(r"[^\w]+")
+
+
+def normalize(value: str) -> str:
+    return _SPACE_RE.sub(" ", str(value)).strip().lower()
+
+
+def inner_words(key: str) -> List[str]:
+    """Words of a normalized value after the first one."""
+    return [w for w in _WORD_SPLIT_RE.split(key) if w][1:]
+
+
+def _position(keys: List[str], refs: List[str], key: str, ref: str) -> int:
+    """Insertion point of (key, ref) in parallel arrays sorted by (key, ref)."""
+    i = bisect_left(keys, key)
+    while i < len(keys) and keys[i] == key and refs[i] < ref:
+        i += 1
+    return i
+
+
+# ==========================================================
+# 🔤 Prefix index (sorted arrays + bisect)
+# ==========================================================
+class PrefixIndex:
+    """
+    Distinct values of one field as a sorted key array (prefix lookups are a
+    bisect plus a short scan) and a sorted array of inner words, so
+    "cruz" also finds "dela cruz, juan". adjust() keeps both arrays and the
+    counts current after a write without rereading the table.
+    """
+
+    def __init__(self, counts: Dict[str, int], table: str):
+        self.table = table
+        self.built_at = time.monotonic()
+        entries = sorted((normalize(v), v) for v in counts if normalize(v))
+        self.keys: List[str] = [k for k, _ in entries]
+        self.values: List[str] = [v for _, v in entries]
+        self.counts: Dict[str, int] = {v: counts[v] for _, v in entries}
+
+        words = sorted((word, v) for k, v in entries for word in inner_words(k))
+        self.word_keys: List[str] = [w for w, _ in words]
+        self.word_refs: List[str] = [v for _, v in words]
+
+    def adjust(self, value: Optional[str], delta: int):
+        """Add (delta > 0) or drop (delta < 0) occurrences of a value in place."""
+        if value is None or delta == 0:
+            return
+        key = normalize(value)
+        if not key:
+            return
+        old = self.counts.get(value, 0)
+        new = old + delta
+        if new > 0:
+            self.counts[value] = new
+            if old == 0:
+                i = _position(self.keys, self.values, key, value)
+                self.keys.insert(i, key)
+                self.values.insert(i, value)
+                for word in inner_words(key):
+                    j = _position(self.word_keys, self.word_refs, word, value)
+                    self.word_keys.insert(j, word)
+                    self.word_refs.insert(j, value)
+        elif old:
+            del self.counts[value]
+            i = _position(self.keys, self.values, key, value)
+            if i < len(self.keys) and self.values[i] == value:
+                del self.keys[i]
+                del self.values[i]
+            for word in inner_words(key):
+                j = _position(self.word_keys, self.word_refs, word, value)
+                if j < len(self.word_keys) and self.word_refs[j] == value:
+                    del self.word_keys[j]
+                    del self.word_refs[j]
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def age_seconds(self) -> float:
+        return time.monotonic() - self.built_at
+
+    def _prefix_range(self, keys: List[str], prefix: str, limit: int) -> Iterable[int]:
+        i = bisect_left(keys, prefix)
+        end = len(keys)
+        while i < end and limit > 0 and keys[i].startswith(prefix):
+            yield i
+            i += 1
+            limit -= 1
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[Dict]:
+        q = normalize(query)
+        if not q:
+            return []
+        seen: Set[str] = set()
+        results: List[Dict] = []
+
+        def add(value: str, match: str, score: float):
+            if value not in seen and len(results) < limit:
+                seen.add(value)
+                results.append({
+                    "value": value,
+                    "count": self.counts[value],
+                    "match": match,
+                    "score": round(score, 3),
+                })
+
+        # 1. Values starting with the query
+        for i in self._prefix_range(self.keys, q, limit):
+            add(self.values[i], "prefix", 1.0)
+
+        # 2. Values with an inner word starting with the query
+        if len(results) < limit:
+            for j in self._prefix_range(self.word_keys, q, FUZZY_MAX_CANDIDATES):
+                add(self.word_refs[j], "word", 0.9)
+
+        # 3. Typo tolerance: shorter prefixes, ranked by similarity
+        if fuzzy and len(results) < limit and len(q) >= FUZZY_MIN_LENGTH:
+            candidates: Dict[str, float] = {}
+            for cut in (1, 2):
+                stem = q[:-cut]
+                if len(stem) < FUZZY_MIN_LENGTH - 1:
+                    break
+                for i in self._prefix_range(self.keys, stem, FUZZY_MAX_CANDIDATES):
+                    value = self.values[i]
+                    if value not in seen and value not in candidates:
+                        candidates[value] = SequenceMatcher(None, q, self.keys[i][:len(q) + 1]).ratio()
+                for j in self._prefix_range(self.word_keys, stem, FUZZY_MAX_CANDIDATES):
+                    value = self.word_refs[j]
+                    if value not in seen and value not in candidates:
+                        word = self.word_keys[j]
+                        candidates[value] = SequenceMatcher(None, q, word[:len(q) + 1]).ratio() * 0.95
+            ranked = sorted(
+                ((score, value) for value, score in candidates.items() if score >= FUZZY_MIN_RATIO),
+                key=lambda item: (-item[0], normalize(item[1])),
+            )
+            for score, value in ranked:
+                add(value, "fuzzy", score)
+        return results
+
+
+# ==========================================================
+# 🗃️ Index registry
+# ==========================================================
+IndexKey = Tuple[str, str, str]  # (database, schema, kind)
+
+
+class AutocompleteIndex:
+    """
+    Per (database, schema, kind) prefix indexes. Write routes call apply()
+    after committing with the rows they removed and added, which updates the
+    affected indexes in place. Bulk writes (sync pull) call invalidate(); those
+    indexes are rebuilt in the background on their next lookup while the
+    previous one keeps serving.
+    """
+
+    def __init__(self):
+        self._indexes: "OrderedDict[IndexKey, PrefixIndex]" = OrderedDict()
+        # key → when it was invalidated (a build started earlier does not clear it)
+        self._stale: Dict[IndexKey, float] = {}
+        self._building: Dict[IndexKey, asyncio.Task] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def value_sql(schema: str, table: str, kind: str) -> str:
+        expr = AUTOCOMPLETE_KINDS[kind]["expr"]
+        return f"""
+            SELECT v, count(*) AS n
+            FROM (SELECT {expr} AS v FROM "{schema}"."{table}") s
+            WHERE v IS NOT NULL AND v <> ''
+            GROUP BY v
+        """
+
+    async def _build(self, engine: AsyncEngine, key: IndexKey, table: str) -> PrefixIndex:
+        _, schema, kind = key
+        started = time.monotonic()
+        async with engine.connect() as conn:
+            rows = (await conn.execute(text(self.value_sql(schema, table, kind)))).fetchall()
+        counts = {row[0]: row[1] for row in rows}
+        index = await run_in_threadpool(PrefixIndex, counts, table)
+        with self._lock:
+            self._indexes[key] = index
+            self._indexes.move_to_end(key)
+            if self._stale.get(key, started) < started:
+                del self._stale[key]
+            while len(self._indexes) > AUTOCOMPLETE_MAX_INDEXES:
+                evicted, _ = self._indexes.popitem(last=False)
+                self._stale.pop(evicted, None)
+        print(f"🔤 Built autocomplete index {'/'.join(key)} from {table}: {len(index)} values")
+        return index
+
+    def _start_build(self, engine: AsyncEngine, key: IndexKey, table: str) -> asyncio.Task:
+        task = self._building.get(key)
+        if task is None or task.done():
+            task = asyncio.create_task(self._build(engine, key, table))
+            task.add_done_callback(lambda t, k=key: self._build_done(k, t))
+            self._building[key] = task
+        return task
+
+    def _build_done(self, key: IndexKey, task: asyncio.Task):
+        if self._building.get(key) is task:
+            del self._building[key]
+        if not task.cancelled() and task.exception() is not None:
+            print(f"⚠️ Autocomplete index {'/'.join(key)} build failed: {task.exception()}")
+
+    async def get(self, engine: AsyncEngine, database: str, schema: str, kind: str,
+                  table: str) -> PrefixIndex:
+        """Index for a field; built on first use, refreshed in the background when stale."""
+        key = (database, schema, kind)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+        if index is None or index.table != table:
+            # Shielded: one cancelled caller (client gone) must not cancel the shared build
+            return await asyncio.shield(self._start_build(engine, key, table))
+        if key in self._stale or index.age_seconds > AUTOCOMPLETE_TTL_SECONDS:
+            self._start_build(engine, key, table)
+        return index
+
+    def _keys_for(self, database: Optional[str], schema: str, table: str) -> List[IndexKey]:
+        """Indexes fed by a table (all databases when database is None); lock held."""
+        kinds = {kind for kind, cfg in AUTOCOMPLETE_KINDS.items() if table in cfg["tables"]}
+        return [
+            k for k, index in self._indexes.items()
+            if k[1] == schema and k[2] in kinds and index.table == table
+            and (database is None or k[0] == database)
+        ]
+
+    def apply(self, database: Optional[str], schema: str, table: str,
+              removed: Iterable[Dict] = (), added: Iterable[Dict] = ()) -> int:
+        """
+        Update the indexes fed by a table from the rows a write removed and
+        added (column → value dicts, e.g. a JoinedTable row before and after
+        an edit). An index whose rebuild is in flight is also marked stale, as
+        the rebuild may have read the table before the write.
+        """
+        removed, added = list(removed), list(added)
+        with self._lock:
+            keys = self._keys_for(database, schema, table)
+            now = time.monotonic()
+            for k in keys:
+                index = self._indexes[k]
+                value_of = AUTOCOMPLETE_KINDS[k[2]]["value"]
+                for row in removed:
+                    index.adjust(value_of(row), -1)
+                for row in added:
+                    index.adjust(value_of(row), 1)
+                if k in self._building:
+                    self._stale[k] = now
+        return len(keys)
+
+    def invalidate(self, database: Optional[str], schema: str, table: str) -> int:
+        """Mark the indexes fed by a table stale, for a full rebuild after bulk writes."""
+        with self._lock:
+            keys = self._keys_for(database, schema, table)
+            now = time.monotonic()
+            for k in keys:
+                self._stale[k] = now
+        return len(keys)
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            items = list(self._indexes.items())
+            stale = set(self._stale)
+        return [
+            {
+                "database": k[0],
+                "schema": k[1],
+                "kind": k[2],
+                "table": index.table,
+                "values": len(index),
+                "age_seconds": round(index.age_seconds, 1),
+                "stale": k in stale,
+            }
+            for k, index in items
+        ]
+
+
+# Shared process-wide autocomplete indexes
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,454 @@
+"""
+Import-time and cold-start benchmark for the FastAPI backend.
+
+Every measurement runs in a fresh interpreter so module caches never leak
+between samples:
+
+  * import time / RSS added by each router module (on top of fastapi +
+    sqlalchemy, which every router pays for anyway)
+  * `main:app` cold start, eager and with LAZY_STARTUP=1
+  * time to first response for /health and /api/list-schemas
+
+/api/list-schemas is served with the auth dependencies overridden: the user
+is a fixed fake and the provincial session is either a fake returning canned
+schema names or, with --database-url, a real session on a local Postgres.
+The lifespan (auth DB probe) is not run, so no network access is needed.
+
+Run from the backend directory:
+
+    python benchmarks/cold_start.py --repeat 5 --output cold_start.json
+    python benchmarks/cold_start.py --compare cold_start.json
+
+Results are JSON. With --compare, metrics that got slower/heavier than the
+previous run by more than --tolerance are listed and the exit code is 1.
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULT_MARKER = "BENCH_RESULT "
+
+# Shared by every router; imported before timing a module
+BASELINE_MODULES = ("fastapi", "sqlalchemy", "sqlalchemy.orm")
+
+ROUTER_MODULES = (
+    "auth.routes",
+    "admin.routes",
+    "routes.geomdisplay",
+    "routes.tiles",
+    "routes.schemas",
+    "routes.parcelinfo",
+    "routes.edit",
+    "routes.orthophoto",
+    "routes.consolidate",
+    "routes.subdivide",
+    "routes.thematic",
+    "routes.tableinfo",
+    "routes.landmarks",
+    "routes.search",
+    "routes.province",
+    "routes.municipal",
+    "routes.sync",
+    "routes.grid",
+    "Predictive_Model_Tools.linear_regression",
+    "Predictive_Model_Tools.GWR.routes",
+    "Predictive_Model_Tools.XGBoost.routes",
+    "Predictive_Model_Tools.Spatial_Lag_Model.routes",
+)
+
+DEPENDENCY_PACKAGES = (
+    "fastapi", "starlette", "sqlalchemy", "psycopg", "psycopg2-binary", "pydantic",
+    "numpy", "pandas", "geopandas", "scikit-learn", "xgboost", "mgwr", "matplotlib",
+)
+
+FAKE_SCHEMAS = ["PH0403406_Calauan", "PH0403419_Pagsanjan", "PH0403424_Santa Cruz"]
+
+
+# ==========================================================
+# 📏 Measurements (run inside the child interpreter)
+# ==========================================================
+def rss_mb() -> float:
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def timed_import(module_name: str) -> dict:
+    modules_before = len(sys.modules)
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    importlib.import_module(module_name)
+    seconds = time.perf_counter() - start
+    rss_after = rss_mb()
+    return {
+        "import_seconds": seconds,
+        "rss_mb": rss_after,
+        "rss_delta_mb": rss_after - rss_before,
+        "modules_loaded": len(sys.modules) - modules_before,
+    }
+
+
+def measure_module(module_name: str) -> dict:
+    baseline_start = time.perf_counter()
+    for name in BASELINE_MODULES:
+        importlib.import_module(name)
+    result = {"baseline_seconds": time.perf_counter() - baseline_start}
+    result.update(timed_import(module_name))
+    return result
+
+
+async def asgi_request(app, path: str, headers=()) -> tuple:
+    """Send a single GET through the ASGI app; returns (status, body bytes)."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")] + list(headers),
+        "client": ("127.0.0.1", 50000),
+        "server": ("benchmark", 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+    response = {"status": None, "body": b""}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            response["body"] += message.get("body", b"")
+            if not message.get("more_body", False):
+                disconnected.set()
+
+    await app(scope, receive, send)
+    return response["status"], response["body"]
+
+
+def override_auth(app, database_url: str = None):
+    """Serve authenticated routes with a fake user and a fake or local-Postgres session."""
+    from auth.dependencies import get_current_user, get_user_main_db
+    from auth.models import User
+
+    user = User(
+        id=0,
+        user_name="benchmark",
+        provincial_access="PH04034",
+        municipal_access="PH0403419",
+    )
+
+    if database_url:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        SessionLocal = sessionmaker(bind=create_engine(database_url, pool_pre_ping=True))
+
+        def session_dependency():
+            db = SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+    else:
+        from sqlalchemy.engine import make_url
+
+        class FakeResult:
+            def __init__(self, rows):
+                self.rows = rows
+
+            def __iter__(self):
+                return iter(self.rows)
+
+            def fetchall(self):
+                return list(self.rows)
+
+            def scalar(self):
+                return self.rows[0][0] if self.rows else None
+
+        class FakeBind:
+            url = make_url("postgresql://benchmark@localhost:5432/PH04034_Laguna")
+
+        class FakeSession:
+            def get_bind(self):
+                return FakeBind()
+
+            def execute(self, statement, params=None):
+                if "current_database" in str(statement):
+                    return FakeResult([("PH04034_Laguna",)])
+                return FakeResult([(name,) for name in FAKE_SCHEMAS])
+
+            def close(self):
+                pass
+
+        def session_dependency():
+            yield FakeSession()
+
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_user_main_db] = session_dependency
+
+
+async def first_responses(app, paths, warm_requests: int) -> dict:
+    results = {}
+    for path in paths:
+        start = time.perf_counter()
+        status, body = await asgi_request(app, path, [(b"authorization", b"Bearer benchmark")])
+        first = time.perf_counter() - start
+
+        warm = []
+        for _ in range(warm_requests):
+            start = time.perf_counter()
+            await asgi_request(app, path, [(b"authorization", b"Bearer benchmark")])
+            warm.append(time.perf_counter() - start)
+
+        results[path] = {
+            "status": status,
+            "bytes": len(body),
+            "first_response_seconds": first,
+            "warm_response_seconds": statistics.median(warm) if warm else None,
+        }
+    return results
+
+
+def measure_app(database_url: str = None, warm_requests: int = 5) -> dict:
+    process_start = time.perf_counter()
+    for name in BASELINE_MODULES:
+        importlib.import_module(name)
+    result = {"baseline_seconds": time.perf_counter() - process_start}
+    result.update(timed_import("main"))
+
+    import main
+    result["lazy_startup"] = main.LAZY_STARTUP
+    result["routes"] = len(main.app.router.routes)
+
+    override_auth(main.app, database_url)
+    responses = asyncio.run(first_responses(main.app, ["/health", "/api/list-schemas"], warm_requests))
+    result["responses"] = responses
+    result["ready_seconds"] = time.perf_counter() - process_start
+    result["rss_after_requests_mb"] = rss_mb()
+    return result
+
+
+def run_child(args) -> int:
+    # Route prints share stdout; the result is the last marked line
+    try:
+        if args.child_module:
+            result = measure_module(args.child_module)
+        else:
+            result = measure_app(args.database_url, args.warm_requests)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    sys.stdout.write(RESULT_MARKER + json.dumps(result) + "\n")
+    sys.stdout.flush()
+    return 0
+
+
+# ==========================================================
+# 🧪 Orchestration (parent process)
+# ==========================================================
+def spawn(child_args, env_overrides=None) -> dict:
+    env = dict(os.environ)
+    env.update(env_overrides or {})
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), *child_args],
+        cwd=BACKEND_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+    )
+    for line in reversed(proc.stdout.splitlines()):
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    tail = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+    return {"error": f"child exited with {proc.returncode}", "stderr": tail}
+
+
+def summarize(samples) -> dict:
+    """Median of every numeric field across samples (min/max for timings)."""
+    ok = [s for s in samples if "error" not in s]
+    if not ok:
+        return samples[0]
+    summary = {"samples": len(ok)}
+    for key, value in ok[0].items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            summary[key] = value
+            continue
+        values = [s[key] for s in ok if isinstance(s.get(key), (int, float))]
+        summary[key] = round(statistics.median(values), 6)
+        if key.endswith("_seconds"):
+            summary[key + "_min"] = round(min(values), 6)
+            summary[key + "_max"] = round(max(values), 6)
+    if "responses" in ok[0]:
+        summary["responses"] = {
+            path: summarize([s["responses"][path] for s in ok])
+            for path in ok[0]["responses"]
+        }
+        for entry in summary["responses"].values():
+            entry.pop("samples", None)
+    return summary
+
+
+def package_versions() -> dict:
+    from importlib import metadata
+
+    versions = {}
+    for name in DEPENDENCY_PACKAGES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = None
+    return versions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def run_benchmark(args) -> dict:
+    modules = args.modules or list(ROUTER_MODULES)
+    child_common = ["--warm-requests", str(args.warm_requests)]
+    if args.database_url:
+        child_common += ["--database-url", args.database_url]
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "database": "postgres" if args.database_url else "fake",
+        "packages": package_versions(),
+        "modules": {},
+        "app": {},
+    }
+
+    if not args.skip_modules:
+        for module_name in modules:
+            samples = [spawn(["--child-module", module_name]) for _ in range(args.repeat)]
+            report["modules"][module_name] = summarize(samples)
+            print(f"📦 {module_name}: {report['modules'][module_name].get('import_seconds', 'error')}s",
+                  file=sys.stderr)
+
+    for label, lazy in (("eager", "0"), ("lazy", "1")):
+        samples = [spawn(["--child-app", *child_common], {"LAZY_STARTUP": lazy}) for _ in range(args.repeat)]
+        report["app"][label] = summarize(samples)
+        print(f"🚀 main:app ({label}): {report['app'][label].get('import_seconds', 'error')}s",
+              file=sys.stderr)
+
+    return report
+
+
+# ==========================================================
+# 📉 Regression check
+# ==========================================================
+def flatten(report: dict) -> dict:
+    """Comparable metrics as dotted keys, e.g. modules.routes.search.import_seconds."""
+    metrics = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, child in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, child)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if prefix.endswith(("_seconds", "rss_delta_mb", "rss_mb")):
+                metrics[prefix] = value
+
+    walk("modules", report.get("modules", {}))
+    walk("app", report.get("app", {}))
+    return metrics
+
+
+def compare(current: dict, previous: dict, tolerance: float, min_seconds: float, min_mb: float) -> list:
+    regressions = []
+    before = flatten(previous)
+    for key, value in flatten(current).items():
+        old = before.get(key)
+        if old is None:
+            continue
+        floor = min_mb if key.endswith("_mb") else min_seconds
+        if value - old > max(old * tolerance, floor):
+            regressions.append({"metric": key, "previous": old, "current": value})
+    return regressions
+
+
+# ==========================================================
+# ▶️ Entry Point
+# ==========================================================
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters per measurement")
+    parser.add_argument("--modules", nargs="*", help="router modules to measure (default: all)")
+    parser.add_argument("--skip-modules", action="store_true", help="only measure main:app")
+    parser.add_argument("--database-url", help="local Postgres for /api/list-schemas instead of the fake")
+    parser.add_argument("--warm-requests", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="previous JSON report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="ignore timing changes below this")
+    parser.add_argument("--min-mb", type=float, default=5.0, help="ignore memory changes below this")
+    parser.add_argument("--child-module", help=argparse.SUPPRESS)
+    parser.add_argument("--child-app", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_module or args.child_app:
+        sys.path.insert(0, BACKEND_DIR)
+        return run_child(args)
+
+    report = run_benchmark(args)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        report["regressions"] = compare(report, previous, args.tolerance, args.min_seconds, args.min_mb)
+        for r in report["regressions"]:
+            print(f"⚠️ {r['metric']}: {r['previous']} → {r['current']}", file=sys.stderr)
+        exit_code = 1 if report["regressions"] else 0
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Tuple
+import os
+import threading
+import time
+
+from snapshots import snapshot_store
+
+# How long a loaded catalog is trusted before it is reloaded
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", 300))
+
+# Tables that carry geom + pin but are not parcel layers (matched like ILIKE '%...%')
+EXCLUDED_PARCEL_TABLE_PATTERNS = [
+    "transaction_log",
+    "joinedtable",
+    "cama-table",
+    "runsavedmodel1",
+    "runsavedmodel2",
+]
+
+# Schemas never offered to users by /list-schemas
+EXCLUDED_SCHEMAS = (
+    'information_schema', 'pg_catalog', 'pg_toast', 'public',
+    'credentials_login', 'auth', 'storage', 'vault',
+    'graphql', 'graphql_public', 'realtime', 'extensions',
+    'pgbouncer', 'postgres', 'credentials_users_schema',
+)
+
+SCHEMAS_SQL = """
+    SELECT schema_name
+    FROM information_schema.schemata
+    WHERE schema_name NOT IN :excluded
+      AND schema_name NOT LIKE 'pg_%'
+      AND schema_name NOT LIKE '%credential%'
+    ORDER BY schema_name
+"""
+
+# One bulk read of every user table/view column in the database
+CATALOG_SQL = """
+    SELECT n.nspname AS table_schema,
+           c.relname AS table_name,
+           a.attname AS column_name,
+           t.typname AS data_type
+    FROM pg_catalog.pg_attribute a
+    JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_type t ON t.oid = a.atttypid
+    WHERE c.relkind IN ('r', 'p', 'v', 'm', 'f')
+      AND a.attnum > 0
+      AND NOT a.attisdropped
+      AND n.nspname NOT IN ('pg_catalog', 'information_schema')
+      AND n.nspname NOT LIKE 'pg\\_%'
+      AND has_table_privilege(c.oid, 'SELECT')
+    ORDER BY n.nspname, c.relname, a.attnum
+"""
+
+
+class TableCatalog:
+    """Snapshot of schema → table → ordered columns for one database."""
+
+    def __init__(self, rows, loaded_at: float):
+        self.loaded_at = loaded_at
+        self._columns: Dict[Tuple[str, str], List[str]] = {}
+        self._types: Dict[Tuple[str, str], Dict[str, str]] = {}
+        self._tables: Dict[str, List[str]] = {}
+
+        for schema, table, column, data_type in rows:
+            key = (schema, table)
+            if key not in self._columns:
+                self._columns[key] = []
+                self._types[key] = {}
+                self._tables.setdefault(schema, []).append(table)
+            self._columns[key].append(column)
+            self._types[key][column] = data_type
+
+    @property
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > CATALOG_TTL_SECONDS
+
+    def tables(self, schema: str) -> List[str]:
+        return list(self._tables.get(schema, []))
+
+    def has_table(self, schema: str, table: str) -> bool:
+        return (schema, table) in self._columns
+
+    def columns(self, schema: str, table: str) -> List[str]:
+        """Ordered column names of a table (empty if it does not exist)."""
+        return list(self._columns.get((schema, table), []))
+
+    def column_types(self, schema: str, table: str) -> Dict[str, str]:
+        """Column name → Postgres type name (e.g. 'text', 'int4', 'geometry')."""
+        return dict(self._types.get((schema, table), {}))
+
+    def parcel_tables(self, schema: str) -> List[str]:
+        """
+        Parcel-like tables (with both geom + pin columns), excluding system and
+        analysis tables such as transaction logs, JoinedTable, CAMA-Table, and
+        RunSavedModel results.
+        """
+        result = []
+        for table in self._tables.get(schema, []):
+            columns = self._columns[(schema, table)]
+            if "geom" not in columns or "pin" not in columns:
+                continue
+            if any(p in table.lower() for p in EXCLUDED_PARCEL_TABLE_PATTERNS):
+                continue
+            result.append(table)
+        return sorted(result)
+
+
+# Cache of loaded catalogs, keyed by host:port/dbname
+_catalogs: Dict[str, TableCatalog] = {}
+_catalog_lock = threading.Lock()
+
+
+def catalog_key(db: Session) -> str:
+    url = db.get_bind().url
+    return f"{url.host}:{url.port}/{url.database}"
+
+
+def get_catalog(db: Session) -> TableCatalog:
+    """
+    Return the cached catalog for the session's database, loading it in one
+    pg_catalog query when missing or older than CATALOG_TTL_SECONDS.
+    """
+    key = catalog_key(db)
+    catalog = _catalogs.get(key)
+    if catalog is not None and not catalog.is_expired:
+        return catalog
+
+    # Query outside the lock: under AsyncSession.run_sync the query awaits on
+    # the event loop, so a blocking lock held across it can deadlock the loop
+    rows = db.execute(text(CATALOG_SQL)).fetchall()
+    catalog = TableCatalog(rows, time.monotonic())
+    with _catalog_lock:
+        _catalogs[key] = catalog
+    print(f"📚 Loaded table catalog for {key}: {len(catalog._columns)} tables")
+    return catalog
+
+
+def invalidate_catalog(db: Session):
+    """Drop the cached catalog so the next lookup reloads it (call after DDL)."""
+    with _catalog_lock:
+        _catalogs.pop(catalog_key(db), None)
+        _schema_lists.pop(catalog_key(db), None)
+
+
+# ==========================================================
+# 🗂️ Schema list (municipal schemas per database)
+# ==========================================================
+class SchemaList:
+    """Sorted user schema names of one database."""
+
+    def __init__(self, names: List[str], loaded_at: float):
+        self.names: Tuple[str, ...] = tuple(sorted(names))
+        self.loaded_at = loaded_at
+
+    @property
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.loaded_at > CATALOG_TTL_SECONDS
+
+
+_schema_lists: Dict[str, SchemaList] = {}
+
+
+def get_schema_names(db: Session) -> Tuple[str, ...]:
+    """
+    Sorted non-system schema names of the session's database, cached like
+    the table catalog (CATALOG_TTL_SECONDS, dropped by invalidate_catalog).
+    """
+    key = catalog_key(db)
+    schemas = _schema_lists.get(key)
+    if schemas is not None and not schemas.is_expired:
+        return schemas.names
+
+    # Loaded outside the lock for the same reason as get_catalog
+    query = text(SCHEMAS_SQL).bindparams(bindparam("excluded", expanding=True))
+    rows = db.execute(query, {"excluded": list(EXCLUDED_SCHEMAS)}).fetchall()
+    schemas = SchemaList([row[0] for row in rows], time.monotonic())
+    with _catalog_lock:
+        _schema_lists[key] = schemas
+    print(f"🗂️ Loaded {len(schemas.names)} schemas for {key}")
+    return schemas.names
+
+
+def invalidate_cached_database(key: Optional[str] = None) -> int:
+    """
+    Drop cached catalogs, schema lists and response snapshots of one database
+    (host:port/dbname, or a bare dbname) or of all databases. Returns the
+    number of databases whose catalog or schema list was dropped.
+    """
+    with _catalog_lock:
+        keys = set(_catalogs) | set(_schema_lists)
+        if key is not None:
+            keys = {k for k in keys if k == key or k.rsplit("/", 1)[-1] == key}
+        for k in keys:
+            _catalogs.pop(k, None)
+            _schema_lists.pop(k, None)
+    snapshot_store.invalidate(key)
+    return len(keys)
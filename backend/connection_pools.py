@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from psycopg.rows import tuple_row
+from psycopg_pool import ConnectionPool
+from typing import Dict, Iterator, Optional
+import os
+import threading
+
+from metrics import instrument_connection
+
+# Per-database psycopg pool sizing (raw-SQL routes and ML tools)
+PSYCOPG_POOL_MIN_SIZE = int(os.getenv("PSYCOPG_POOL_MIN_SIZE", 1))
+PSYCOPG_POOL_MAX_SIZE = int(os.getenv("PSYCOPG_POOL_MAX_SIZE", 10))
+PSYCOPG_POOL_MAX_IDLE_SECONDS = int(os.getenv("PSYCOPG_POOL_MAX_IDLE_SECONDS", 600))
+PSYCOPG_POOL_TIMEOUT_SECONDS = int(os.getenv("PSYCOPG_POOL_TIMEOUT_SECONDS", 30))
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _reset_connection(conn):
+    """Undo per-checkout settings before a connection goes back to the pool."""
+    conn.row_factory = tuple_row
+
+
+def get_pool(host: str, port, dbname: str, user: str, password: str) -> ConnectionPool:
+    """Create or get the shared psycopg ConnectionPool of one database."""
+    key = f"{host}:{port}/{dbname}"
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(
+                    kwargs={
+                        "host": host,
+                        "port": port,
+                        "dbname": dbname,
+                        "user": user,
+                        "password": password,
+                        # No server-side prepared statements: safe behind pgbouncer
+                        "prepare_threshold": None,
+                    },
+                    min_size=PSYCOPG_POOL_MIN_SIZE,
+                    max_size=PSYCOPG_POOL_MAX_SIZE,
+                    max_idle=PSYCOPG_POOL_MAX_IDLE_SECONDS,
+                    timeout=PSYCOPG_POOL_TIMEOUT_SECONDS,
+                    configure=instrument_connection,
+                    reset=_reset_connection,
+                    name=key,
+                    open=True,
+                )
+                _pools[key] = pool
+                print(f"✅ Created connection pool for {key}")
+    return pool
+
+
+@contextmanager
+def pooled_connection(
+    host: str,
+    port,
+    dbname: str,
+    user: str,
+    password: str,
+    row_factory=None,
+) -> Iterator:
+    """
+    Borrow a connection from the database's pool for the duration of a
+    `with` block. It is committed on success, rolled back on error and
+    always returned to the pool.
+    """
+    with get_pool(host, port, dbname, user, password).connection() as conn:
+        if row_factory is not None:
+            conn.row_factory = row_factory
+        yield conn
+
+
+def pool_stats() -> Dict[str, Dict]:
+    """psycopg_pool counters (size, available, waiting, ...) per database."""
+    with _pools_lock:
+        pools = dict(_pools)
+    return {key: pool.get_stats() for key, pool in pools.items()}
+
+
+def close_pools(timeout: Optional[float] = 5.0):
+    """Close every pool (application shutdown)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close(timeout=timeout)
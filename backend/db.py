@@ -1,14 +1,18 @@
 from sqlalchemy import create_engine, text, or_
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.declarative import declarative_base
-from typing import Dict
+from typing import Dict, Optional, Tuple
 import os
+import threading
+import time
 from dotenv import load_dotenv
 import psycopg
 from psycopg.rows import dict_row
 
 # Import models for credentials lookup
 from auth.models import Credentials
+from pool_manager import pool_manager
+import connection_pools
 
 load_dotenv()
 
@@ -27,8 +31,18 @@ AUTH_DB_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/credent
 auth_engine = create_engine(AUTH_DB_URL, pool_pre_ping=True)
 AuthSessionLocal = sessionmaker(bind=auth_engine)
 
-# Cache for database engines
-_db_engines: Dict[str, any] = {}
+# Cache for database engines (owned by the pool manager)
+_db_engines: Dict[str, any] = pool_manager.engines
+
+# How long a resolved PSA code → credentials mapping is trusted
+CREDENTIALS_CACHE_TTL_SECONDS = int(os.getenv("CREDENTIALS_CACHE_TTL_SECONDS", 300))
+
+# PSA code → (detached Credentials copy, resolved_at)
+_credentials_cache: Dict[str, Tuple[Credentials, float]] = {}
+_credentials_lock = threading.Lock()
+
+# One sessionmaker per engine key (host:port/dbname)
+_session_factories: Dict[str, sessionmaker] = {}
 
 
 def get_auth_db():
@@ -42,22 +56,35 @@ def get_auth_db():
 
 def get_database_engine_from_credentials(creds: Credentials):
     """Create or get cached engine for given credentials row"""
-    key = f"{creds.host}:{creds.port}/{creds.dbname}"
-    if key not in _db_engines:
-        db_url = f"postgresql://{creds.user}:{creds.password}@{creds.host}:{creds.port}/{creds.dbname}"
-        _db_engines[key] = create_engine(db_url, pool_pre_ping=True)
-        print(f"✅ Created engine for {key}")
-    return _db_engines[key]
+    return pool_manager.get_engine(creds.host, creds.port, creds.dbname, creds.user, creds.password)
 
 
-def get_user_database_session(provincial_access: str) -> Session:
+def get_session_factory(engine) -> sessionmaker:
+    """Return the cached sessionmaker bound to an engine."""
+    url = engine.url
+    key = f"{url.host}:{url.port}/{url.database}"
+    factory = _session_factories.get(key)
+    # Rebuild when the pool manager has replaced an evicted engine
+    if factory is None or factory.kw.get("bind") is not engine:
+        factory = sessionmaker(bind=engine)
+        _session_factories[key] = factory
+    return factory
+
+
+def get_engine_database_name(engine) -> str:
+    """Actual database name of an engine (e.g. 'PH04034_Laguna'), no round trip."""
+    return engine.url.database or "unknown"
+
+
+def resolve_credentials(provincial_access: str) -> Credentials:
     """
-    Get database session based on user's provincial access.
-    provincial_access will be a PSA code only (e.g. "PH04034"),
-    but the actual DB is named like "PH04034_Laguna".
+    Resolve a PSA code (e.g. "PH04034") to the credentials of its database
+    (e.g. "PH04034_Laguna"). Results are cached for CREDENTIALS_CACHE_TTL_SECONDS
+    as detached copies, so most requests skip the auth DB entirely.
     """
-    if not provincial_access:
-        raise ValueError("User has no provincial access assigned")
+    cached = _credentials_cache.get(provincial_access)
+    if cached is not None and time.monotonic() - cached[1] <= CREDENTIALS_CACHE_TTL_SECONDS:
+        return cached[0]
 
     auth_db = AuthSessionLocal()
     try:
@@ -71,15 +98,49 @@ def get_user_database_session(provincial_access: str) -> Session:
                 f"No credentials found for provincial_access (PSA code): {provincial_access}"
             )
 
-        # Step 2: Create/get engine for that DB
-        engine = get_database_engine_from_credentials(creds)
-
-        # Step 3: Return SQLAlchemy session
-        SessionLocal = sessionmaker(bind=engine)
-        return SessionLocal()
+        detached = Credentials(
+            id=creds.id,
+            host=creds.host,
+            port=creds.port,
+            dbname=creds.dbname,
+            user=creds.user,
+            password=creds.password
+        )
     finally:
         auth_db.close()
 
+    with _credentials_lock:
+        _credentials_cache[provincial_access] = (detached, time.monotonic())
+    return detached
+
+
+def invalidate_credentials_cache(provincial_access: Optional[str] = None) -> int:
+    """Forget resolved credentials (one PSA code, or all). Returns the number dropped."""
+    with _credentials_lock:
+        if provincial_access is None:
+            removed = len(_credentials_cache)
+            _credentials_cache.clear()
+        else:
+            removed = 1 if _credentials_cache.pop(provincial_access, None) else 0
+    return removed
+
+
+def get_user_database_engine(provincial_access: str):
+    """Engine of the provincial database for a PSA code (cached credentials)."""
+    if not provincial_access:
+        raise ValueError("User has no provincial access assigned")
+    return get_database_engine_from_credentials(resolve_credentials(provincial_access))
+
+
+def get_user_database_session(provincial_access: str) -> Session:
+    """
+    Get database session based on user's provincial access.
+    provincial_access will be a PSA code only (e.g. "PH04034"),
+    but the actual DB is named like "PH04034_Laguna".
+    """
+    engine = get_user_database_engine(provincial_access)
+    return get_session_factory(engine)()
+
 
 # Legacy functions (kept for backward compatibility but should be phased out)
 def get_main_db_connection():
@@ -93,8 +154,7 @@ def get_main_db_connection():
         password=DB_PASSWORD
     )
     engine = get_database_engine_from_credentials(creds)
-    SessionLocal = sessionmaker(bind=engine)
-    db = SessionLocal()
+    db = get_session_factory(engine)()
     try:
         yield db
     finally:
@@ -119,10 +179,22 @@ def get_engine():
     return get_main_engine()
 
 
+def pooled_connection(database_name: str = 'postgres'):
+    """
+    Borrow a pooled psycopg connection (dict_row factory) to the main server:
+        with pooled_connection() as conn: ...
+    Returned to the pool when the block exits.
+    """
+    return connection_pools.pooled_connection(
+        DB_HOST, DB_PORT, database_name, DB_USER, DB_PASSWORD, row_factory=dict_row
+    )
+
+
 def get_connection(database_name: str = 'postgres'):
     """
     Legacy connection method - returns psycopg connection with dict_row factory
     This ensures compatibility with consolidate.py
+    Prefer pooled_connection(): this opens a new connection the caller must close.
     """
     return psycopg.connect(
         dbname=database_name,
@@ -134,28 +206,32 @@ def get_connection(database_name: str = 'postgres'):
     )
 
 
-# Test auth database connection on startup
-try:
-    with auth_engine.connect() as conn:
-        result = conn.execute(text("SELECT current_database()"))
-        current_db = result.scalar()
-        print(f"✅ Auth database connection successful to: {current_db}")
-        
-        # Verify tables exist
-        result = conn.execute(text("""
-            SELECT table_schema, table_name 
-            FROM information_schema.tables 
-            WHERE table_name IN ('users_table', 'admin_login', 'credentials')
-            AND table_schema = 'credentials_users_schema'
-            ORDER BY table_name;
-        """))
-        tables = result.fetchall()
-        if tables:
-            print("✅ Found authentication tables:")
-            for schema, table in tables:
-                print(f"  - {schema}.{table}")
-        else:
-            print("⚠️ Warning: Authentication tables not found in credentials_users_schema")
-            
-except Exception as e:
-    print(f"⚠️ Failed to connect to auth database: {e}")
+def verify_auth_database():
+    """
+    Check the auth database connection and its tables. Run in the background
+    at startup (see main.py lifespan) so it never blocks imports or boot.
+    """
+    try:
+        with auth_engine.connect() as conn:
+            result = conn.execute(text("SELECT current_database()"))
+            current_db = result.scalar()
+            print(f"✅ Auth database connection successful to: {current_db}")
+
+            # Verify tables exist
+            result = conn.execute(text("""
+                SELECT table_schema, table_name 
+                FROM information_schema.tables 
+                WHERE table_name IN ('users_table', 'admin_login', 'credentials')
+                AND table_schema = 'credentials_users_schema'
+                ORDER BY table_name;
+            """))
+            tables = result.fetchall()
+            if tables:
+                print("✅ Found authentication tables:")
+                for schema, table in tables:
+                    print(f"  - {schema}.{table}")
+            else:
+                print("⚠️ Warning: Authentication tables not found in credentials_users_schema")
+
+    except Exception as e:
+        print(f"⚠️ Failed to connect to auth database: {e}")
@@ -0,0 +1,424 @@
+from fastapi import HTTPException, Query
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import contextvars
+import json
+import math
+import os
+import queue
+import threading
+
+from pool_manager import pool_manager
+
+# Rows pulled from the server-side cursor per round trip
+STREAM_BATCH_SIZE = int(os.getenv("GEOJSON_STREAM_BATCH_SIZE", 2000))
+
+FEATURE_COLLECTION_HEAD = b'{"type":"FeatureCollection","features":['
+FEATURE_COLLECTION_TAIL = b"]}"
+
+# (sql, params, build_properties) — the SQL must select the geometry as
+# GeoJSON *text* in a column named "geometry". An optional fourth element maps
+# (source_schema, source_table) → FeatureQuery, run one by one if the
+# combined query fails (sources already streamed are not repeated).
+FeatureQuery = Tuple[str, Optional[Dict], Callable[[Dict], Dict]]
+
+
+def encode_feature(geometry: str, properties: Dict) -> str:
+    """Encode one Feature, splicing in the PostGIS GeoJSON text as-is."""
+    return (
+        '{"type":"Feature","geometry":' + geometry
+        + ',"properties":' + json.dumps(properties, default=str) + "}"
+    )
+
+
+def iter_feature_chunks(
+    engine: Engine,
+    queries: Iterable[FeatureQuery],
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[str]:
+    """
+    Run queries on one connection and yield comma-joined Feature strings,
+    one chunk per fetchmany batch.
+
+    Each query runs on a server-side (named) cursor, so memory stays flat
+    regardless of table size. A failing query is logged and skipped, like
+    the per-table loop it replaces; a combined query with per-source
+    fallbacks is retried source by source so only the broken one is lost.
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=batch_size)
+        pending = list(queries)
+
+        while pending:
+            sql, params, build_properties, *rest = pending.pop(0)
+            fallback = rest[0] if rest else None
+            seen = set()
+            try:
+                result = conn.execute(text(sql), params or {}).mappings()
+                while True:
+                    rows = result.fetchmany(batch_size)
+                    if not rows:
+                        break
+
+                    chunk = []
+                    for row in rows:
+                        if fallback:
+                            seen.add((row.get("source_schema"), row.get("source_table")))
+                        geometry = row["geometry"]
+                        if not geometry:
+                            continue
+                        chunk.append(encode_feature(geometry, build_properties(row)))
+
+                    if chunk:
+                        yield ",".join(chunk)
+            except Exception as e:
+                conn.rollback()
+                print(f"⚠️ Streaming query failed: {e}")
+                if fallback:
+                    retry = [q for source, q in fallback.items() if source not in seen]
+                    print(f"↩️ Retrying {len(retry)} source(s) one by one")
+                    pending[:0] = retry
+                continue
+
+
+def stream_feature_collection(
+    engine: Engine,
+    queries: Iterable[FeatureQuery],
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Yield a GeoJSON FeatureCollection chunk by chunk, so the first features
+    go out before the last rows are read.
+
+    The generator owns its connection: request-scoped sessions are already
+    closed by the time a StreamingResponse body is iterated.
+    """
+    yield FEATURE_COLLECTION_HEAD
+    first = True
+    for body in iter_feature_chunks(engine, queries, batch_size):
+        yield (body if first else "," + body).encode("utf-8")
+        first = False
+    yield FEATURE_COLLECTION_TAIL
+
+
+# ==========================================================
+# 🧵 Concurrent per-schema loading
+# ==========================================================
+# Workers one request may use, and connections all parallel loads may hold per
+# database (0 = the engine's pool_size + max_overflow - 1, leaving one
+# connection for other requests)
+PARALLEL_SCHEMA_WORKERS = int(os.getenv("PARALLEL_SCHEMA_WORKERS", 4))
+PARALLEL_DB_SLOTS = int(os.getenv("PARALLEL_DB_SLOTS", 0))
+
+_parallel_db_slots: Dict[str, threading.BoundedSemaphore] = {}
+_parallel_slots_lock = threading.Lock()
+_WORKER_DONE = object()
+
+
+def parallel_db_slots(engine: Engine) -> threading.BoundedSemaphore:
+    """Semaphore capping parallel-load connections of one engine below its pool capacity."""
+    key = str(engine.url)
+    slots = _parallel_db_slots.get(key)
+    if slots is None:
+        with _parallel_slots_lock:
+            slots = _parallel_db_slots.get(key)
+            if slots is None:
+                limit = PARALLEL_DB_SLOTS
+                if limit <= 0:
+                    settings = pool_manager.settings(pool_manager.engine_key(engine))
+                    limit = settings["pool_size"] + max(settings["max_overflow"], 0) - 1 if settings else 1
+                slots = threading.BoundedSemaphore(max(1, limit))
+                _parallel_db_slots[key] = slots
+    return slots
+
+
+def submit_in_context(pool: ThreadPoolExecutor, fn, *args):
+    """Submit with a copy of the caller's contextvars, so queries count toward the request."""
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def stream_feature_collection_parallel(
+    engine: Engine,
+    query_groups: List[List[FeatureQuery]],
+    max_workers: int = PARALLEL_SCHEMA_WORKERS,
+    batch_size: int = STREAM_BATCH_SIZE,
+) -> Iterator[bytes]:
+    """
+    Like stream_feature_collection, but each query group (e.g. one schema)
+    runs on its own pooled connection in a bounded thread pool. Chunks are
+    written in completion order through a bounded queue, so total time tracks
+    the slowest group and memory stays flat. parallel_db_slots caps the
+    connections held by parallel loads across all requests.
+    """
+    groups = [g for g in query_groups if g]
+    chunks: "queue.Queue" = queue.Queue(maxsize=max(1, max_workers) * 4)
+    cancelled = threading.Event()
+
+    def put(item) -> bool:
+        while not cancelled.is_set():
+            try:
+                chunks.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def worker(queries: List[FeatureQuery]):
+        try:
+            with parallel_db_slots(engine):
+                for body in iter_feature_chunks(engine, queries, batch_size):
+                    if not put(body):
+                        return
+        except Exception as e:
+            print(f"⚠️ Parallel load worker failed: {e}")
+        finally:
+            put(_WORKER_DONE)
+
+    yield FEATURE_COLLECTION_HEAD
+    if groups:
+        pool = ThreadPoolExecutor(max_workers=min(max_workers, len(groups)))
+        try:
+            for group in groups:
+                submit_in_context(pool, worker, group)
+
+            first = True
+            remaining = len(groups)
+            while remaining:
+                item = chunks.get()
+                if item is _WORKER_DONE:
+                    remaining -= 1
+                    continue
+                yield (item if first else "," + item).encode("utf-8")
+                first = False
+        finally:
+            # Client went away (or we are done): release blocked workers
+            cancelled.set()
+            pool.shutdown(wait=False, cancel_futures=True)
+    yield FEATURE_COLLECTION_TAIL
+
+
+def parallel_scalars(
+    engine: Engine,
+    statements: List[Tuple[str, Optional[Dict]]],
+    max_workers: int = PARALLEL_SCHEMA_WORKERS,
+) -> List:
+    """
+    Run single-value statements concurrently, each on its own pooled
+    connection. A statement may carry a third element: (sql, params) parts
+    run one by one instead if it fails, skipping only the failing parts.
+    """
+
+    def run(statement):
+        sql, params, *rest = statement
+        with parallel_db_slots(engine), engine.connect() as conn:
+            try:
+                return [conn.execute(text(sql), params or {}).scalar()]
+            except Exception as e:
+                if not rest or not rest[0]:
+                    raise
+                conn.rollback()
+                print(f"⚠️ Parallel query failed, retrying {len(rest[0])} part(s) one by one: {e}")
+                return scalars_one_by_one(conn, rest[0])
+
+    results = []
+    if not statements:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(statements))) as pool:
+        futures = [submit_in_context(pool, run, st) for st in statements]
+        for future in as_completed(futures):
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"⚠️ Parallel query failed: {e}")
+    return results
+
+
+def scalars_one_by_one(conn, statements: List[Tuple[str, Optional[Dict]]]) -> List:
+    """Run single-value statements on one connection/session, skipping the ones that fail."""
+    results = []
+    for sql, params in statements:
+        try:
+            results.append(conn.execute(text(sql), params or {}).scalar())
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ Query failed, skipped: {e}")
+    return results
+
+
+# ==========================================================
+# ✂️ Spatial filter + zoom-aware simplification
+# ==========================================================
+# PostGIS default number of decimal digits in ST_AsGeoJSON
+DEFAULT_PRECISION = 9
+# Simplify to half a screen pixel at the requested zoom (256px tiles, EPSG:4326)
+SIMPLIFY_PIXEL_FRACTION = 0.5
+
+
+class GeometryOptions:
+    """
+    Optional bbox / zoom / precision settings for bulk geometry queries.
+    All SQL fragments inline validated numbers only, so they can be embedded
+    in both SQLAlchemy text() and raw psycopg queries.
+    """
+
+    def __init__(
+        self,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        zoom: Optional[int] = None,
+        precision: Optional[int] = None,
+    ):
+        self.bbox = bbox
+        self.zoom = zoom
+        self.precision = DEFAULT_PRECISION if precision is None else precision
+
+    @property
+    def tolerance(self) -> Optional[float]:
+        """Simplification tolerance in degrees for the requested zoom."""
+        if self.zoom is None:
+            return None
+        return 360.0 / (256 * 2 ** self.zoom) * SIMPLIFY_PIXEL_FRACTION
+
+    @property
+    def is_default(self) -> bool:
+        return self.bbox is None and self.zoom is None and self.precision == DEFAULT_PRECISION
+
+    def geometry(self, column: str) -> str:
+        """Geometry expression, simplified for the zoom level if one was given."""
+        if self.tolerance is None:
+            return column
+        return f"ST_SimplifyPreserveTopology({column}, {self.tolerance!r})"
+
+    def geojson(self, column: str) -> str:
+        """ST_AsGeoJSON text of the (simplified) geometry at the requested precision."""
+        return f"ST_AsGeoJSON({self.geometry(column)}, {self.precision})"
+
+    def filter(self, column: str) -> str:
+        """`AND ...` bbox predicate (GiST-indexable), or an empty string."""
+        if self.bbox is None:
+            return ""
+        xmin, ymin, xmax, ymax = self.bbox
+        envelope = f"ST_MakeEnvelope({xmin!r}, {ymin!r}, {xmax!r}, {ymax!r}, 4326)"
+        return f"AND {column} && {envelope} AND ST_Intersects({column}, {envelope})"
+
+    def where(self, column: str) -> str:
+        """Standalone `WHERE ...` bbox clause, or an empty string."""
+        clause = self.filter(column)
+        return "WHERE " + clause[len("AND "):] if clause else ""
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """Parse a "xmin,ymin,xmax,ymax" string (same format as the `bounds` columns)."""
+    if not bbox:
+        return None
+    try:
+        parts = [float(v.strip()) for v in bbox.split(",")]
+    except ValueError:
+        parts = []
+    if (
+        len(parts) != 4
+        or not all(math.isfinite(v) for v in parts)
+        or parts[0] > parts[2]
+        or parts[1] > parts[3]
+    ):
+        raise HTTPException(status_code=400, detail=f"Invalid bbox '{bbox}', expected xmin,ymin,xmax,ymax.")
+    return tuple(parts)
+
+
+def geometry_options(
+    bbox: Optional[str] = Query(None, description="Only return features intersecting xmin,ymin,xmax,ymax (EPSG:4326)"),
+    zoom: Optional[int] = Query(None, ge=0, le=24, description="Simplify geometries for this map zoom level"),
+    precision: Optional[int] = Query(None, ge=0, le=15, description="Decimal digits of output coordinates"),
+) -> GeometryOptions:
+    """FastAPI dependency collecting the bbox / zoom / precision query parameters."""
+    return GeometryOptions(parse_bbox(bbox), zoom, precision)
+
+
+# ==========================================================
+# 🐘 PostGIS-side aggregation (no Python parse/serialise)
+# ==========================================================
+def aggregate_features_sql(
+    inner_sql: str,
+    options: Optional[GeometryOptions] = None,
+    geom_column: str = "geom",
+) -> str:
+    """
+    Wrap a row query so PostGIS returns all of its rows as one comma-separated
+    string of GeoJSON Features. Every column of inner_sql except geom_column
+    becomes a feature property.
+    """
+    options = options or GeometryOptions()
+    geom = f'q."{geom_column}"'
+    return f"""
+        SELECT string_agg(
+            '{{"type":"Feature","geometry":' || {options.geojson(geom)}
+            || ',"properties":' || (to_jsonb(q) - '{geom_column}')::text || '}}',
+            ','
+        ) AS features
+        FROM ({inner_sql}) q
+        WHERE {geom} IS NOT NULL {options.filter(geom)}
+    """
+
+
+def feature_collection_bytes(parts: Iterable[Optional[str]]) -> bytes:
+    """Join aggregated feature strings into a FeatureCollection body as-is."""
+    features = ",".join(p for p in parts if p)
+    return FEATURE_COLLECTION_HEAD + features.encode("utf-8") + FEATURE_COLLECTION_TAIL
+
+
+# ==========================================================
+# 📦 FlatGeobuf (binary, spatially indexed) output
+# ==========================================================
+FLATGEOBUF_MEDIA_TYPE = "application/flatgeobuf"
+
+
+def flatgeobuf_sql(inner_sql: str, options: Optional[GeometryOptions] = None, geom_column: str = "geom") -> str:
+    """
+    Wrap a row query so PostGIS encodes all of its rows as one FlatGeobuf file
+    (with a packed Hilbert R-tree index). Every column of inner_sql except
+    geom_column becomes a feature property. Requires PostGIS 3.2+.
+    """
+    options = options or GeometryOptions()
+    geom = f'q."{geom_column}"'
+    return f"""
+        SELECT ST_AsFlatGeobuf(q, true, '{geom_column}') AS fgb
+        FROM ({inner_sql}) q
+        WHERE {geom} IS NOT NULL {options.filter(geom)}
+    """
+
+
+def flatgeobuf_bytes(value) -> bytes:
+    """bytea/memoryview result of ST_AsFlatGeobuf as bytes (empty when no rows)."""
+    return bytes(value) if value is not None else b""
+
+
+# FlatGeobuf is one bytea built and buffered whole (PostgreSQL caps bytea at
+# 1 GB), so large requests are refused up front; GeoJSON output is streamed
+FLATGEOBUF_MAX_FEATURES = int(os.getenv("FLATGEOBUF_MAX_FEATURES", 500000))
+
+# Server errors raised when the encoded file outgrows what PostgreSQL can hold
+_TOO_LARGE_ERRORS = ("invalid memory alloc request size", "out of memory", "exceeds the maximum")
+
+
+def flatgeobuf_too_large(detail: str) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"{detail} FlatGeobuf output is limited to {FLATGEOBUF_MAX_FEATURES} features; "
+               "use format=geojson (streamed), a bbox or fewer schemas.",
+    )
+
+
+def check_flatgeobuf_size(db, inner_sql: str, params: Optional[Dict] = None):
+    """Raise 413 when the planner expects more rows than FLATGEOBUF_MAX_FEATURES."""
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {inner_sql}"), params or {}).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = plan[0]["Plan"]["Plan Rows"]
+    if estimate > FLATGEOBUF_MAX_FEATURES:
+        raise flatgeobuf_too_large(f"About {int(estimate)} features requested.")
+
+
+def is_size_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(e in message for e in _TOO_LARGE_ERRORS)
@@ -1,14 +1,24 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
+from contextlib import asynccontextmanager
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import importlib
 import os
 import uvicorn
 
+from db import verify_auth_database
+from connection_pools import close_pools
+from metrics import MetricsMiddleware, render_metrics
+from auth.dependencies import require_metrics_access
+
 # === Import Routers ===
 from auth.routes import router as auth_router
 from admin.routes import router as admin_router 
 from routes.geomdisplay import router as geom_router
+from routes.tiles import router as tiles_router
 from routes.schemas import router as schema_router
 from routes.parcelinfo import router as parcel_router
 from routes.edit import router as edit_router
@@ -22,18 +32,34 @@ from routes.search import router as search_router
 from routes.province import router as province_router
 from routes.municipal import router as municipal_router
 from routes.sync import router as sync_router
+from routes.grid import router as grid_router
 
 # === Predictive Model Tools ===
-from Predictive_Model_Tools.linear_regression import router as ai_linear_router
-from Predictive_Model_Tools.GWR.routes import router as ai_gwr_router
-from Predictive_Model_Tools.XGBoost.routes import router as ai_xgb_router
-from Predictive_Model_Tools.Spatial_Lag_Model.routes import router as ai_slm_router
+# URL prefix → module whose `router` serves it. With LAZY_STARTUP=1 these
+# (and geopandas, sklearn, xgboost, mgwr, ...) are imported on first use.
+LAZY_STARTUP = os.getenv("LAZY_STARTUP", "0").lower() in ("1", "true", "yes")
+ML_ROUTER_MODULES = {
+    "/api/linear-regression": "Predictive_Model_Tools.linear_regression",
+    "/api/gwr": "Predictive_Model_Tools.GWR.routes",
+    "/api/xgb": "Predictive_Model_Tools.XGBoost.routes",
+    "/api/spatial-lag": "Predictive_Model_Tools.Spatial_Lag_Model.routes",
+}
 
 
 # ==========================================================
 # 🚀 Initialize FastAPI
 # ==========================================================
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Verify the auth DB in the background; the app serves immediately
+    verify_task = asyncio.create_task(run_in_threadpool(verify_auth_database))
+    yield
+    if not verify_task.done():
+        verify_task.cancel()
+    await run_in_threadpool(close_pools)
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ==========================================================
 # 🌐 CORS Middleware
@@ -53,6 +79,7 @@ app.add_middleware(
 app.include_router(auth_router, prefix="/api")
 app.include_router(admin_router, prefix="/api")
 app.include_router(geom_router, prefix="/api")
+app.include_router(tiles_router, prefix="/api")
 app.include_router(schema_router, prefix="/api")
 app.include_router(parcel_router, prefix="/api")
 app.include_router(orthophoto_router, prefix="/api")
@@ -66,10 +93,11 @@ app.include_router(tableinfo_router, prefix="/api")
 app.include_router(province_router, prefix="/api")
 app.include_router(municipal_router, prefix="/api")
 app.include_router(sync_router, prefix="/api")
-app.include_router(ai_linear_router, prefix="/api")
-app.include_router(ai_gwr_router, prefix="/api")
-app.include_router(ai_xgb_router, prefix="/api")
-app.include_router(ai_slm_router, prefix="/api")
+app.include_router(grid_router, prefix="/api")
+
+if not LAZY_STARTUP:
+    for module_name in ML_ROUTER_MODULES.values():
+        app.include_router(importlib.import_module(module_name).router, prefix="/api")
 
 
 # ==========================================================
@@ -80,6 +108,14 @@ def health():
     return {"message": "API is up"}
 
 
+# ==========================================================
+# 📈 Metrics (Prometheus text format)
+# ==========================================================
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_metrics_access)])
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 # ==========================================================
 # 📦 Serve React Static Files
 # ==========================================================
@@ -89,6 +125,41 @@ app.mount("/", StaticFiles(directory=STATIC_DIR, html=True), name="static")
 INDEX_HTML = os.path.join(STATIC_DIR, "index.html")
 
 
+# ==========================================================
+# 💤 Lazy Predictive Model Tools routers
+# ==========================================================
+_lazy_loaded = set()
+_lazy_lock = asyncio.Lock()
+
+
+def include_router_before_static(router):
+    """Register a router after startup, ahead of the catch-all static mount."""
+    routes = app.router.routes
+    start = len(routes)
+    app.include_router(router, prefix="/api")
+    added = routes[start:]
+    del routes[start:]
+    static_index = next(i for i, r in enumerate(routes) if getattr(r, "name", None) == "static")
+    routes[static_index:static_index] = added
+    app.openapi_schema = None
+
+
+@app.middleware("http")
+async def lazy_ml_routers(request: Request, call_next):
+    if LAZY_STARTUP:
+        path = request.url.path
+        for prefix, module_name in ML_ROUTER_MODULES.items():
+            if prefix in _lazy_loaded or not (path == prefix or path.startswith(prefix + "/")):
+                continue
+            async with _lazy_lock:
+                if prefix not in _lazy_loaded:
+                    print(f"💤 Loading {module_name} on first request")
+                    module = await run_in_threadpool(importlib.import_module, module_name)
+                    include_router_before_static(module.router)
+                    _lazy_loaded.add(prefix)
+    return await call_next(request)
+
+
 # ==========================================================
 # 🧭 Fallback for React Router
 # ==========================================================
@@ -98,6 +169,7 @@ async def react_fallback(request: Request, call_next):
         not request.url.path.startswith("/api")
         and not request.url.path.startswith("/assets")
         and not request.url.path.startswith("/static")
+        and request.url.path not in ("/health", "/metrics")
         and "." not in request.url.path
     ):
         if os.path.exists(INDEX_HTML):
@@ -105,6 +177,12 @@ async def react_fallback(request: Request, call_next):
     return await call_next(request)
 
 
+# ==========================================================
+# ⏱️ Request instrumentation (outermost: times every middleware above)
+# ==========================================================
+app.add_middleware(MetricsMiddleware)
+
+
 # ==========================================================
 # ▶️ Entry Point
 # ==========================================================
@@ -0,0 +1,370 @@
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from typing import Callable, Dict, List, Optional, Tuple
+import atexit
+import json
+import logging
+import os
+import psycopg
+import queue
+import random
+import sys
+import threading
+import time
+
+# Structured request log: every 5xx and slow request, plus a sample of the rest
+REQUEST_LOG_SAMPLE_RATE = float(os.getenv("REQUEST_LOG_SAMPLE_RATE", 0.01))
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", 1000))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+# ==========================================================
+# 🧾 Per-request state
+# ==========================================================
+class RequestStats:
+    """Counters of the request being served (shared with threadpool workers)."""
+
+    __slots__ = ("method", "path", "route", "scope", "db_queries", "db_seconds", "rows", "fields", "_lock")
+
+    def __init__(self, method: str, path: str, scope=None):
+        self.method = method
+        self.path = path
+        self.scope = scope
+        self.route: Optional[str] = None
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.fields: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float, rows: int):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+            if rows and rows > 0:
+                self.rows += rows
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def current_request() -> Optional[RequestStats]:
+    return _current_request.get()
+
+
+def current_route() -> Optional[str]:
+    """Route template of the request being served (None outside requests)."""
+    stats = _current_request.get()
+    if stats is None:
+        return None
+    return stats.route or route_label(stats.scope or {})
+
+
+def annotate(**fields):
+    """Attach fields (user, database, ...) to the current request's log line."""
+    stats = _current_request.get()
+    if stats is not None:
+        stats.fields.update(fields)
+
+
+# ==========================================================
+# 📊 Histograms
+# ==========================================================
+class Histogram:
+    """Prometheus-style cumulative histogram with a fixed label set."""
+
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...], label_names: Tuple[str, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [bucket counts..., sum, count]
+                series = [0] * len(self.buckets) + [0.0, 0]
+                self._series[labels] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{_format(bound)}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {_format(series[-2])}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return "\n".join(lines)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+REQUEST_LABELS = ("method", "route", "status")
+
+request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency (until the last body chunk is sent).",
+    LATENCY_BUCKETS, REQUEST_LABELS,
+)
+request_db_queries = Histogram(
+    "http_request_db_queries", "Database queries executed per request.",
+    QUERY_COUNT_BUCKETS, REQUEST_LABELS,
+)
+request_db_seconds = Histogram(
+    "http_request_db_seconds", "Time spent executing database queries per request.",
+    LATENCY_BUCKETS, REQUEST_LABELS,
+)
+response_bytes = Histogram(
+    "http_response_bytes", "Response body size.",
+    BYTES_BUCKETS, REQUEST_LABELS,
+)
+request_db_rows = Histogram(
+    "http_request_db_rows", "Rows returned or affected by database queries per request.",
+    ROWS_BUCKETS, REQUEST_LABELS,
+)
+HISTOGRAMS = (request_duration, request_db_queries, request_db_seconds, response_bytes, request_db_rows)
+
+# Queries run outside any request (startup probe, background jobs)
+_background_queries = {"count": 0, "seconds": 0.0}
+_background_lock = threading.Lock()
+
+
+# ==========================================================
+# 🗄️ Query hooks (SQLAlchemy + raw psycopg)
+# ==========================================================
+# Called as observer(seconds, statement, parameters, source) after every query;
+# source is the SQLAlchemy Connection or psycopg connection that ran it
+_query_observers: List[Callable] = []
+
+
+def add_query_observer(observer: Callable):
+    if observer not in _query_observers:
+        _query_observers.append(observer)
+
+
+def record_query(seconds: float, rows: int, statement=None, parameters=None, source=None):
+    stats = _current_request.get()
+    if stats is not None:
+        stats.add_query(seconds, rows)
+    else:
+        with _background_lock:
+            _background_queries["count"] += 1
+            _background_queries["seconds"] += seconds
+    for observer in _query_observers:
+        try:
+            observer(seconds, statement, parameters, source)
+        except Exception as e:
+            print(f"⚠️ Query observer failed: {e}")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    record_query(time.perf_counter() - starts.pop(), getattr(cursor, "rowcount", 0), statement, parameters, conn)
+
+
+class InstrumentedCursor(psycopg.Cursor):
+    """psycopg cursor that reports query count/time/rows (for pooled raw connections)."""
+
+    def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            record_query(time.perf_counter() - start, self.rowcount, query, params, self.connection)
+
+    def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            record_query(time.perf_counter() - start, self.rowcount, query, None, self.connection)
+
+
+class InstrumentedAsyncCursor(psycopg.AsyncCursor):
+    """
+    Async counterpart of InstrumentedCursor, for hand-written SQL on psycopg
+    AsyncConnections (async_db.raw_cursor, RPIS connections). Never set it as
+    the cursor_factory of a connection SQLAlchemy owns: its own cursors are
+    already counted by the engine events.
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            record_query(time.perf_counter() - start, self.rowcount, query, params, self.connection)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            record_query(time.perf_counter() - start, self.rowcount, query, None, self.connection)
+
+
+def instrument_connection(conn):
+    """psycopg_pool `configure` callback: count queries on raw connections."""
+    conn.cursor_factory = InstrumentedCursor
+
+
+# ==========================================================
+# 📝 Sampled structured request log
+# ==========================================================
+request_logger = logging.getLogger("gis.requests")
+request_logger.setLevel(logging.INFO)
+request_logger.propagate = False
+
+# Request threads only enqueue; a single listener thread writes to stdout
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+request_logger.addHandler(QueueHandler(_log_queue))
+_stdout_handler = logging.StreamHandler(sys.stdout)
+_stdout_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = QueueListener(_log_queue, _stdout_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+def should_log(status: int, seconds: float) -> bool:
+    if status >= 500 or seconds * 1000 >= REQUEST_LOG_SLOW_MS:
+        return True
+    return REQUEST_LOG_SAMPLE_RATE > 0 and random.random() < REQUEST_LOG_SAMPLE_RATE
+
+
+def log_request(stats: RequestStats, status: int, seconds: float, body_bytes: int):
+    record = {
+        "ts": round(time.time(), 3),
+        "method": stats.method,
+        "path": stats.path,
+        "route": stats.route,
+        "status": status,
+        "ms": round(seconds * 1000, 1),
+        "db_queries": stats.db_queries,
+        "db_ms": round(stats.db_seconds * 1000, 1),
+        "rows": stats.rows,
+        "bytes": body_bytes,
+    }
+    record.update(stats.fields)
+    request_logger.info(json.dumps(record, default=str))
+
+
+# ==========================================================
+# 🛰️ ASGI middleware
+# ==========================================================
+def route_label(scope) -> str:
+    """Route template (bounded label cardinality); unmatched paths are grouped."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    if scope.get("path", "").startswith("/api"):
+        return "unmatched"
+    return "static"
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware buffering): times each HTTP
+    request until its last body chunk, counts response bytes and collects the
+    DB counters recorded by the query hooks during the request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope.get("method", "GET"), scope.get("path", ""), scope)
+        token = _current_request.set(stats)
+        status = 500
+        body_bytes = 0
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status, body_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                body_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            seconds = time.perf_counter() - start
+            _current_request.reset(token)
+            stats.route = route_label(scope)
+            labels = (stats.method, stats.route, str(status))
+            request_duration.observe(labels, seconds)
+            request_db_queries.observe(labels, stats.db_queries)
+            request_db_seconds.observe(labels, stats.db_seconds)
+            request_db_rows.observe(labels, stats.rows)
+            response_bytes.observe(labels, body_bytes)
+            if should_log(status, seconds):
+                log_request(stats, status, seconds, body_bytes)
+
+
+# ==========================================================
+# 📈 Prometheus exposition
+# ==========================================================
+def _gauge(name: str, help_text: str, samples, kind: str = "gauge") -> str:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        base = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f"{name}{{{base}}} {_format(value)}" if base else f"{name} {_format(value)}")
+    return "\n".join(lines)
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    from pool_manager import pool_manager
+
+    parts = [h.render() for h in HISTOGRAMS]
+
+    with _background_lock:
+        background = dict(_background_queries)
+    parts.append(_gauge("db_background_queries_total", "Queries executed outside a request.",
+                        [({}, background["count"])], kind="counter"))
+    parts.append(_gauge("db_background_query_seconds_total", "Time of queries executed outside a request.",
+                        [({}, background["seconds"])], kind="counter"))
+
+    pools = pool_manager.stats()
+    parts.append(_gauge("db_pool_checked_out", "Connections checked out per provincial engine.",
+                        [({"database": p["database"]}, p.get("checked_out", 0)) for p in pools]))
+    parts.append(_gauge("db_pool_wait_seconds_max", "Longest pool checkout wait per provincial engine.",
+                        [({"database": p["database"]}, p.get("wait_seconds_max", 0)) for p in pools]))
+    return "\n".join(parts) + "\n"
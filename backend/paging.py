@@ -0,0 +1,160 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import json
+import os
+
+# Page size when the client sends none, and the upper bound for one page.
+# limit=0 is the explicit opt-in to the legacy "all rows" reply.
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", 5000))
+SEARCH_DEFAULT_LIMIT = min(int(os.getenv("SEARCH_DEFAULT_LIMIT", 500)), SEARCH_MAX_LIMIT)
+ALL_ROWS = 0
+
+COUNT_MODES = ("none", "exact", "approx")
+COUNT_PATTERN = "^(none|exact|approx)$"
+KEYSET_COLUMN = "id"
+
+
+def parse_int(value, name: str) -> int:
+    """Integer query/body value; ValueError (→ 400) for anything else."""
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"{name} must be an integer")
+    if isinstance(value, str):
+        text_value = value.strip()
+        if not text_value.lstrip("-").isdigit():
+            raise ValueError(f"{name} must be an integer")
+        value = int(text_value)
+    return value
+
+
+class PageRequest:
+    """limit / keyset cursor / column projection / count mode of one search call."""
+
+    def __init__(
+        self,
+        limit: Optional[int] = None,
+        cursor: Union[int, str, None] = None,
+        fields: Union[str, Sequence[str], None] = None,
+        count: Optional[str] = None,
+    ):
+        if limit is None or limit == "":
+            limit = SEARCH_DEFAULT_LIMIT
+        else:
+            limit = parse_int(limit, "limit")
+            if limit < 0:
+                raise ValueError("limit must be 0 (all rows) or a positive page size")
+            limit = None if limit == ALL_ROWS else min(limit, SEARCH_MAX_LIMIT)
+        # The cursor is the last "id" of the previous page
+        cursor = parse_int(cursor, "cursor") if cursor not in (None, "") else None
+        if isinstance(fields, str):
+            fields = [f.strip() for f in fields.split(",") if f.strip()]
+        count = count or "none"
+        if count not in COUNT_MODES:
+            raise ValueError(f"count must be one of {', '.join(COUNT_MODES)}")
+
+        self.limit = limit
+        self.cursor = cursor
+        self.fields = list(fields) if fields else None
+        self.count = count
+
+    @classmethod
+    def from_body(cls, data: Dict) -> "PageRequest":
+        return cls(data.get("limit"), data.get("cursor"), data.get("fields"), data.get("count"))
+
+    @property
+    def keyset(self) -> bool:
+        return self.limit is not None or self.cursor is not None
+
+
+def page_sql(
+    schema: str,
+    table: str,
+    columns: Sequence[str],
+    where_clauses: List[str],
+    params: Dict,
+    page: PageRequest,
+) -> Tuple[str, Dict]:
+    """
+    SELECT for one page: projected columns, filters and, when paging, a keyset
+    condition on id (WHERE id > :cursor ORDER BY id LIMIT n + 1; the extra
+    row only tells whether another page exists).
+    """
+    known = set(columns)
+    if page.fields:
+        unknown = [f for f in page.fields if f not in known]
+        if unknown:
+            raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+        selected = list(page.fields)
+        if page.keyset and KEYSET_COLUMN in known and KEYSET_COLUMN not in selected:
+            selected.append(KEYSET_COLUMN)
+        select_list = ", ".join(f'"{c}"' for c in selected)
+    else:
+        select_list = "*"
+
+    clauses = list(where_clauses)
+    params = dict(params)
+    ordered = page.keyset and KEYSET_COLUMN in known
+    if page.cursor is not None:
+        if not ordered:
+            raise ValueError(f'Table "{table}" has no "{KEYSET_COLUMN}" column for paging')
+        clauses.append(f'"{KEYSET_COLUMN}" > :_cursor')
+        params["_cursor"] = page.cursor
+
+    sql = f'SELECT {select_list} FROM "{schema}"."{table}"'
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    if ordered:
+        sql += f' ORDER BY "{KEYSET_COLUMN}"'
+    # Tables without an id are still bounded, but cannot be continued
+    if page.limit is not None:
+        sql += " LIMIT :_limit"
+        params["_limit"] = page.limit + 1
+    return sql, params
+
+
+def count_rows(db: Session, schema: str, table: str, where_clauses: List[str], params: Dict,
+               mode: str) -> Tuple[Optional[int], bool]:
+    """
+    (total, is_estimate) of the filtered rows, cursor ignored. 'approx' reads
+    pg_class.reltuples for an unfiltered table or the planner's row estimate
+    for a filtered one; neither scans the table.
+    """
+    if mode == "none":
+        return None, False
+
+    where = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    if mode == "approx":
+        if not where_clauses:
+            estimate = db.execute(
+                text("SELECT reltuples::bigint FROM pg_catalog.pg_class WHERE oid = to_regclass(:name)"),
+                {"name": f'"{schema}"."{table}"'},
+            ).scalar()
+        else:
+            plan = db.execute(text(f'EXPLAIN (FORMAT JSON) SELECT 1 FROM "{schema}"."{table}"{where}'), params).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            estimate = plan[0]["Plan"]["Plan Rows"]
+        # reltuples is -1 (or 0) until the table is first vacuumed/analysed
+        if estimate is not None and estimate > 0:
+            return int(estimate), True
+
+    total = db.execute(text(f'SELECT count(*) FROM "{schema}"."{table}"{where}'), params).scalar()
+    return int(total), False
+
+
+def page_response(rows: List[Dict], page: PageRequest, total: Optional[int] = None,
+                  total_is_estimate: bool = False) -> Dict:
+    """Search reply: legacy data/count plus next_cursor / has_more / total when requested."""
+    has_more = False
+    if page.limit is not None and len(rows) > page.limit:
+        rows = rows[:page.limit]
+        has_more = True
+
+    response = {"status": "success", "data": rows, "count": len(rows)}
+    if page.keyset:
+        response["has_more"] = has_more
+        response["next_cursor"] = rows[-1].get(KEYSET_COLUMN) if has_more and rows else None
+    if page.count != "none":
+        response["total"] = total
+        response["total_is_estimate"] = total_is_estimate
+    return response
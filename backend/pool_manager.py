@@ -0,0 +1,278 @@
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, URL
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool
+from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import threading
+import time
+
+# Defaults for every provincial engine (override per database with POOL_OVERRIDES)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", 10))
+POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", 1800))
+POOL_TIMEOUT_SECONDS = int(os.getenv("DB_POOL_TIMEOUT_SECONDS", 30))
+
+# Async (psycopg 3) engines serve the ported routes next to the sync engine of
+# the same database, so they get a smaller pool of their own
+ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", 2))
+ASYNC_POOL_MAX_OVERFLOW = int(os.getenv("DB_ASYNC_POOL_MAX_OVERFLOW", 5))
+
+# Engines unused for this long (and with nothing checked out) are disposed
+ENGINE_IDLE_SECONDS = int(os.getenv("DB_ENGINE_IDLE_SECONDS", 1800))
+EVICTION_INTERVAL_SECONDS = 60
+
+# JSON object of dbname → pool settings, e.g.
+# {"PH04034_Laguna": {"pool_size": 10, "max_overflow": 20, "pool_recycle": 900}}
+# async_pool_size / async_max_overflow size the async engine of that database
+POOL_SETTING_KEYS = (
+    "pool_size", "max_overflow", "pool_recycle", "pool_timeout",
+    "async_pool_size", "async_max_overflow",
+)
+
+
+def _load_pool_overrides() -> Dict[str, Dict[str, int]]:
+    raw = os.getenv("POOL_OVERRIDES", "").strip()
+    if not raw:
+        return {}
+    try:
+        overrides = json.loads(raw)
+        return {
+            dbname: {k: int(v) for k, v in settings.items() if k in POOL_SETTING_KEYS}
+            for dbname, settings in overrides.items()
+        }
+    except Exception as e:
+        print(f"⚠️ Ignoring invalid POOL_OVERRIDES: {e}")
+        return {}
+
+
+POOL_OVERRIDES = _load_pool_overrides()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.wait_seconds_total += waited
+                self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+    def wait_stats(self) -> Dict:
+        with self._stats_lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_seconds_total": round(self.wait_seconds_total, 4),
+                "wait_seconds_avg": round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                "wait_seconds_max": round(self.wait_seconds_max, 4),
+                "timeouts": self.timeouts,
+            }
+
+
+def pool_settings(dbname: str, asynchronous: bool = False) -> Dict[str, int]:
+    """Effective pool settings of a database's sync or async engine (defaults + POOL_OVERRIDES)."""
+    overrides = POOL_OVERRIDES.get(dbname, {})
+    settings = {
+        "pool_size": POOL_SIZE,
+        "max_overflow": POOL_MAX_OVERFLOW,
+        "pool_recycle": POOL_RECYCLE_SECONDS,
+        "pool_timeout": POOL_TIMEOUT_SECONDS,
+    }
+    settings.update({k: v for k, v in overrides.items() if not k.startswith("async_")})
+    if asynchronous:
+        settings["pool_size"] = overrides.get("async_pool_size", ASYNC_POOL_SIZE)
+        settings["max_overflow"] = overrides.get("async_max_overflow", ASYNC_POOL_MAX_OVERFLOW)
+    return settings
+
+
+def _dispose_async_engine(engine: AsyncEngine, loop: Optional[asyncio.AbstractEventLoop]):
+    """Dispose an async engine on the event loop that owns its connections."""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if loop is not None and running is loop:
+        loop.create_task(engine.dispose())
+    elif loop is not None and loop.is_running():
+        asyncio.run_coroutine_threadsafe(engine.dispose(), loop)
+    else:
+        # Loop gone: drop the pool, connections close when collected
+        engine.sync_engine.dispose(close=False)
+
+
+class PoolManager:
+    """
+    Thread-safe registry of provincial engines keyed by host:port/dbname.
+    Each engine (and its async counterpart) gets its own sized, instrumented
+    pool; idle engines are disposed so rarely used provinces do not hold
+    connections.
+    """
+
+    def __init__(self):
+        self.engines: Dict[str, Engine] = {}
+        self.async_engines: Dict[str, AsyncEngine] = {}
+        self._async_loops: Dict[str, asyncio.AbstractEventLoop] = {}
+        self._settings: Dict[str, Dict[str, int]] = {}
+        self._last_used: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    def get_engine(self, host: str, port, dbname: str, user: str, password: str) -> Engine:
+        key = f"{host}:{port}/{dbname}"
+        engine = self.engines.get(key)
+        if engine is None:
+            with self._lock:
+                engine = self.engines.get(key)
+                if engine is None:
+                    settings = pool_settings(dbname)
+                    url = URL.create(
+                        "postgresql",
+                        username=user,
+                        password=password,
+                        host=host,
+                        port=int(port) if port else None,
+                        database=dbname,
+                    )
+                    engine = create_engine(url, poolclass=TimedQueuePool, pool_pre_ping=True, **settings)
+                    self.engines[key] = engine
+                    self._settings[key] = settings
+                    print(f"✅ Created engine for {key} (pool_size={settings['pool_size']}, "
+                          f"max_overflow={settings['max_overflow']})")
+
+        self._last_used[key] = time.monotonic()
+        self._maybe_evict()
+        return engine
+
+    def get_async_engine(self, host: str, port, dbname: str, user: str, password: str) -> AsyncEngine:
+        """Async (psycopg 3) engine of a database; call from the event loop."""
+        key = f"{host}:{port}/{dbname}"
+        engine = self.async_engines.get(key)
+        if engine is None:
+            with self._lock:
+                engine = self.async_engines.get(key)
+                if engine is None:
+                    settings = pool_settings(dbname, asynchronous=True)
+                    url = URL.create(
+                        "postgresql+psycopg",
+                        username=user,
+                        password=password,
+                        host=host,
+                        port=int(port) if port else None,
+                        database=dbname,
+                    )
+                    engine = create_async_engine(
+                        url,
+                        pool_pre_ping=True,
+                        # No server-side prepared statements: safe behind pgbouncer
+                        connect_args={"prepare_threshold": None},
+                        **settings,
+                    )
+                    self.async_engines[key] = engine
+                    self._async_loops[key] = asyncio.get_running_loop()
+                    self._settings[f"async:{key}"] = settings
+                    print(f"✅ Created async engine for {key} (pool_size={settings['pool_size']}, "
+                          f"max_overflow={settings['max_overflow']})")
+
+        self._last_used[f"async:{key}"] = time.monotonic()
+        self._maybe_evict()
+        return engine
+
+    # ---------------- eviction ----------------
+    def _maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_eviction < EVICTION_INTERVAL_SECONDS:
+            return
+        self._last_eviction = now
+        self.evict_idle()
+
+    def evict_idle(self, idle_seconds: int = ENGINE_IDLE_SECONDS) -> List[str]:
+        """Dispose engines unused for idle_seconds with no checked-out connections."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            for key, engine in list(self.engines.items()):
+                if now - self._last_used.get(key, now) < idle_seconds:
+                    continue
+                if engine.pool.checkedout() > 0:
+                    continue
+                del self.engines[key]
+                self._settings.pop(key, None)
+                self._last_used.pop(key, None)
+                engine.dispose()
+                evicted.append(key)
+            for key, engine in list(self.async_engines.items()):
+                name = f"async:{key}"
+                if now - self._last_used.get(name, now) < idle_seconds:
+                    continue
+                if engine.sync_engine.pool.checkedout() > 0:
+                    continue
+                del self.async_engines[key]
+                self._settings.pop(name, None)
+                self._last_used.pop(name, None)
+                _dispose_async_engine(engine, self._async_loops.pop(key, None))
+                evicted.append(name)
+        for key in evicted:
+            print(f"🧹 Disposed idle engine {key}")
+        return evicted
+
+    # ---------------- statistics ----------------
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        result = []
+        with self._lock:
+            items = list(self.engines.items())
+            items += [(f"async:{key}", engine.sync_engine) for key, engine in self.async_engines.items()]
+        for key, engine in items:
+            pool = engine.pool
+            entry = {
+                "database": key,
+                "settings": self._settings.get(key, {}),
+                "idle_seconds": round(now - self._last_used.get(key, now), 1),
+            }
+            if isinstance(pool, QueuePool):
+                entry.update({
+                    "size": pool.size(),
+                    "checked_in": pool.checkedin(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": pool.overflow(),
+                })
+            if isinstance(pool, TimedQueuePool):
+                entry.update(pool.wait_stats())
+            result.append(entry)
+        return result
+
+    def find(self, key: str) -> Optional[Engine]:
+        return self.engines.get(key)
+
+    @staticmethod
+    def engine_key(engine: Engine) -> str:
+        url = engine.url
+        return f"{url.host}:{url.port}/{url.database}"
+
+    def settings(self, key: str) -> Optional[Dict[str, int]]:
+        """Pool settings an engine was created with (async ones under "async:<key>")."""
+        settings = self._settings.get(key)
+        return dict(settings) if settings is not None else None
+
+
+# Shared process-wide pool manager
+pool_manager = PoolManager()
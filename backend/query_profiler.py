@@ -0,0 +1,408 @@
+from collections import deque
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from sqlalchemy import text
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from metrics import add_query_observer, current_request, current_route
+
+# Opt-in: off unless QUERY_PROFILER_ENABLED=1 (or enabled from the admin API)
+QUERY_PROFILER_ENABLED = os.getenv("QUERY_PROFILER_ENABLED", "0").lower() in ("1", "true", "yes")
+QUERY_PROFILER_THRESHOLD_MS = float(os.getenv("QUERY_PROFILER_THRESHOLD_MS", 500))
+
+# Share of slow SELECTs re-run with EXPLAIN (ANALYZE, BUFFERS), at most once per
+# fingerprint per cooldown, and bounded by a statement timeout
+QUERY_PROFILER_EXPLAIN_RATE = float(os.getenv("QUERY_PROFILER_EXPLAIN_RATE", 0.05))
+QUERY_PROFILER_EXPLAIN_COOLDOWN_SECONDS = int(os.getenv("QUERY_PROFILER_EXPLAIN_COOLDOWN_SECONDS", 600))
+QUERY_PROFILER_EXPLAIN_TIMEOUT_MS = int(os.getenv("QUERY_PROFILER_EXPLAIN_TIMEOUT_MS", 30000))
+
+# Rotating JSONL store + in-memory ring buffer for the admin endpoint; the
+# store lives outside the source/app tree unless QUERY_PROFILER_DIR says otherwise
+QUERY_PROFILER_DIR = os.getenv("QUERY_PROFILER_DIR", os.path.join(tempfile.gettempdir(), "gis_query_profiles"))
+QUERY_PROFILER_MAX_BYTES = int(os.getenv("QUERY_PROFILER_MAX_BYTES", 10 * 1024 * 1024))
+QUERY_PROFILER_BACKUPS = int(os.getenv("QUERY_PROFILER_BACKUPS", 5))
+QUERY_PROFILER_BUFFER = int(os.getenv("QUERY_PROFILER_BUFFER", 500))
+
+STORE_FILENAME = "slow_queries.jsonl"
+MAX_STATEMENT_LENGTH = 4000
+MAX_SHAPE_ITEMS = 50
+
+settings = {
+    "enabled": QUERY_PROFILER_ENABLED,
+    "threshold_ms": QUERY_PROFILER_THRESHOLD_MS,
+    "explain_rate": QUERY_PROFILER_EXPLAIN_RATE,
+}
+
+# Set while the profiler runs its own EXPLAINs, so they are not captured
+_profiling_suspended: ContextVar[bool] = ContextVar("profiling_suspended", default=False)
+
+
+# ==========================================================
+# 🧹 Normalisation
+# ==========================================================
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_SCHEMA_RE = re.compile(r'"PH\d+[^"]*"')
+_PLACEHOLDER_RE = re.compile(r"%\(\w+\)s|%[sbt]|\$\d+|(?<![:\w]):[A-Za-z_]\w*")
+_NUMBER_RE = re.compile(r"(?<![\w.\"])-?\d+(?:\.\d+)?(?![\w\"])")
+_IN_LIST_RE = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_SPACE_RE = re.compile(r"\s+")
+
+_EXPLAINABLE_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_UNSAFE_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE|TRUNCATE|INTO|FOR\s+(UPDATE|SHARE|NO\s+KEY|KEY)|nextval|setval|pg_advisory\w*)\b",
+    re.IGNORECASE,
+)
+
+
+def normalize_sql(statement: str) -> str:
+    """
+    Literal-free, whitespace-collapsed SQL: strings, numbers and bind
+    placeholders become ?, IN/VALUES lists collapse and municipal schema
+    identifiers become "<schema>" so per-schema f-string SQL groups together.
+    """
+    sql = _STRING_RE.sub("?", statement)
+    sql = _SCHEMA_RE.sub('"<schema>"', sql)
+    sql = _PLACEHOLDER_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("IN (?...)", sql)
+    sql = _VALUES_RE.sub(r"\1, ...", sql)
+    sql = _SPACE_RE.sub(" ", sql).strip()
+    return sql[:MAX_STATEMENT_LENGTH]
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def parameter_shape(parameters):
+    """Types (never values) of bind parameters; executemany batches report their size."""
+    if parameters is None:
+        return None
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in list(parameters.items())[:MAX_SHAPE_ITEMS]}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return {"batch": len(parameters), "row": parameter_shape(parameters[0])}
+        return [type(v).__name__ for v in parameters[:MAX_SHAPE_ITEMS]]
+    return type(parameters).__name__
+
+
+def is_explainable(statement: str) -> bool:
+    """Only read-only SELECT/WITH statements are re-run under EXPLAIN ANALYZE."""
+    return bool(_EXPLAINABLE_RE.match(statement)) and not _UNSAFE_RE.search(statement)
+
+
+# ==========================================================
+# 🔌 Connection identity
+# ==========================================================
+def _statement_text(statement, source) -> Optional[str]:
+    if statement is None:
+        return None
+    if isinstance(statement, bytes):
+        return statement.decode("utf-8", errors="replace")
+    if isinstance(statement, str):
+        return statement
+    # psycopg.sql.Composable
+    try:
+        return statement.as_string(source)
+    except Exception:
+        return str(statement)
+
+
+def _connection_target(source) -> Optional[Dict]:
+    """host/port/dbname/user/password of the connection that ran a query."""
+    engine = getattr(source, "engine", None)
+    if engine is not None:
+        url = engine.url
+        return {
+            "host": url.host,
+            "port": url.port,
+            "dbname": url.database,
+            "user": url.username,
+            "password": url.password,
+        }
+    info = getattr(source, "info", None)
+    if info is not None and hasattr(info, "dbname"):
+        return {
+            "host": info.host,
+            "port": info.port,
+            "dbname": info.dbname,
+            "user": info.user,
+            "password": info.password,
+        }
+    return None
+
+
+# ==========================================================
+# 📦 Store (ring buffer + rotating JSONL)
+# ==========================================================
+_buffer: deque = deque(maxlen=QUERY_PROFILER_BUFFER)
+_buffer_lock = threading.Lock()
+_last_explained: Dict[str, float] = {}
+
+_store_logger: Optional[logging.Logger] = None
+_store_lock = threading.Lock()
+
+
+def _get_store_logger() -> logging.Logger:
+    global _store_logger
+    if _store_logger is None:
+        with _store_lock:
+            if _store_logger is None:
+                os.makedirs(QUERY_PROFILER_DIR, exist_ok=True)
+                logger = logging.getLogger("gis.slow_queries")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                handler = RotatingFileHandler(
+                    os.path.join(QUERY_PROFILER_DIR, STORE_FILENAME),
+                    maxBytes=QUERY_PROFILER_MAX_BYTES,
+                    backupCount=QUERY_PROFILER_BACKUPS,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger.addHandler(handler)
+                _store_logger = logger
+    return _store_logger
+
+
+def _store(record: Dict):
+    with _buffer_lock:
+        _buffer.append(record)
+    try:
+        _get_store_logger().info(json.dumps(record, default=str))
+    except Exception as e:
+        print(f"⚠️ Could not write slow query record: {e}")
+
+
+def recent(limit: int = 100, fingerprint_filter: str = None, route: str = None) -> List[Dict]:
+    """Newest captured queries from memory."""
+    with _buffer_lock:
+        records = list(_buffer)
+    return _filter(reversed(records), limit, fingerprint_filter, route)
+
+
+def read_store(limit: int = 100, fingerprint_filter: str = None, route: str = None) -> List[Dict]:
+    """Newest captured queries from the JSONL files (survives restarts)."""
+    base = os.path.join(QUERY_PROFILER_DIR, STORE_FILENAME)
+    paths = [base] + [f"{base}.{i}" for i in range(1, QUERY_PROFILER_BACKUPS + 1)]
+    results: List[Dict] = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8") as f:
+            lines = f.readlines()
+        records = []
+        for line in reversed(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        results.extend(_filter(records, limit - len(results), fingerprint_filter, route))
+        if len(results) >= limit:
+            break
+    return results
+
+
+def _filter(records, limit, fingerprint_filter, route) -> List[Dict]:
+    results = []
+    for record in records:
+        if len(results) >= limit:
+            break
+        if fingerprint_filter and record.get("fingerprint") != fingerprint_filter:
+            continue
+        if route and record.get("route") != route:
+            continue
+        results.append(record)
+    return results
+
+
+def summary() -> List[Dict]:
+    """Captured queries grouped by fingerprint, slowest total first."""
+    with _buffer_lock:
+        records = list(_buffer)
+    groups: Dict[str, Dict] = {}
+    for r in records:
+        g = groups.setdefault(r["fingerprint"], {
+            "fingerprint": r["fingerprint"],
+            "normalized": r["normalized"],
+            "count": 0,
+            "total_ms": 0.0,
+            "max_ms": 0.0,
+            "routes": set(),
+            "databases": set(),
+            "last_seen": None,
+            "explained": 0,
+        })
+        g["count"] += 1
+        g["total_ms"] += r["duration_ms"]
+        g["max_ms"] = max(g["max_ms"], r["duration_ms"])
+        if r.get("route"):
+            g["routes"].add(r["route"])
+        if r.get("database"):
+            g["databases"].add(r["database"])
+        g["last_seen"] = r["ts"]
+        if r.get("plan") is not None:
+            g["explained"] += 1
+    result = []
+    for g in groups.values():
+        g["avg_ms"] = round(g["total_ms"] / g["count"], 1)
+        g["total_ms"] = round(g["total_ms"], 1)
+        g["routes"] = sorted(g["routes"])
+        g["databases"] = sorted(g["databases"])
+        result.append(g)
+    return sorted(result, key=lambda g: g["total_ms"], reverse=True)
+
+
+def clear() -> int:
+    with _buffer_lock:
+        removed = len(_buffer)
+        _buffer.clear()
+        _last_explained.clear()
+    return removed
+
+
+# ==========================================================
+# 🔬 Background worker (EXPLAIN + writes off the request path)
+# ==========================================================
+_work: "queue.Queue" = queue.Queue(maxsize=1000)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is not None:
+        return
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name="query-profiler", daemon=True)
+            _worker.start()
+
+
+def _run_worker():
+    _profiling_suspended.set(True)
+    while True:
+        record, explain = _work.get()
+        try:
+            if explain is not None:
+                _explain(record, *explain)
+            _store(record)
+        except Exception as e:
+            print(f"⚠️ Query profiler failed: {e}")
+
+
+def _explain(record: Dict, statement: str, parameters, target: Dict):
+    from pool_manager import pool_manager
+
+    engine = pool_manager.get_engine(
+        target["host"], target["port"], target["dbname"], target["user"], target["password"]
+    )
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            with conn.begin() as trans:
+                conn.execute(text(f"SET LOCAL statement_timeout = {int(QUERY_PROFILER_EXPLAIN_TIMEOUT_MS)}"))
+                explain_sql = "EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + statement
+                if parameters:
+                    plan = conn.exec_driver_sql(explain_sql, parameters).scalar()
+                else:
+                    plan = conn.exec_driver_sql(explain_sql).scalar()
+                # Never keep anything the statement might have done
+                trans.rollback()
+        record["plan"] = plan if not isinstance(plan, str) else json.loads(plan)
+    except Exception as e:
+        record["explain_error"] = str(e).splitlines()[0][:500]
+    record["explain_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+
+# ==========================================================
+# 👀 Query observer
+# ==========================================================
+def observe_query(seconds: float, statement, parameters, source):
+    if not settings["enabled"] or _profiling_suspended.get():
+        return
+    duration_ms = seconds * 1000
+    if duration_ms < settings["threshold_ms"]:
+        return
+
+    sql = _statement_text(statement, source)
+    if not sql:
+        return
+    normalized = normalize_sql(sql)
+    key = fingerprint(normalized)
+    target = _connection_target(source)
+    stats = current_request()
+
+    record = {
+        "id": uuid.uuid4().hex[:12],
+        "ts": round(time.time(), 3),
+        "fingerprint": key,
+        "normalized": normalized,
+        "parameters": parameter_shape(parameters),
+        "duration_ms": round(duration_ms, 1),
+        "route": current_route(),
+        "method": stats.method if stats else None,
+        "path": stats.path if stats else None,
+        "database": target["dbname"] if target else None,
+    }
+
+    explain = None
+    if (
+        target is not None
+        and settings["explain_rate"] > 0
+        and random.random() < settings["explain_rate"]
+        and is_explainable(sql)
+        # executemany batches are not re-run
+        and not (isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (dict, list, tuple)))
+    ):
+        now = time.monotonic()
+        with _buffer_lock:
+            last = _last_explained.get(key)
+            if last is None or now - last >= QUERY_PROFILER_EXPLAIN_COOLDOWN_SECONDS:
+                _last_explained[key] = now
+                explain = (sql, parameters, target)
+
+    _ensure_worker()
+    try:
+        _work.put_nowait((record, explain))
+    except queue.Full:
+        pass
+
+
+def configure(enabled: Optional[bool] = None, threshold_ms: Optional[float] = None,
+              explain_rate: Optional[float] = None) -> Dict:
+    """Change profiler settings at runtime (admin API)."""
+    if enabled is not None:
+        settings["enabled"] = enabled
+    if threshold_ms is not None:
+        settings["threshold_ms"] = max(0.0, threshold_ms)
+    if explain_rate is not None:
+        settings["explain_rate"] = min(1.0, max(0.0, explain_rate))
+    return status()
+
+
+def status() -> Dict:
+    with _buffer_lock:
+        buffered = len(_buffer)
+    return {
+        **settings,
+        "explain_cooldown_seconds": QUERY_PROFILER_EXPLAIN_COOLDOWN_SECONDS,
+        "store": os.path.join(QUERY_PROFILER_DIR, STORE_FILENAME),
+        "buffered": buffered,
+        "pending": _work.qsize(),
+    }
+
+
+add_query_observer(observe_query)
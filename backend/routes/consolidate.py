@@ -1,10 +1,14 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Request, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import json
-from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
+from tile_cache import tile_cache
+from autocomplete import autocomplete_index
+from catalog import get_catalog
+from async_db import raw_connection, raw_cursor
 
-from auth.dependencies import get_user_main_db, get_current_user
+from auth.dependencies import get_user_main_async_db, get_current_user
 from auth.models import User
 
 router = APIRouter()
@@ -12,7 +16,7 @@ router = APIRouter()
 @router.post("/merge-parcels-postgis")
 async def merge_parcels_postgis(
     request: Request,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     data = await request.json()
@@ -31,31 +35,23 @@ async def merge_parcels_postgis(
     attr_table = f'"{schema}"."JoinedTable"'
 
     try:
-        conn = db.connection().connection
-
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            # STEP 1: Detect existing columns
-            cur.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = %s AND table_name = %s
-            """, (schema, table))
-            parcel_columns = [r["column_name"] for r in cur.fetchall()]
-            allowed_columns = set(parcel_columns) - {"geom"}
-
-            # STEP 1.1: Detect columns in parcel_transaction_log
-            cur.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = %s AND table_name = %s
-            """, (schema, "parcel_transaction_log"))
-            log_columns = [r["column_name"] for r in cur.fetchall()]
+        # STEP 1: Detect existing columns (parcel table + parcel_transaction_log)
+        catalog = await db.run_sync(get_catalog)
+        parcel_columns = catalog.columns(schema, table)
+        allowed_columns = set(parcel_columns) - {"geom"}
+        log_columns = catalog.columns(schema, "parcel_transaction_log")
+
+        conn = await raw_connection(db)
+
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
 
             # STEP 2: Merge geometries
             geojson_strings = [json.dumps(g) for g in geometries]
             union_args = ', '.join(['ST_GeomFromGeoJSON(%s)'] * len(geojson_strings))
-            cur.execute(f"""
+            await cur.execute(f"""
                 SELECT ST_AsGeoJSON(ST_Union(ARRAY[{union_args}])) AS merged;
             """, geojson_strings)
-            merged_result = cur.fetchone()
+            merged_result = await cur.fetchone()
             merged_geom = merged_result["merged"]
             if not merged_geom:
                 return {"status": "error", "message": "Geometry union failed."}
@@ -63,17 +59,17 @@ async def merge_parcels_postgis(
             # STEP 3: Generate new PIN
             prefix = original_pins[0].rsplit("-", 1)[0]
             if "barangay" in base_props and "barangay" in allowed_columns:
-                cur.execute(f"""
+                await cur.execute(f"""
                     SELECT pin FROM {full_table}
                     WHERE barangay = %s AND pin ~ %s
                 """, (base_props["barangay"], r'.*\d{3}$'))
             else:
-                cur.execute(f"""
+                await cur.execute(f"""
                     SELECT pin FROM {full_table}
                     WHERE pin ~ %s
                 """, (r'.*\d{3}$',))
 
-            existing_pins = [row["pin"] for row in cur.fetchall()]
+            existing_pins = [row["pin"] for row in await cur.fetchall()]
             suffixes = [int(p[-3:]) for p in existing_pins if p and p[-3:].isdigit()]
             next_suffix = max(suffixes or [0]) + 1
             new_pin = f"{prefix}-{str(next_suffix).zfill(3)}"
@@ -89,13 +85,13 @@ async def merge_parcels_postgis(
             placeholders = ', '.join(['%s'] * len(clean_props))
             values = list(clean_props.values())
 
-            cur.execute(f"""
+            await cur.execute(f"""
                 INSERT INTO {full_table} ({columns}, geom)
                 VALUES ({placeholders}, ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326))
             """, values + [merged_geom])
 
             # Insert new parcel into JoinedTable
-            cur.execute(f"""
+            await cur.execute(f"""
                 INSERT INTO {attr_table} ("pin")
                 VALUES (%s)
             """, (new_pin,))
@@ -110,27 +106,30 @@ async def merge_parcels_postgis(
             new_log_values = [table, "new (consolidate)", new_transaction_date] + \
                              list(loggable_props.values()) + [merged_geom]
 
-            cur.execute(f"""
+            await cur.execute(f"""
                 INSERT INTO {log_table} ({', '.join(new_log_fields)})
                 VALUES ({', '.join(new_log_placeholders)})
             """, new_log_values)
 
             # STEP 6: Log old parcels safely
+            removed_rows = []
             for pin in original_pins:
-                cur.execute(f"""
+                await cur.execute(f"""
                     SELECT *, ST_AsGeoJSON(geom)::json AS geometry
                     FROM {full_table}
                     WHERE pin = %s
                 """, (pin,))
-                parcel_row = cur.fetchone()
+                parcel_row = await cur.fetchone()
                 if not parcel_row:
                     continue
 
-                cur.execute(f"""
+                await cur.execute(f"""
                     SELECT * FROM {attr_table}
                     WHERE pin = %s
                 """, (pin,))
-                attr_row = cur.fetchone() or {}
+                attr_row = await cur.fetchone() or {}
+                if attr_row:
+                    removed_rows.append(attr_row)
 
                 merged_data = {**parcel_row, **attr_row}
                 geom = merged_data.pop("geometry", None)
@@ -148,22 +147,32 @@ async def merge_parcels_postgis(
                 log_values = [table, "consolidated", transaction_date] + \
                              list(filtered_data.values()) + [json.dumps(geom)]
 
-                cur.execute(f"""
+                await cur.execute(f"""
                     INSERT INTO {log_table} ({', '.join(log_fields)})
                     VALUES ({', '.join(log_placeholders)})
                 """, log_values)
 
                 # Delete old parcel entries
-                cur.execute(f'DELETE FROM {full_table} WHERE pin = %s', (pin,))
-                cur.execute(f'DELETE FROM {attr_table} WHERE pin = %s', (pin,))
+                await cur.execute(f'DELETE FROM {full_table} WHERE pin = %s', (pin,))
+                await cur.execute(f'DELETE FROM {attr_table} WHERE pin = %s', (pin,))
+
+            await conn.commit()
+
+            # 🧱 Drop cached tiles covering the consolidated parcels
+            tile_cache.invalidate_geometries(
+                getattr(current_user, "actual_dbname", None), schema, table, geometries
+            )
+            autocomplete_index.apply(
+                getattr(current_user, "actual_dbname", None), schema, "JoinedTable",
+                removed=removed_rows, added=[{"pin": new_pin}]
+            )
 
-            conn.commit()
             print(f"✅ Consolidation successful for user {current_user.user_name}: New PIN {new_pin}")
             return {"status": "success", "new_pin": new_pin}
 
     except Exception as e:
         try:
-            conn.rollback()
+            await conn.rollback()
         except:
             pass
         print(f"❌ Consolidation error for user {current_user.user_name}: {str(e)}")
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Request, Depends
-from auth.dependencies import get_current_user, get_user_main_db
+from auth.dependencies import get_current_user, get_user_main_async_db
+from async_db import raw_connection, raw_cursor
 from auth.models import User
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import json
-from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
+from tile_cache import tile_cache
+from autocomplete import autocomplete_index
 
 router = APIRouter()
 
@@ -12,7 +15,7 @@ router = APIRouter()
 async def update_parcel(
     request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_user_main_db)
+    db: AsyncSession = Depends(get_user_main_async_db)
 ):
     data = await request.json()
     schema = data.get("schema")
@@ -39,30 +42,30 @@ async def update_parcel(
     log_table = f'"{schema}"."parcel_transaction_log"'
 
     try:
-        # Get raw psycopg2 connection
-        conn = db.connection().connection
+        # Get raw psycopg (async) connection
+        conn = await raw_connection(db)
         
-        # Use RealDictCursor for dictionary results
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        # Use dict_row for dictionary results
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
             # 1. Fetch full attribute record
-            cur.execute(f'''
+            await cur.execute(f'''
                 SELECT *
                 FROM {attr_table}
                 WHERE pin = %s
             ''', (old_pin,))
-            attr_row = cur.fetchone()
+            attr_row = await cur.fetchone()
             if not attr_row:
                 print("❌ Attribute data not found.")
                 return {"status": "error", "message": "Attribute data not found."}
             print("📦 Loaded full attribute record.")
 
             # 2. Fetch geometry
-            cur.execute(f'''
+            await cur.execute(f'''
                 SELECT ST_AsGeoJSON(geom)::json AS geometry
                 FROM {parcel_table}
                 WHERE pin = %s
             ''', (old_pin,))
-            geo_row = cur.fetchone()
+            geo_row = await cur.fetchone()
             if not geo_row:
                 print("❌ Geometry not found.")
                 return {"status": "error", "message": "Geometry not found."}
@@ -107,7 +110,7 @@ async def update_parcel(
             values_old = [geom_table_name, transaction_type_old, timestamp] + list(log_old.values()) + [parcel_geom]
             placeholders_old = ['%s'] * (3 + len(log_old)) + ['ST_GeomFromGeoJSON(%s)']
 
-            cur.execute(f'''
+            await cur.execute(f'''
                 INSERT INTO {log_table} ({', '.join(log_fields_old)})
                 VALUES ({', '.join(placeholders_old)})
             ''', values_old)
@@ -121,14 +124,14 @@ async def update_parcel(
             values_new = [geom_table_name, transaction_type_new, timestamp] + list(log_new.values()) + [parcel_geom]
             placeholders_new = ['%s'] * (3 + len(log_new)) + ['ST_GeomFromGeoJSON(%s)']
 
-            cur.execute(f'''
+            await cur.execute(f'''
                 INSERT INTO {log_table} ({', '.join(log_fields_new)})
                 VALUES ({', '.join(placeholders_new)})
             ''', values_new)
             print("📝 Logged new version.")
 
             # 5. Update geometry table pin
-            cur.execute(f'''
+            await cur.execute(f'''
                 UPDATE {parcel_table}
                 SET pin = %s
                 WHERE pin = %s
@@ -136,20 +139,29 @@ async def update_parcel(
             print(f"🔄 Updated pin in geometry table: {old_pin} → {new_pin}")
 
             # 6. Update JoinedTable pin
-            cur.execute(f'''
+            await cur.execute(f'''
                 UPDATE {attr_table}
                 SET pin = %s
                 WHERE pin = %s
             ''', (new_pin, old_pin))
             print(f"🔄 Updated pin in JoinedTable: {old_pin} → {new_pin}")
 
-        conn.commit()
+        await conn.commit()
         print("✅ Parcel edit completed.")
+
+        # 🧱 Drop cached tiles covering the edited parcel
+        tile_cache.invalidate_geometries(
+            getattr(current_user, "actual_dbname", None), schema, geom_table_name, [geo_row["geometry"]]
+        )
+        autocomplete_index.apply(
+            getattr(current_user, "actual_dbname", None), schema, "JoinedTable",
+            removed=[attr_row], added=[{**attr_row, "pin": new_pin}]
+        )
         return {"status": "success", "message": "Parcel edited and logged successfully."}
 
     except Exception as e:
         try:
-            conn.rollback()
+            await conn.rollback()
         except:
             pass
         print("❌ Error during update:", str(e))
@@ -1,19 +1,128 @@
 from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi.responses import Response, StreamingResponse
 from auth.dependencies import get_current_user, get_user_main_db
 from auth.models import User
 from auth.access_control import AccessControl
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List
+from typing import Dict, List, Optional, Tuple
+import os
+from catalog import get_catalog
+from geojson_utils import (
+    stream_feature_collection, stream_feature_collection_parallel, parallel_scalars, scalars_one_by_one,
+    aggregate_features_sql, feature_collection_bytes, GeometryOptions, geometry_options,
+    flatgeobuf_sql, flatgeobuf_bytes, FLATGEOBUF_MEDIA_TYPE, check_flatgeobuf_size, flatgeobuf_too_large,
+    is_size_error,
+)
 
 router = APIRouter()
 
+# Parcel tables combined into one UNION ALL statement
+UNION_BATCH_TABLES = int(os.getenv("UNION_BATCH_TABLES", 200))
+
+# Wire formats accepted by the bulk geometry endpoints
+OUTPUT_FORMAT_PATTERN = "^(geojson|fgb)$"
+
+
+def list_parcel_tables(db: Session, schema: str) -> List[str]:
+    """
+    Return all parcel-like tables (with both geom + pin columns) in a schema,
+    excluding system and analysis tables such as transaction logs, JoinedTable,
+    CAMA-Table, and RunSavedModel results.
+    """
+    return get_catalog(db).parcel_tables(schema)
+
+
+def parcel_properties(row) -> dict:
+    """Feature properties of one /all-barangays row (tagged in SQL)."""
+    return {"pin": row["pin"], "source_schema": row["source_schema"], "source_table": row["source_table"]}
+
+
+# (schema, table) → that table's own query, for retrying a failed batch
+UnionParts = Dict[Tuple[str, str], Tuple[str, dict]]
+
+
+def parcel_union_batches(
+    targets: List[Tuple[str, str]],
+    geom_select: str,
+    geo: Optional[GeometryOptions] = None,
+    batch_size: int = UNION_BATCH_TABLES,
+) -> List[Tuple[str, dict, UnionParts]]:
+    """
+    Combine the per-table parcel queries into UNION ALL statements of up to
+    batch_size tables each, tagging source_schema / source_table in SQL, so a
+    province-wide load costs one round trip per batch instead of one per table.
+    Each batch also carries its per-table queries: when the batch fails they
+    are run one by one, so a single broken table is skipped on its own.
+    """
+    batches = []
+    for start in range(0, len(targets), batch_size):
+        branches = []
+        params = {}
+        parts: UnionParts = {}
+        for i, (schema, table) in enumerate(targets[start:start + batch_size], start):
+            branch_params = {f"schema_{i}": schema, f"table_{i}": table}
+            where = f'WHERE t.geom IS NOT NULL {geo.filter("t.geom")}' if geo else ""
+            branch = f'''
+                SELECT CAST(t."pin" AS text) AS pin, CAST(:schema_{i} AS text) AS source_schema,
+                       CAST(:table_{i} AS text) AS source_table, {geom_select}
+                FROM "{schema}"."{table}" t
+                {where}
+            '''
+            branches.append(branch)
+            params.update(branch_params)
+            parts[(schema, table)] = (branch, branch_params)
+        batches.append(("UNION ALL".join(branches), params, parts))
+    return batches
+
+
+def readable_targets(db: Session, parts: UnionParts) -> List[Tuple[str, str]]:
+    """Tables whose own query runs (geometry evaluated), for rebuilding a failed batch."""
+    ok = []
+    for target, (sql, params) in parts.items():
+        try:
+            db.execute(text(f"SELECT count(geom) FROM ({sql}) s"), params).scalar()
+            ok.append(target)
+        except Exception as e:
+            db.rollback()
+            print(f"⚠️ Skipping {target[0]}.{target[1]}: {e}")
+    return ok
+
+
+def build_flatgeobuf(db: Session, inner_sql: str, params: dict):
+    """
+    Size-check and encode one FlatGeobuf file. Size errors become a 413;
+    other failures roll the session back and propagate to the caller.
+    """
+    try:
+        check_flatgeobuf_size(db, inner_sql, params)
+        return db.execute(text(flatgeobuf_sql(inner_sql)), params).scalar()
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        if is_size_error(e):
+            raise flatgeobuf_too_large("The encoded file is too large.")
+        raise
+
+
+def streamed_batch(batch: Tuple[str, dict, UnionParts]) -> tuple:
+    """FeatureQuery of a union batch, with its per-table queries as fallback."""
+    union_sql, params, parts = batch
+    fallback = {target: (sql, p, parcel_properties) for target, (sql, p) in parts.items()}
+    return (union_sql, params, parcel_properties, fallback)
+
+
 # ==========================================================
 # 🗺️ Load all parcel/road features from selected schemas
 # ==========================================================
 @router.get("/all-barangays")
 def get_all_geom_tables(
     schemas: List[str] = Query(...),
+    aggregate: bool = Query(False, description="Build the FeatureCollection in PostGIS and pass it through"),
+    parallel: bool = Query(False, description="Load each schema concurrently on its own connection"),
+    format: str = Query("geojson", pattern=OUTPUT_FORMAT_PATTERN, description="geojson or fgb (FlatGeobuf)"),
+    geo: GeometryOptions = Depends(geometry_options),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_user_main_db)
 ):
@@ -45,96 +154,94 @@ def get_all_geom_tables(
     if not valid_schemas:
         raise HTTPException(status_code=403, detail="No valid schemas to query")
 
-    all_features = []
-
-    # ✅ Query tables within each valid schema
+    # ✅ Resolve parcel tables up front so listing errors never hit mid-stream
+    targets = []
     for schema in valid_schemas:
         try:
-            # -- Find all tables with both geom + pin columns,
-            #    excluding unwanted system/analysis tables --
-            result = db.execute(
-                text("""
-                    SELECT table_name
-                    FROM information_schema.columns
-                    WHERE table_schema = :schema
-                      AND column_name IN ('geom', 'pin')
-                      AND table_name NOT ILIKE :pattern1
-                      AND table_name NOT ILIKE :pattern2
-                      AND table_name NOT ILIKE :pattern3
-                      AND table_name NOT ILIKE :pattern4
-                      AND table_name NOT ILIKE :pattern5
-                    GROUP BY table_name
-                    HAVING COUNT(DISTINCT column_name) = 2
-                """),
-                {
-                    "schema": schema,
-                    "pattern1": "%transaction_log%",
-                    "pattern2": "%JoinedTable%",
-                    "pattern3": "%CAMA-Table%",
-                    "pattern4": "%RunSavedModel1%",
-                    "pattern5": "%RunSavedModel2%"
-                }
-            )
-            tables = [row[0] for row in result]
+            tables = list_parcel_tables(db, schema)
         except Exception as e:
             print(f"❌ Error listing tables in schema '{schema}': {e}")
             continue
+        targets.extend((schema, table) for table in tables)
 
-        # ✅ Build and execute queries per table
-        for table in tables:
+    # ✅ FlatGeobuf: one file (single header + index) built by PostGIS.
+    # A file cannot be split across batches, so it is not streamed: requests
+    # above FLATGEOBUF_MAX_FEATURES get a 413 instead of a failing bytea.
+    if format == "fgb":
+        if not targets:
+            return Response(content=b"", media_type=FLATGEOBUF_MEDIA_TYPE)
+        geom_select = f'{geo.geometry("t.geom")} AS geom'
+        (inner_sql, params, parts), = parcel_union_batches(targets, geom_select, geo, len(targets))
+        try:
+            fgb = build_flatgeobuf(db, inner_sql, params)
+        except HTTPException:
+            raise
+        except Exception as e:
+            # Unreadable tables fail the sizing EXPLAIN as well; drop them and re-check
+            print(f"⚠️ FlatGeobuf query failed, skipping unreadable tables: {e}")
+            good = readable_targets(db, parts)
+            if not good:
+                return Response(content=b"", media_type=FLATGEOBUF_MEDIA_TYPE)
+            (inner_sql, params, _), = parcel_union_batches(good, geom_select, geo, len(good))
             try:
-                # Retrieve all columns except geom
-                result = db.execute(
-                    text("""
-                        SELECT column_name
-                        FROM information_schema.columns
-                        WHERE table_schema = :schema
-                          AND table_name = :table
-                          AND column_name != 'geom'
-                    """),
-                    {"schema": schema, "table": table}
-                )
-                columns = [row[0] for row in result]
+                fgb = build_flatgeobuf(db, inner_sql, params)
+            except HTTPException:
+                raise
             except Exception as e:
-                print(f"❌ Failed to read columns from {schema}.{table}: {e}")
-                continue
+                print(f"❌ FlatGeobuf query failed: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+        return Response(content=flatgeobuf_bytes(fgb), media_type=FLATGEOBUF_MEDIA_TYPE)
 
-            if not columns:
-                continue
+    # ✅ One worker per schema; each streams its own UNION ALL batches
+    if parallel:
+        by_schema = {}
+        for schema, table in targets:
+            by_schema.setdefault(schema, []).append((schema, table))
 
-            # Build query for features (pin + geometry only)
-            sql = text(f'''
-                SELECT t."pin", ST_AsGeoJSON(t.geom)::json AS geometry
-                FROM "{schema}"."{table}" t
-            ''')
+        if aggregate:
+            statements = [
+                (aggregate_features_sql(inner_sql, geo), params,
+                 [(aggregate_features_sql(sql, geo), p) for sql, p in parts.values()])
+                for schema_targets in by_schema.values()
+                for inner_sql, params, parts in parcel_union_batches(schema_targets, "t.geom")
+            ]
+            parts = parallel_scalars(db.get_bind(), statements)
+            return Response(content=feature_collection_bytes(parts), media_type="application/json")
 
-            try:
-                result = db.execute(sql)
-                rows = result.fetchall()
-
-                for row in rows:
-                    geom = row[1]
-                    if not geom:
-                        continue
-
-                    all_features.append({
-                        "type": "Feature",
-                        "geometry": geom,
-                        "properties": {
-                            "pin": row[0],
-                            "source_schema": schema,
-                            "source_table": table
-                        }
-                    })
+        query_groups = [
+            [streamed_batch(batch)
+             for batch in parcel_union_batches(schema_targets, f'{geo.geojson("t.geom")} AS geometry', geo)]
+            for schema_targets in by_schema.values()
+        ]
+        return StreamingResponse(
+            stream_feature_collection_parallel(db.get_bind(), query_groups),
+            media_type="application/json"
+        )
 
+    # ✅ PostGIS builds the features; bytes are passed straight through
+    if aggregate:
+        parts = []
+        for inner_sql, params, table_parts in parcel_union_batches(targets, "t.geom"):
+            try:
+                parts.append(db.execute(text(aggregate_features_sql(inner_sql, geo)), params).scalar())
             except Exception as e:
-                print(f"⚠️ Query failed on {schema}.{table}: {e}")
-                continue
+                db.rollback()
+                print(f"⚠️ Parcel union query failed, retrying {len(table_parts)} table(s) one by one: {e}")
+                parts.extend(scalars_one_by_one(
+                    db, [(aggregate_features_sql(sql, geo), p) for sql, p in table_parts.values()]
+                ))
+        return Response(content=feature_collection_bytes(parts), media_type="application/json")
+
+    # ✅ One streamed UNION ALL per batch of tables (pin + geometry only)
+    queries = [
+        streamed_batch(batch)
+        for batch in parcel_union_batches(targets, f'{geo.geojson("t.geom")} AS geometry', geo)
+    ]
 
-    return {
-        "type": "FeatureCollection",
-        "features": all_features
-    }
+    return StreamingResponse(
+        stream_feature_collection(db.get_bind(), queries),
+        media_type="application/json"
+    )
 
 
 # ==========================================================
@@ -144,6 +251,9 @@ def get_all_geom_tables(
 def get_single_table(
     schema: str,
     table: str,
+    aggregate: bool = Query(False, description="Build the FeatureCollection in PostGIS and pass it through"),
+    format: str = Query("geojson", pattern=OUTPUT_FORMAT_PATTERN, description="geojson or fgb (FlatGeobuf)"),
+    geo: GeometryOptions = Depends(geometry_options),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_user_main_db)
 ):
@@ -152,49 +262,59 @@ def get_single_table(
     """
     try:
         # ✅ Get all non-geometry columns
-        result = db.execute(
-            text("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = :schema
-                  AND table_name = :table
-                  AND column_name != 'geom'
-            """),
-            {"schema": schema, "table": table}
-        )
-        columns = [row[0] for row in result]
+        columns = [c for c in get_catalog(db).columns(schema, table) if c != "geom"]
 
         if not columns:
+            if format == "fgb":
+                return Response(content=b"", media_type=FLATGEOBUF_MEDIA_TYPE)
             return {"type": "FeatureCollection", "features": []}
 
+        # ✅ FlatGeobuf straight from PostGIS (geometry encoded as binary)
+        if format == "fgb":
+            col_sql = ", ".join(f't."{col}"' for col in columns)
+            inner_sql = f'''
+                SELECT {col_sql}, CAST(:table AS text) AS source_table, CAST(:schema AS text) AS source_schema,
+                       {geo.geometry("t.geom")} AS geom
+                FROM "{schema}"."{table}" t
+                WHERE t.geom IS NOT NULL {geo.filter("t.geom")}
+            '''
+            params = {"schema": schema, "table": table}
+            fgb = build_flatgeobuf(db, inner_sql, params)
+            return Response(content=flatgeobuf_bytes(fgb), media_type=FLATGEOBUF_MEDIA_TYPE)
+
+        # ✅ PostGIS builds the features; bytes are passed straight through
+        if aggregate:
+            inner_sql = f'''
+                SELECT t.*, CAST(:table AS text) AS source_table, CAST(:schema AS text) AS source_schema
+                FROM "{schema}"."{table}" t
+            '''
+            part = db.execute(
+                text(aggregate_features_sql(inner_sql, geo)),
+                {"schema": schema, "table": table}
+            ).scalar()
+            return Response(content=feature_collection_bytes([part]), media_type="application/json")
+
         # ✅ Build query to fetch all data + geometry
         col_sql = ", ".join(f't."{col}"' for col in columns)
-        sql = text(f'''
-            SELECT {col_sql}, ST_AsGeoJSON(t.geom)::json AS geometry
+        sql = f'''
+            SELECT {col_sql}, {geo.geojson("t.geom")} AS geometry
             FROM "{schema}"."{table}" t
-        ''')
-
-        result = db.execute(sql)
-        rows = result.fetchall()
-
-        features = []
-        for row in rows:
-            row_dict = {columns[i]: row[i] for i in range(len(columns))}
-            geometry = row[-1]
-            if not geometry:
-                continue
+            WHERE t.geom IS NOT NULL {geo.filter("t.geom")}
+        '''
 
+        def build_properties(row):
+            row_dict = {col: row[col] for col in columns}
             row_dict["source_table"] = table
             row_dict["source_schema"] = schema
+            return row_dict
 
-            features.append({
-                "type": "Feature",
-                "geometry": geometry,
-                "properties": row_dict
-            })
-
-        return {"type": "FeatureCollection", "features": features}
+        return StreamingResponse(
+            stream_feature_collection(db.get_bind(), [(sql, None, build_properties)]),
+            media_type="application/json"
+        )
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error loading single table {schema}.{table}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
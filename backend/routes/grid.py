@@ -0,0 +1,354 @@
+# ============================================================
+#  📊 GRID ROUTES
+#  Server-side attribute table: filtering, sorting, column
+#  selection and group-by aggregates run in SQL; only the
+#  visible window of rows is returned (JSON or Arrow IPC).
+# ============================================================
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from sqlalchemy import bindparam, text
+from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Tuple
+import io
+import json
+
+from auth.access_control import AccessControl
+from auth.dependencies import get_current_user, get_user_main_db
+from auth.models import User
+from catalog import get_catalog
+from metrics import annotate
+from paging import COUNT_PATTERN, SEARCH_MAX_LIMIT, count_rows
+from search_index import contains_pattern, contains_predicate, escape_like, search_expression
+
+# Optional: Arrow IPC responses need pyarrow
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+router = APIRouter(prefix="/grid", tags=["Attribute Grid"])
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NUMERIC_TYPES = {"int2", "int4", "int8", "float4", "float8", "numeric", "money"}
+INTEGER_TYPES = {"int2", "int4", "int8"}
+# Binary/geometry columns are never sent to the grid
+HIDDEN_TYPES = {"geometry", "geography", "bytea", "raster"}
+NUMERIC_AGGREGATES = {"sum", "avg"}
+DEFAULT_WINDOW = 100
+# Only attribute tables may be browsed; SyncCreds and other internals never
+GRID_TABLES = {"JoinedTable"}
+
+
+# ============================================================
+# 📦 Pydantic Models
+# ============================================================
+
+class GridFilter(BaseModel):
+    field: str
+    op: str = Field("eq", pattern="^(eq|ne|lt|lte|gt|gte|contains|starts_with|in|between|is_null|not_null)$")
+    value: Any = None
+
+
+class GridSort(BaseModel):
+    field: str
+    dir: str = Field("asc", pattern="^(asc|desc)$")
+
+
+class GridAggregate(BaseModel):
+    fn: str = Field(..., pattern="^(count|sum|avg|min|max)$")
+    field: Optional[str] = None  # None with count = count(*)
+
+
+class GridRequest(BaseModel):
+    db_schema: str = Field(alias="schema")
+    table: str = "JoinedTable"
+    columns: Optional[List[str]] = None
+    filters: List[GridFilter] = []
+    sort: List[GridSort] = []
+    group_by: List[str] = []
+    aggregates: List[GridAggregate] = []
+    offset: int = Field(0, ge=0)
+    limit: int = Field(DEFAULT_WINDOW, ge=1)
+    count: str = Field("exact", pattern=COUNT_PATTERN)
+    format: str = Field("json", pattern="^(json|arrow)$")
+
+
+# ============================================================
+# 🧱 SQL builder
+# ============================================================
+
+def coerce_value(value, data_type: str):
+    """
+    Bind a filter value as the column's type: numbers for numeric columns,
+    booleans for bool, text for everything else (Postgres casts the literal),
+    so e.g. pin IN (1, 2) does not become text = integer.
+    """
+    if value is None:
+        return None
+    if isinstance(value, (list, dict)):
+        raise ValueError(f"'{value}' is not a single value")
+    if data_type in NUMERIC_TYPES:
+        if isinstance(value, bool):
+            raise ValueError(f"'{value}' is not a number")
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return int(value) if data_type in INTEGER_TYPES else float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"'{value}' is not a number")
+    if data_type == "bool":
+        if isinstance(value, bool):
+            return value
+        text_value = str(value).strip().lower()
+        if text_value in ("true", "t", "1", "yes"):
+            return True
+        if text_value in ("false", "f", "0", "no"):
+            return False
+        raise ValueError(f"'{value}' is not a boolean")
+    return value if isinstance(value, str) else str(value)
+
+
+def filter_clause(f: GridFilter, types: Dict[str, str], key: str) -> Tuple[str, Dict, List]:
+    """WHERE clause, bind params and expanding bindparams of one filter."""
+    if f.field not in types or types[f.field] in HIDDEN_TYPES:
+        raise ValueError(f"Unknown or hidden filter field '{f.field}'")
+    column = f'"{f.field}"'
+    data_type = types[f.field]
+
+    if f.op == "is_null":
+        return f"{column} IS NULL", {}, []
+    if f.op == "not_null":
+        return f"{column} IS NOT NULL", {}, []
+    if f.value is None:
+        raise ValueError(f"Filter on '{f.field}' ({f.op}) needs a value")
+    if f.op == "contains":
+        return contains_predicate(f.field, key), {key: contains_pattern(f.value)}, []
+    if f.op == "starts_with":
+        return f"{search_expression(f.field)} ILIKE :{key}", {key: f"{escape_like(str(f.value))}%"}, []
+    if f.op == "in":
+        values = f.value if isinstance(f.value, list) else [f.value]
+        if not values:
+            return "FALSE", {}, []
+        return (
+            f"{column} IN :{key}",
+            {key: [coerce_value(v, data_type) for v in values]},
+            [bindparam(key, expanding=True)],
+        )
+    if f.op == "between":
+        if not isinstance(f.value, list) or len(f.value) != 2:
+            raise ValueError(f"between on '{f.field}' needs [low, high]")
+        return (
+            f"{column} BETWEEN :{key}_lo AND :{key}_hi",
+            {f"{key}_lo": coerce_value(f.value[0], data_type), f"{key}_hi": coerce_value(f.value[1], data_type)},
+            [],
+        )
+    operator = {"eq": "=", "ne": "<>", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}[f.op]
+    return f"{column} {operator} :{key}", {key: coerce_value(f.value, data_type)}, []
+
+
+def build_grid_query(body: GridRequest, types: Dict[str, str]) -> Dict:
+    """
+    Data query for the requested window plus the pieces needed to count it:
+    projection, WHERE, GROUP BY/aggregates, ORDER BY (id as tie-breaker so
+    windows are stable) and LIMIT/OFFSET.
+    """
+    visible = [c for c, t in types.items() if t not in HIDDEN_TYPES]
+
+    where, params, bindparams = [], {}, []
+    for i, f in enumerate(body.filters):
+        clause, clause_params, clause_binds = filter_clause(f, types, f"f{i}")
+        where.append(clause)
+        params.update(clause_params)
+        bindparams.extend(clause_binds)
+
+    grouped = bool(body.group_by or body.aggregates)
+    if grouped:
+        for field in body.group_by:
+            if field not in visible:
+                raise ValueError(f"Cannot group by '{field}'")
+        select, output = [f'"{g}"' for g in body.group_by], list(body.group_by)
+        for agg in body.aggregates or [GridAggregate(fn="count")]:
+            if agg.field is None:
+                if agg.fn != "count":
+                    raise ValueError(f"{agg.fn} needs a field")
+                alias = "count"
+                select.append('count(*) AS "count"')
+            else:
+                if agg.field not in visible:
+                    raise ValueError(f"Unknown aggregate field '{agg.field}'")
+                if agg.fn in NUMERIC_AGGREGATES and types[agg.field] not in NUMERIC_TYPES:
+                    raise ValueError(f"{agg.fn} needs a numeric field, '{agg.field}' is {types[agg.field]}")
+                alias = f"{agg.fn}_{agg.field}"
+                select.append(f'{agg.fn}("{agg.field}") AS "{alias}"')
+            output.append(alias)
+        tie_breaker = [f'"{g}"' for g in body.group_by]
+    else:
+        columns = body.columns or visible
+        unknown = [c for c in columns if c not in visible]
+        if unknown:
+            raise ValueError(f"Unknown or hidden column(s): {', '.join(unknown)}")
+        select, output = [f'"{c}"' for c in columns], list(columns)
+        tie_breaker = ['"id"'] if "id" in types else []
+
+    order = []
+    for s in body.sort:
+        if s.field not in output:
+            raise ValueError(f"Cannot sort by '{s.field}' (not in the result)")
+        order.append(f'"{s.field}" {s.dir.upper()}')
+    order += [t for t in tie_breaker if t not in [o.rsplit(" ", 1)[0] for o in order]]
+
+    base = f'FROM "{body.db_schema}"."{body.table}"'
+    if where:
+        base += " WHERE " + " AND ".join(where)
+    if grouped and body.group_by:
+        base += " GROUP BY " + ", ".join(f'"{g}"' for g in body.group_by)
+
+    sql = f"SELECT {', '.join(select)} {base}"
+    if order:
+        sql += " ORDER BY " + ", ".join(order)
+    sql += " LIMIT :_limit OFFSET :_offset"
+
+    return {
+        "sql": sql,
+        "base": base,
+        "where": where,
+        "params": params,
+        "bindparams": bindparams,
+        "grouped": grouped,
+        "columns": output,
+    }
+
+
+def grid_total(db: Session, body: GridRequest, query: Dict) -> Tuple[Optional[int], bool]:
+    """Rows (or groups) matching the filters, exact or planner-estimated."""
+    if body.count == "none":
+        return None, False
+    if not query["grouped"] and not query["bindparams"]:
+        return count_rows(db, body.db_schema, body.table, query["where"], query["params"], body.count)
+
+    inner = f"SELECT 1 {query['base']}"
+    if body.count == "approx":
+        plan = db.execute(
+            text(f"EXPLAIN (FORMAT JSON) {inner}").bindparams(*query["bindparams"]), query["params"]
+        ).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]["Plan"]["Plan Rows"]
+        if estimate and estimate > 0:
+            return int(estimate), True
+    total = db.execute(
+        text(f"SELECT count(*) FROM ({inner}) g").bindparams(*query["bindparams"]), query["params"]
+    ).scalar()
+    return int(total), False
+
+
+def arrow_response(rows: List[Dict], columns: List[str], meta: Dict) -> Response:
+    """Arrow IPC stream of the window; totals travel in schema metadata and headers."""
+    table = pa.Table.from_pylist(rows) if rows else pa.table({c: pa.array([], pa.null()) for c in columns})
+    table = table.replace_schema_metadata({k: json.dumps(v) for k, v in meta.items()})
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    headers = {"X-Total-Count": "" if meta["total"] is None else str(meta["total"])}
+    if meta["total_is_estimate"]:
+        headers["X-Total-Is-Estimate"] = "true"
+    return Response(content=sink.getvalue(), media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+
+def require_grid_access(schema: str, table: str, current_user: User):
+    """403 unless the user is approved, may use the schema and the table is a grid table."""
+    access_info = AccessControl.check_user_access(current_user)
+    if access_info["status"] == "pending_approval":
+        raise HTTPException(status_code=403, detail=access_info["message"])
+
+    if not AccessControl.validate_schema_access(schema, current_user):
+        raise HTTPException(status_code=403, detail=f"Access denied to schema: {schema}")
+
+    if table not in GRID_TABLES:
+        raise HTTPException(status_code=403, detail=f"Table '{table}' is not available in the grid")
+
+
+# ============================================================
+# 🧩 1. COLUMNS (grid header)
+# ============================================================
+
+@router.get("/columns")
+def grid_columns(
+    schema: str = Query(..., description="Municipal schema name, e.g., PH0403406"),
+    table: str = Query("JoinedTable"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_main_db)
+):
+    """Visible columns with their types (numeric ones can be summed/averaged)."""
+    require_grid_access(schema, table, current_user)
+
+    catalog = get_catalog(db)
+    if not catalog.has_table(schema, table):
+        raise HTTPException(status_code=404, detail=f"No {table} found in schema '{schema}'")
+    types = catalog.column_types(schema, table)
+    return {
+        "status": "success",
+        "columns": [
+            {"name": c, "type": t, "numeric": t in NUMERIC_TYPES}
+            for c, t in types.items() if t not in HIDDEN_TYPES
+        ],
+        "arrow": pa is not None,
+    }
+
+
+# ============================================================
+# 📊 2. DATA WINDOW
+# ============================================================
+
+@router.post("/data")
+def grid_data(
+    body: GridRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_main_db)
+):
+    """
+    One window of the attribute table with filters, sort, column selection
+    and group-by aggregates applied in SQL. format=arrow returns an Arrow IPC
+    stream (requires pyarrow on the server).
+    """
+    require_grid_access(body.db_schema, body.table, current_user)
+
+    if body.format == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow format is not available (pyarrow is not installed)")
+
+    try:
+        catalog = get_catalog(db)
+        if not catalog.has_table(body.db_schema, body.table):
+            raise HTTPException(status_code=404, detail=f"No {body.table} found in schema '{body.db_schema}'")
+
+        limit = min(body.limit, SEARCH_MAX_LIMIT)
+        try:
+            query = build_grid_query(body, catalog.column_types(body.db_schema, body.table))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        params = {**query["params"], "_limit": limit, "_offset": body.offset}
+        result = db.execute(text(query["sql"]).bindparams(*query["bindparams"]), params)
+        rows = [dict(row._mapping) for row in result]
+        total, estimated = grid_total(db, body, query)
+
+        annotate(schema=body.db_schema, table=body.table, rows=len(rows), offset=body.offset)
+        meta = {
+            "offset": body.offset,
+            "limit": limit,
+            "returned": len(rows),
+            "total": total,
+            "total_is_estimate": estimated,
+            "grouped": query["grouped"],
+        }
+        if body.format == "arrow":
+            return arrow_response(rows, query["columns"], meta)
+        return {"status": "success", "columns": query["columns"], "rows": rows, **meta}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Grid query error for {body.db_schema}.{body.table}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,15 +1,25 @@
-from fastapi import APIRouter, HTTPException, Depends, Request
-from sqlalchemy.orm import Session
-from psycopg2.extras import RealDictCursor
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from psycopg.rows import dict_row
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any
 import json
 
-from auth.dependencies import get_user_main_db, get_current_user
+from auth.dependencies import get_user_main_async_db, get_current_user
+from async_db import raw_connection, raw_cursor
 from auth.models import User
+from autocomplete import autocomplete_index
+from geojson_utils import aggregate_features_sql, feature_collection_bytes, GeometryOptions, geometry_options
 
 router = APIRouter()
 
+# Landmarks are not served as vector tiles, so writes only refresh name suggestions
+def update_landmark_suggestions(current_user: User, schema: str, removed=(), added=()):
+    autocomplete_index.apply(
+        getattr(current_user, "actual_dbname", None), schema, "Landmarks", removed=removed, added=added
+    )
+
 
 # ============================================================
 # 📦 Pydantic Models
@@ -49,20 +59,32 @@ class BarangayQuery(BaseModel):
 @router.get("/landmarks/{schema}")
 async def get_landmarks(
     schema: str,
-    db: Session = Depends(get_user_main_db),
+    aggregate: bool = Query(False, description="Build the FeatureCollection in PostGIS and pass it through"),
+    geo: GeometryOptions = Depends(geometry_options),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Fetch all landmarks for a given schema."""
     print(f"🔍 Fetching landmarks for schema={schema} by user={current_user.user_name}")
-    conn = db.connection().connection
+    conn = await raw_connection(db)
 
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(f'''
-                SELECT id, name, type, barangay, descr, ST_AsGeoJSON(geom)::json AS geometry
+        # ✅ PostGIS builds the features; bytes are passed straight through
+        if aggregate:
+            async with raw_cursor(conn) as cur:
+                await cur.execute(aggregate_features_sql(
+                    f'SELECT id, name, type, barangay, descr, geom FROM "{schema}"."Landmarks"', geo
+                ))
+                part = (await cur.fetchone())[0]
+            return Response(content=feature_collection_bytes([part]), media_type="application/json")
+
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
+            await cur.execute(f'''
+                SELECT id, name, type, barangay, descr, {geo.geojson("geom")}::json AS geometry
                 FROM "{schema}"."Landmarks"
+                {geo.where("geom")}
             ''')
-            rows = cur.fetchall()
+            rows = await cur.fetchall()
 
         features = [
             {
@@ -94,16 +116,16 @@ async def get_landmarks(
 @router.post("/landmarks/insert")
 async def insert_landmark(
     body: LandmarkInsert,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Insert a new landmark into the schema's Landmarks table."""
     print(f"📝 Insert landmark request by {current_user.user_name} in schema={body.db_schema}")
-    conn = db.connection().connection
+    conn = await raw_connection(db)
 
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
+            await cur.execute(
                 f"""
                 INSERT INTO "{body.db_schema}"."Landmarks" (name, type, barangay, descr, geom)
                 VALUES (%s, %s, %s, %s, ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326))
@@ -117,15 +139,16 @@ async def insert_landmark(
                     json.dumps(body.geom),
                 ),
             )
-            row = cur.fetchone()
-            conn.commit()
+            row = await cur.fetchone()
+            await conn.commit()
 
         new_id = row["id"] if row else None
+        update_landmark_suggestions(current_user, body.db_schema, added=[{"name": body.name}])
         print(f"✅ Inserted landmark id={new_id} by {current_user.user_name}")
         return {"status": "success", "id": new_id}
 
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         print(f"❌ Landmark insert failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -137,12 +160,12 @@ async def insert_landmark(
 @router.put("/landmarks/update-by-fields")
 async def update_landmark(
     body: LandmarkUpdateByFields,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Update landmark attributes by ID."""
     print(f"📝 Update landmark request by {current_user.user_name}: id={body.id}, schema={body.db_schema}")
-    conn = db.connection().connection
+    conn = await raw_connection(db)
 
     try:
         set_clauses = []
@@ -161,15 +184,27 @@ async def update_landmark(
             WHERE id = %s
         '''
 
-        with conn.cursor() as cur:
-            cur.execute(sql, values)
-            conn.commit()
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
+            # Previous name, so suggestions can be updated in place
+            old_row = None
+            if "name" in body.updated:
+                await cur.execute(
+                    f'SELECT name FROM "{body.db_schema}"."Landmarks" WHERE id = %s', (body.id,)
+                )
+                old_row = await cur.fetchone()
+            await cur.execute(sql, values)
+            await conn.commit()
+
+        if old_row is not None:
+            update_landmark_suggestions(
+                current_user, body.db_schema, removed=[old_row], added=[{"name": body.updated["name"]}]
+            )
 
         print(f"✅ Updated landmark id={body.id} by {current_user.user_name}")
         return {"status": "success", "updated_id": body.id}
 
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         print(f"❌ Landmark update failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -181,29 +216,32 @@ async def update_landmark(
 @router.post("/landmarks/remove")
 async def remove_landmarks(
     body: LandmarkRemove,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Delete multiple landmarks by IDs."""
     print(f"🗑️ Remove landmarks by {current_user.user_name} from schema={body.db_schema}, ids={body.ids}")
-    conn = db.connection().connection
+    conn = await raw_connection(db)
 
     try:
         if not body.ids:
             raise HTTPException(status_code=400, detail="No IDs provided")
 
-        with conn.cursor() as cur:
-            cur.execute(
-                f'DELETE FROM "{body.db_schema}"."Landmarks" WHERE id = ANY(%s)',
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
+            await cur.execute(
+                f'DELETE FROM "{body.db_schema}"."Landmarks" WHERE id = ANY(%s) RETURNING name',
                 (body.ids,),
             )
-            conn.commit()
+            removed_rows = await cur.fetchall()
+            await conn.commit()
+
+        update_landmark_suggestions(current_user, body.db_schema, removed=removed_rows)
 
         print(f"✅ Removed landmarks {body.ids} by {current_user.user_name}")
         return {"status": "success", "removed_ids": body.ids}
 
     except Exception as e:
-        conn.rollback()
+        await conn.rollback()
         print(f"❌ Landmark removal failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -215,16 +253,16 @@ async def remove_landmarks(
 @router.post("/find-barangay")
 async def find_barangay(
     body: BarangayQuery,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Find which barangay boundary polygon contains a given lat/lng point."""
     print(f"📍 Find barangay request by {current_user.user_name} in schema={body.db_schema} at lat={body.lat}, lng={body.lng}")
-    conn = db.connection().connection
+    conn = await raw_connection(db)
 
     try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
+            await cur.execute(
                 f"""
                 SELECT barangay
                 FROM "{body.db_schema}"."BarangayBoundary"
@@ -233,7 +271,7 @@ async def find_barangay(
                 """,
                 (float(body.lng), float(body.lat)),
             )
-            row = cur.fetchone()
+            row = await cur.fetchone()
 
         if not row:
             print(f"⚠️ No barangay found for this point ({body.lat}, {body.lng})")
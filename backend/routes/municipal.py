@@ -1,7 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from auth.dependencies import get_user_main_db
+from catalog import catalog_key
+from db import get_engine_database_name
+from geojson_utils import aggregate_features_sql, feature_collection_bytes, GeometryOptions, geometry_options
+from snapshots import snapshot_store, snapshot_response
+import json
 
 router = APIRouter()
 
@@ -9,17 +16,20 @@ router = APIRouter()
 # 🗺️ MUNICIPAL BOUNDS (from `bounds` column)
 # ==========================================================
 @router.get("/municipal-bounds")
-def get_municipal_bounds(schema: str, db: Session = Depends(get_user_main_db)):
+def get_municipal_bounds(
+    schema: str,
+    request: Request,
+    db: Session = Depends(get_user_main_db)
+):
     """
     Fetch bounding box (xmin, ymin, xmax, ymax) from the 'bounds' column
     of PH_MunicipalMap inside the given schema.
+    Served from a versioned in-memory snapshot (ETag / If-None-Match → 304).
     """
     mun_code = schema.split("_")[0] if "_" in schema else schema
 
-    try:
-        current_db = db.execute(text("SELECT current_database()")).scalar()
-        print(f"📌 Connected to DB={current_db}, schema={schema}, mun_code={mun_code}")
-
+    def build() -> bytes:
+        print(f"📌 Building bounds snapshot for schema={schema}, mun_code={mun_code}")
         query = text(f"""
             SELECT bounds
             FROM "{schema}"."PH_MunicipalMap"
@@ -39,8 +49,16 @@ def get_municipal_bounds(schema: str, db: Session = Depends(get_user_main_db)):
             raise HTTPException(status_code=500, detail="Invalid bounds format.")
 
         print(f"🗺️ Bounding box for {schema}: {parts}")
-        return {"status": "success", "bounds": parts}
+        return json.dumps({"status": "success", "bounds": parts}).encode("utf-8")
 
+    try:
+        snapshot = snapshot_store.get_or_build(
+            (catalog_key(db), "municipal-bounds", schema, None), build
+        )
+        return snapshot_response(request, snapshot)
+
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error fetching bounds for {schema}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -50,47 +68,55 @@ def get_municipal_bounds(schema: str, db: Session = Depends(get_user_main_db)):
 # 🧭 MUNICIPAL BOUNDARIES (Barangay + Section)
 # ==========================================================
 @router.get("/municipal-boundaries")
-def get_municipal_boundaries(schema: str, db: Session = Depends(get_user_main_db)):
+def get_municipal_boundaries(
+    schema: str,
+    request: Request,
+    aggregate: bool = Query(False, description="Build the FeatureCollections in PostGIS and pass them through"),
+    geo: GeometryOptions = Depends(geometry_options),
+    db: Session = Depends(get_user_main_db)
+):
     """
     Fetch Barangay and Section boundaries (GeoJSON) directly from the schema.
     Returns both in a single response.
+    Requests without a bbox are served from a per-zoom/precision snapshot
+    (ETag / If-None-Match → 304) of the same body; only bbox queries hit the tables.
     """
     try:
-        current_db = db.execute(text("SELECT current_database()")).scalar()
+        build = municipal_boundaries_body if aggregate else legacy_boundaries_body
+        if geo.bbox is None:
+            snapshot = snapshot_store.get_or_build(
+                (catalog_key(db), "municipal-boundaries", schema, (geo.zoom, geo.precision, aggregate)),
+                lambda: build(db, schema, geo),
+            )
+            return snapshot_response(request, snapshot)
+
+        current_db = get_engine_database_name(db.get_bind())
         print(f"📌 Connected to DB={current_db}, schema={schema} (GET municipal-boundaries)")
+        return Response(content=build(db, schema, geo), media_type="application/json")
 
-        results = {"barangay": None, "section": None}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Error fetching municipal boundaries for {schema}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        # --- Barangay Boundary ---
-        try:
-            query_barangay = text(f'''
-                SELECT *, ST_AsGeoJSON(geom)::json AS geometry
-                FROM "{schema}"."BarangayBoundary"
-            ''')
-            barangay_rows = db.execute(query_barangay).mappings().all()
-            results["barangay"] = {
-                "type": "FeatureCollection",
-                "features": [
-                    {
-                        "type": "Feature",
-                        "geometry": row["geometry"],
-                        "properties": {k: v for k, v in row.items() if k not in ("geom", "geometry")}
-                    }
-                    for row in barangay_rows
-                ]
-            }
-            print(f"✅ Loaded {len(barangay_rows)} barangay features.")
-        except Exception as e:
-            print(f"⚠️ BarangayBoundary fetch failed for {schema}: {e}")
 
-        # --- Section Boundary ---
+def legacy_boundaries_body(db: Session, schema: str, geo: GeometryOptions) -> bytes:
+    """
+    Encode the /municipal-boundaries payload the original way: rows fetched
+    and turned into Features in Python (null geometries and all properties kept).
+    """
+    results = {"barangay": None, "section": None}
+
+    for key, table in (("barangay", "BarangayBoundary"), ("section", "SectionBoundary")):
         try:
-            query_section = text(f'''
-                SELECT *, ST_AsGeoJSON(geom)::json AS geometry
-                FROM "{schema}"."SectionBoundary"
+            query = text(f'''
+                SELECT *, {geo.geojson("geom")}::json AS geometry
+                FROM "{schema}"."{table}"
+                {geo.where("geom")}
             ''')
-            section_rows = db.execute(query_section).mappings().all()
-            results["section"] = {
+            rows = db.execute(query).mappings().all()
+            results[key] = {
                 "type": "FeatureCollection",
                 "features": [
                     {
@@ -98,21 +124,48 @@ def get_municipal_boundaries(schema: str, db: Session = Depends(get_user_main_db
                         "geometry": row["geometry"],
                         "properties": {k: v for k, v in row.items() if k not in ("geom", "geometry")}
                     }
-                    for row in section_rows
+                    for row in rows
                 ]
             }
-            print(f"✅ Loaded {len(section_rows)} section features.")
+            print(f"✅ Loaded {len(rows)} {key} features.")
         except Exception as e:
-            print(f"⚠️ SectionBoundary fetch failed for {schema}: {e}")
+            db.rollback()
+            print(f"⚠️ {table} fetch failed for {schema}: {e}")
 
-        if not results["barangay"] and not results["section"]:
-            raise HTTPException(
-                status_code=404,
-                detail=f"No BarangayBoundary or SectionBoundary found for schema={schema}"
-            )
+    if not results["barangay"] and not results["section"]:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No BarangayBoundary or SectionBoundary found for schema={schema}"
+        )
 
-        return {"status": "success", **results}
+    # Same encoding FastAPI applies to a returned dict
+    return json.dumps(jsonable_encoder({"status": "success", **results})).encode("utf-8")
 
-    except Exception as e:
-        print(f"❌ Error fetching municipal boundaries for {schema}: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+
+def municipal_boundaries_body(db: Session, schema: str, geo: GeometryOptions) -> bytes:
+    """
+    Encode the /municipal-boundaries payload with each FeatureCollection built
+    by PostGIS and spliced in without decoding (used for aggregate mode and snapshots).
+    """
+    collections = {}
+    for key, table in (("barangay", "BarangayBoundary"), ("section", "SectionBoundary")):
+        try:
+            part = db.execute(
+                text(aggregate_features_sql(f'SELECT * FROM "{schema}"."{table}"', geo))
+            ).scalar()
+            collections[key] = feature_collection_bytes([part])
+        except Exception as e:
+            db.rollback()
+            collections[key] = b"null"
+            print(f"⚠️ {table} fetch failed for {schema}: {e}")
+
+    if collections["barangay"] == b"null" and collections["section"] == b"null":
+        raise HTTPException(
+            status_code=404,
+            detail=f"No BarangayBoundary or SectionBoundary found for schema={schema}"
+        )
+
+    return (
+        b'{"status":"success","barangay":' + collections["barangay"]
+        + b',"section":' + collections["section"] + b"}"
+    )
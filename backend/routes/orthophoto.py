@@ -2,6 +2,7 @@ from fastapi import APIRouter, HTTPException, Request, Depends
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 from auth.dependencies import get_user_main_db
+from catalog import get_catalog, invalidate_catalog
 
 router = APIRouter()
 
@@ -121,6 +122,9 @@ async def save_orthophoto_config(request: Request, db: Session = Depends(get_use
 # ==========================================================
 def create_table_if_missing(db: Session, schema: str):
     """Ensure the 'Orthophotos' table exists for this schema."""
+    if get_catalog(db).has_table(schema, "Orthophotos"):
+        return
+
     try:
         db.execute(text(f"""
             CREATE TABLE IF NOT EXISTS "{schema}"."Orthophotos" (
@@ -130,6 +134,7 @@ def create_table_if_missing(db: Session, schema: str):
             );
         """))
         db.commit()
+        invalidate_catalog(db)
         print(f"🧱 Ensured {schema}.Orthophotos exists.")
     except Exception as e:
         db.rollback()
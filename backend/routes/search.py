@@ -6,8 +6,25 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.orm import Session
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
-from auth.dependencies import get_user_main_db
+from auth.dependencies import (
+    get_current_admin, get_current_user, get_current_user_or_admin, get_user_main_db, get_user_main_async_db,
+)
+from auth.access_control import AccessControl
+from auth.models import User
+from catalog import get_catalog
+from db import get_user_database_session
+from paging import COUNT_PATTERN, PageRequest, count_rows, page_response, page_sql
+from search_index import (
+    ROAD_TABLES, UNIFIED_LAYERS, build_filters, build_indexes, contains_pattern, contains_predicate,
+    escape_like, index_status, trigram_schema, unified_layer_query, unified_result,
+)
+from async_db import session_database_name
+from metrics import annotate
+from autocomplete import AUTOCOMPLETE_KINDS, KIND_PATTERN, autocomplete_index
+import asyncio
 
 router = APIRouter(prefix="/search", tags=["Search Tools"])
 
@@ -18,18 +35,17 @@ router = APIRouter(prefix="/search", tags=["Search Tools"])
 @router.get("/attribute-table")
 def get_attribute_table(
     schema: str = Query(..., description="Municipal schema name, e.g., PH0403406"),
+    limit: Optional[int] = Query(None, ge=0, description="Page size (default SEARCH_DEFAULT_LIMIT; 0 for all rows)"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    fields: Optional[str] = Query(None, description="Comma-separated columns to return"),
+    count: str = Query("none", pattern=COUNT_PATTERN, description="Total rows: none, exact or approx"),
     db: Session = Depends(get_user_main_db)
 ):
     try:
         print(f"📂 Fetching JoinedTable for schema: {schema}")
 
-        check_sql = text("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.tables
-                WHERE table_schema = :schema AND table_name = 'JoinedTable'
-            );
-        """)
-        exists = db.execute(check_sql, {"schema": schema}).scalar()
+        catalog = get_catalog(db)
+        exists = catalog.has_table(schema, "JoinedTable")
 
         if not exists:
             print(f"⚠️ No JoinedTable found in schema '{schema}'")
@@ -39,13 +55,21 @@ def get_attribute_table(
                 "data": []
             }
 
-        query = text(f'SELECT * FROM "{schema}"."JoinedTable"')
-        result = db.execute(query)
+        try:
+            page = PageRequest(limit, cursor, fields, count)
+            sql, params = page_sql(schema, "JoinedTable", catalog.columns(schema, "JoinedTable"), [], {}, page)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        result = db.execute(text(sql), params)
         rows = [dict(row._mapping) for row in result]
+        total, estimated = count_rows(db, schema, "JoinedTable", [], {}, page.count)
 
         print(f"✅ Retrieved {len(rows)} records from {schema}.JoinedTable")
-        return {"status": "success", "data": rows, "count": len(rows)}
+        return page_response(rows, page, total, estimated)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error fetching JoinedTable for {schema}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -56,7 +80,7 @@ def get_attribute_table(
 # ============================================================
 
 @router.post("/property-search")
-async def property_search(request: Request, db: Session = Depends(get_user_main_db)):
+async def property_search(request: Request, db: AsyncSession = Depends(get_user_main_async_db)):
     data = await request.json()
     schema = data.get("schema")
     filters = data.get("filters", {})
@@ -65,27 +89,30 @@ async def property_search(request: Request, db: Session = Depends(get_user_main_
         raise HTTPException(status_code=400, detail="Schema is required for property search.")
 
     try:
-        where_clauses = []
-        params = {}
-
-        for i, (field, value) in enumerate(filters.items()):
-            if not value:
-                continue
-            key = f"v{i}"
-            where_clauses.append(f'LOWER("{field}") LIKE :{key}')
-            params[key] = f"%{value.lower()}%"
-
-        sql = f'SELECT * FROM "{schema}"."JoinedTable"'
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
-
-        query = text(sql)
-        result = db.execute(query, params)
+        catalog = await db.run_sync(get_catalog)
+        if not catalog.has_table(schema, "JoinedTable"):
+            raise HTTPException(status_code=404, detail=f"No JoinedTable found in schema '{schema}'")
+
+        # ILIKE on ("field"::text) is served by the trigram indexes (search_index.py)
+        columns = catalog.columns(schema, "JoinedTable")
+        try:
+            where_clauses, params = build_filters(filters, columns)
+            page = PageRequest.from_body(data)
+            sql, page_params = page_sql(schema, "JoinedTable", columns, where_clauses, params, page)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        result = await db.execute(text(sql), page_params)
         rows = [dict(row._mapping) for row in result]
+        total, estimated = await db.run_sync(
+            lambda s: count_rows(s, schema, "JoinedTable", where_clauses, params, page.count)
+        )
 
         print(f"✅ Property search in {schema}: {len(rows)} result(s)")
-        return {"status": "success", "data": rows, "count": len(rows)}
+        return page_response(rows, page, total, estimated)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Property search error for {schema}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -96,7 +123,7 @@ async def property_search(request: Request, db: Session = Depends(get_user_main_
 # ============================================================
 
 @router.post("/road-search")
-async def road_search(request: Request, db: Session = Depends(get_user_main_db)):
+async def road_search(request: Request, db: AsyncSession = Depends(get_user_main_async_db)):
     """
     Searches for roads by name, type, or classification.
     Works for both 'RoadNetwork' and 'RoadInfo' tables.
@@ -110,54 +137,45 @@ async def road_search(request: Request, db: Session = Depends(get_user_main_db))
 
     try:
         # 🔍 Check which road table exists
-        table_check = text("""
-            SELECT table_name FROM information_schema.tables
-            WHERE table_schema = :schema AND table_name IN ('RoadNetwork', 'RoadInfo')
-            LIMIT 1;
-        """)
-        result = db.execute(table_check, {"schema": schema}).fetchone()
-
-        if not result:
+        catalog = await db.run_sync(get_catalog)
+        table_name = next(
+            (t for t in ROAD_TABLES if catalog.has_table(schema, t)), None
+        )
+
+        if not table_name:
             raise HTTPException(status_code=404, detail=f"No road table found in schema '{schema}'")
 
-        table_name = result[0]
         print(f"🛣️ Using road table: {table_name}")
 
         # 🧩 Build WHERE clause dynamically
-        where_clauses = []
-        params = {}
-
-        for i, (field, value) in enumerate(filters.items()):
-            if not value:
-                continue
-            key = f"v{i}"
-            where_clauses.append(f'(LOWER("{field}") LIKE :{key})')
-            params[key] = f"%{value.lower()}%"
+        columns = catalog.columns(schema, table_name)
+        try:
+            where_clauses, params = build_filters(filters, columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
         # 🧭 If only road_name provided, search across name, road_type, and classification
         if not where_clauses and "road_name" in filters:
             val = filters.get("road_name")
             if val:
-                params["val"] = f"%{val.lower()}%"
-                where_clauses = [
-                    '(LOWER("road_name") LIKE :val OR LOWER("road_type") LIKE :val '
-                    'OR LOWER("type") LIKE :val OR LOWER("classification") LIKE :val)'
-                ]
-
-        sql = f'SELECT * FROM "{schema}"."{table_name}"'
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
-
-        query = text(sql)
-        result = db.execute(query, params)
+                params["val"] = contains_pattern(val)
+                fields = [f for f in ("road_name", "road_type", "type", "classification") if f in columns]
+                where_clauses = ["(" + " OR ".join(contains_predicate(f, "val") for f in fields) + ")"]
+
+        try:
+            page = PageRequest.from_body(data)
+            sql, page_params = page_sql(schema, table_name, columns, where_clauses, params, page)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        result = await db.execute(text(sql), page_params)
         rows = [dict(row._mapping) for row in result]
+        total, estimated = await db.run_sync(
+            lambda s: count_rows(s, schema, table_name, where_clauses, params, page.count)
+        )
 
         print(f"✅ Road search in {schema}.{table_name}: {len(rows)} result(s)")
-        # ✅ Log first record for debugging column names
-        if rows:
-            print(f"📋 Sample fields: {list(rows[0].keys())}")
-
-        return {"status": "success", "data": rows, "count": len(rows)}
+        return page_response(rows, page, total, estimated)
 
     except HTTPException:
         raise
@@ -171,7 +189,7 @@ async def road_search(request: Request, db: Session = Depends(get_user_main_db))
 # ============================================================
 
 @router.post("/landmark-search")
-async def landmark_search(request: Request, db: Session = Depends(get_user_main_db)):
+async def landmark_search(request: Request, db: AsyncSession = Depends(get_user_main_async_db)):
     data = await request.json()
     schema = data.get("schema")
     filters = data.get("filters", {})
@@ -180,27 +198,236 @@ async def landmark_search(request: Request, db: Session = Depends(get_user_main_
         raise HTTPException(status_code=400, detail="Schema is required for landmark search.")
 
     try:
-        where_clauses = []
-        params = {}
+        catalog = await db.run_sync(get_catalog)
+        if not catalog.has_table(schema, "Landmarks"):
+            raise HTTPException(status_code=404, detail=f"No Landmarks table found in schema '{schema}'")
+
+        columns = catalog.columns(schema, "Landmarks")
+        try:
+            where_clauses, params = build_filters(filters, columns)
+            page = PageRequest.from_body(data)
+            sql, page_params = page_sql(schema, "Landmarks", columns, where_clauses, params, page)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        result = await db.execute(text(sql), page_params)
+        rows = [dict(row._mapping) for row in result]
+        total, estimated = await db.run_sync(
+            lambda s: count_rows(s, schema, "Landmarks", where_clauses, params, page.count)
+        )
+
+        print(f"✅ Landmark search in {schema}: {len(rows)} result(s)")
+        return page_response(rows, page, total, estimated)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Landmark search error for {schema}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        for i, (field, value) in enumerate(filters.items()):
-            if not value:
+
+# ============================================================
+# 🧭 5. UNIFIED SEARCH (parcels, roads, landmarks, barangays)
+# ============================================================
+
+@router.get("/unified")
+async def unified_search(
+    schema: str = Query(..., description="Municipal schema name, e.g., PH0403406"),
+    q: str = Query(..., min_length=2, description="Search text"),
+    limit: int = Query(10, ge=1, le=50, description="Number of ranked results"),
+    layers: Optional[str] = Query(None, description="Comma-separated subset of parcel,road,landmark,barangay"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_main_async_db)
+):
+    """
+    One omnibox query across layers. Each layer runs on its own pooled
+    connection in parallel, hits its trigram indexes, and the merged hits are
+    ranked by word similarity with centroids for fly-to.
+    """
+    require_schema_access(schema, current_user)
+
+    selected = [l.strip() for l in layers.split(",") if l.strip()] if layers else list(UNIFIED_LAYERS)
+    unknown = [l for l in selected if l not in UNIFIED_LAYERS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown layer(s): {', '.join(unknown)}")
+
+    q = q.strip()
+    try:
+        catalog = await db.run_sync(get_catalog)
+        trgm = await db.run_sync(trigram_schema)
+        queries = [
+            query for query in (unified_layer_query(catalog, schema, layer, trgm) for layer in selected)
+            if query is not None
+        ]
+        params = {"q": q, "pattern": contains_pattern(q), "prefix": f"{escape_like(q)}%", "limit": limit}
+        engine = db.bind
+
+        async def run(query):
+            async with engine.connect() as conn:
+                result = await conn.execute(text(query["sql"]), params)
+                return [dict(row._mapping) for row in result]
+
+        outcomes = await asyncio.gather(*(run(query) for query in queries), return_exceptions=True)
+
+        hits, errors = [], {}
+        for query, outcome in zip(queries, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"⚠️ Unified search on {schema}.{query['table']} failed: {outcome}")
+                errors[query["layer"]] = str(outcome).splitlines()[0]
                 continue
-            key = f"v{i}"
-            where_clauses.append(f'LOWER("{field}") LIKE :{key}')
-            params[key] = f"%{value.lower()}%"
+            hits.extend(unified_result(query, row, q) for row in outcome)
+        hits.sort(key=lambda h: h["score"], reverse=True)
+        hits = hits[:limit]
+
+        annotate(schema=schema, layers=len(queries), results=len(hits))
+        response = {
+            "status": "success",
+            "query": q,
+            "ranking": "trigram" if trgm else "prefix",
+            "results": hits,
+            "count": len(hits),
+        }
+        if errors:
+            response["errors"] = errors
+        return response
 
-        sql = f'SELECT * FROM "{schema}"."Landmarks"'
-        if where_clauses:
-            sql += " WHERE " + " AND ".join(where_clauses)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Unified search error for {schema}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        query = text(sql)
-        result = db.execute(query, params)
-        rows = [dict(row._mapping) for row in result]
 
-        print(f"✅ Landmark search in {schema}: {len(rows)} result(s)")
-        return {"status": "success", "data": rows, "count": len(rows)}
+# ============================================================
+# ⌨️ 6. AUTOCOMPLETE (in-memory prefix index)
+# ============================================================
+
+@router.get("/autocomplete")
+async def autocomplete(
+    schema: str = Query(..., description="Municipal schema name, e.g., PH0403406"),
+    kind: str = Query(..., pattern=KIND_PATTERN, description="pin, owner, road or landmark"),
+    q: str = Query(..., min_length=1, description="Typed text"),
+    limit: int = Query(10, ge=1, le=50),
+    fuzzy: bool = Query(True, description="Fall back to typo-tolerant matches"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_main_async_db)
+):
+    """
+    Per-keystroke suggestions (prefix, inner word, then fuzzy) served from an
+    in-memory sorted index per schema and field; only the first call per
+    schema/kind reads the table.
+    """
+    require_schema_access(schema, current_user)
 
+    try:
+        config = AUTOCOMPLETE_KINDS[kind]
+        catalog = await db.run_sync(get_catalog)
+        table = next(
+            (
+                t for t in config["tables"]
+                if catalog.has_table(schema, t) and set(config["columns"]) <= set(catalog.columns(schema, t))
+            ),
+            None,
+        )
+        if not table:
+            raise HTTPException(status_code=404, detail=f"No {kind} source table found in schema '{schema}'")
+
+        index = await autocomplete_index.get(db.bind, session_database_name(db), schema, kind, table)
+        suggestions = index.search(q, limit, fuzzy)
+        return {"status": "success", "kind": kind, "query": q, "suggestions": suggestions, "count": len(suggestions)}
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Landmark search error for {schema}: {e}")
+        print(f"❌ Autocomplete error for {schema}/{kind}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ============================================================
+# 🗂️ 7. SEARCH INDEXES (pg_trgm GIN per searchable field)
+# ============================================================
+
+PROVINCIAL_CODE_PATTERN = r"^PH\d+$"
+
+
+def require_schema_access(schema: str, principal):
+    """Admins may touch any schema; users only the ones their access covers."""
+    if getattr(principal, "user_type", None) == "admin":
+        return
+    if not AccessControl.validate_schema_access(schema, principal):
+        raise HTTPException(status_code=403, detail=f"Access denied to schema: {schema}")
+
+
+def index_session(principal, schema: str, provincial_access: Optional[str]) -> Session:
+    """
+    Session on the provincial database holding the schema. Admins name the
+    database explicitly (their own connection is the postgres database);
+    users always get their own province.
+    """
+    require_schema_access(schema, principal)
+    if getattr(principal, "user_type", None) == "admin":
+        if not provincial_access:
+            raise HTTPException(status_code=400, detail="provincial_access (e.g. PH04034) is required for admins")
+        if not schema.startswith(provincial_access):
+            raise HTTPException(status_code=400, detail=f"Schema '{schema}' is not in database {provincial_access}")
+        code = provincial_access
+    else:
+        code = principal.provincial_access
+        if provincial_access and not code.startswith(provincial_access):
+            raise HTTPException(status_code=403, detail=f"Access denied to database: {provincial_access}")
+    try:
+        return get_user_database_session(code)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/indexes")
+def get_search_indexes(
+    schema: str = Query(..., description="Municipal schema name, e.g., PH0403406"),
+    provincial_access: Optional[str] = Query(
+        None, pattern=PROVINCIAL_CODE_PATTERN, description="Provincial PSA code of the database (required for admins)"
+    ),
+    current_user_or_admin=Depends(get_current_user_or_admin)
+):
+    """Verify which searchable fields of a schema have a valid trigram index."""
+    db = index_session(current_user_or_admin, schema, provincial_access)
+    try:
+        return {"status": "success", **index_status(db, schema)}
+    except Exception as e:
+        print(f"❌ Search index check failed for {schema}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
+
+
+@router.post("/indexes")
+def create_search_indexes(
+    schema: str = Query(..., description="Municipal schema name, e.g., PH0403406"),
+    provincial_access: str = Query(..., pattern=PROVINCIAL_CODE_PATTERN, description="Provincial PSA code, e.g., PH04034"),
+    concurrently: bool = Query(True, description="Build without blocking writes"),
+    current_admin=Depends(get_current_admin)
+):
+    """
+    Build missing (or rebuild invalid) trigram indexes for JoinedTable,
+    Landmarks and road tables in a provincial database. Admin only: runs DDL.
+    """
+    db = index_session(current_admin, schema, provincial_access)
+    try:
+        if not get_catalog(db).tables(schema):
+            raise HTTPException(status_code=404, detail=f"Schema '{schema}' not found")
+        database = db.get_bind().url.database
+        result = build_indexes(db, schema, concurrently=concurrently)
+        print(f"🔎 Search indexes for {database}/{schema} built by {current_admin.user_name}")
+        return {
+            "status": "success" if not result["failed"] else "partial",
+            "database": database,
+            **result,
+            **index_status(db, schema),
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"❌ Search index build failed for {schema}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        db.close()
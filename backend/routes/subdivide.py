@@ -1,10 +1,14 @@
 from fastapi import APIRouter, Request, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
-from psycopg2.extras import RealDictCursor
+from psycopg.rows import dict_row
+from tile_cache import tile_cache
+from autocomplete import autocomplete_index
+from catalog import get_catalog
+from async_db import raw_connection, raw_cursor
 import json
 
-from auth.dependencies import get_user_main_db, get_current_user
+from auth.dependencies import get_user_main_async_db, get_current_user
 from auth.models import User
 
 router = APIRouter()
@@ -16,7 +20,7 @@ router = APIRouter()
 @router.post("/subdivide-preview")
 async def subdivide_preview(
     request: Request,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -35,18 +39,18 @@ async def subdivide_preview(
     full_table = f'"{schema}"."{table}"'
 
     try:
-        conn = db.connection().connection
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        conn = await raw_connection(db)
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
             print(f"🧮 Subdivide PREVIEW by {current_user.user_name}: schema={schema}, table={table}, pin={pin}")
 
             # === 1. Get original parcel geometry ===
-            cur.execute(f'''
+            await cur.execute(f'''
                 SELECT pin, ST_AsGeoJSON(geom)::json AS geometry
                 FROM {full_table}
                 WHERE pin = %s
                 LIMIT 1
             ''', (pin,))
-            row = cur.fetchone()
+            row = await cur.fetchone()
             if not row or not row.get("geometry"):
                 return {"status": "error", "message": "Parcel not found or geometry missing."}
 
@@ -63,8 +67,8 @@ async def subdivide_preview(
                     ST_Split(ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326), {multiline_sql}), 3
                 ))).geom)::json AS geom
             '''
-            cur.execute(split_sql, (parcel_geom,))
-            parts = cur.fetchall()
+            await cur.execute(split_sql, (parcel_geom,))
+            parts = await cur.fetchall()
 
             if not parts or len(parts) < 2:
                 return {"status": "error", "message": "Split operation produced less than 2 parts."}
@@ -78,8 +82,8 @@ async def subdivide_preview(
             else:
                 prefix = "-".join(pin_parts[:4])
 
-            cur.execute(f'SELECT pin FROM {full_table} WHERE pin LIKE %s', (f"{prefix}%",))
-            existing_pins = [r["pin"] for r in cur.fetchall()]
+            await cur.execute(f'SELECT pin FROM {full_table} WHERE pin LIKE %s', (f"{prefix}%",))
+            existing_pins = [r["pin"] for r in await cur.fetchall()]
             suffixes = [int(p.split("-")[-1]) for p in existing_pins if p.split("-")[-1].isdigit()]
             next_suffix = max(suffixes or [0]) + 1
 
@@ -107,7 +111,7 @@ async def subdivide_preview(
 @router.post("/subdivide")
 async def subdivide_parcel(
     request: Request,
-    db: Session = Depends(get_user_main_db),
+    db: AsyncSession = Depends(get_user_main_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -129,33 +133,29 @@ async def subdivide_parcel(
     log_table = f'"{schema}"."parcel_transaction_log"'
 
     try:
-        conn = db.connection().connection
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            print(f"🧩 Subdivide SAVE by {current_user.user_name}: schema={schema}, table={table}, pin={pin}")
+        # === Detect actual log table columns ===
+        log_columns = (await db.run_sync(get_catalog)).columns(schema, "parcel_transaction_log")
 
-            # === Detect actual log table columns ===
-            cur.execute("""
-                SELECT column_name FROM information_schema.columns
-                WHERE table_schema = %s AND table_name = %s
-            """, (schema, "parcel_transaction_log"))
-            log_columns = [r["column_name"] for r in cur.fetchall()]
+        conn = await raw_connection(db)
+        async with raw_cursor(conn, row_factory=dict_row) as cur:
+            print(f"🧩 Subdivide SAVE by {current_user.user_name}: schema={schema}, table={table}, pin={pin}")
 
             # === 1. Get original parcel geometry ===
-            cur.execute(f'''
+            await cur.execute(f'''
                 SELECT pin, ST_AsGeoJSON(geom)::json AS geometry
                 FROM {full_table}
                 WHERE pin = %s
                 LIMIT 1
             ''', (pin,))
-            geo_row = cur.fetchone()
+            geo_row = await cur.fetchone()
             if not geo_row or not geo_row.get("geometry"):
                 return {"status": "error", "message": "Parcel not found or geometry missing."}
 
             parcel_geom = json.dumps(geo_row["geometry"])
 
             # === 1.1 Get attributes from JoinedTable ===
-            cur.execute(f'''SELECT * FROM {attr_table} WHERE pin = %s''', (pin,))
-            attr_row = cur.fetchone() or {}
+            await cur.execute(f'''SELECT * FROM {attr_table} WHERE pin = %s''', (pin,))
+            attr_row = await cur.fetchone() or {}
             merged_props = attr_row.copy()
 
             # === 2. Perform split ===
@@ -169,8 +169,8 @@ async def subdivide_parcel(
                     ST_Split(ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326), {multiline_sql}), 3
                 ))).geom::geometry
             '''
-            cur.execute(split_sql, (parcel_geom,))
-            parts = cur.fetchall()
+            await cur.execute(split_sql, (parcel_geom,))
+            parts = await cur.fetchall()
 
             if not parts or len(parts) < 2:
                 return {"status": "error", "message": "Subdivision failed or created less than 2 parts."}
@@ -184,28 +184,29 @@ async def subdivide_parcel(
             log_placeholders = ', '.join(['%s'] * (3 + len(attr_fields)) + ['ST_SetSRID(ST_GeomFromGeoJSON(%s), 4326)'])
             log_values = [table, "subdivided", transaction_date] + [merged_props.get(f) for f in attr_fields] + [parcel_geom]
 
-            cur.execute(f'''
+            await cur.execute(f'''
                 INSERT INTO {log_table} ({log_fields})
                 VALUES ({log_placeholders})
             ''', log_values)
             print("🗂️ Logged original parcel as subdivided.")
 
             # === 4. Delete original parcel ===
-            cur.execute(f'DELETE FROM {full_table} WHERE pin = %s', (pin,))
-            cur.execute(f'DELETE FROM {attr_table} WHERE pin = %s', (pin,))
+            await cur.execute(f'DELETE FROM {full_table} WHERE pin = %s', (pin,))
+            await cur.execute(f'DELETE FROM {attr_table} WHERE pin = %s', (pin,))
             print("🧹 Original parcel removed.")
 
             # === 5. Compute suggested PINs ===
             pin_parts = pin.split("-")
             prefix = "-".join(pin_parts[:4]) if len(pin_parts) == 5 else pin.rsplit("-", 1)[0]
-            cur.execute(f'SELECT pin FROM {full_table} WHERE pin LIKE %s', (f"{prefix}%",))
-            existing_pins = [r["pin"] for r in cur.fetchall()]
+            await cur.execute(f'SELECT pin FROM {full_table} WHERE pin LIKE %s', (f"{prefix}%",))
+            existing_pins = [r["pin"] for r in await cur.fetchall()]
             suffixes = [int(p.split("-")[-1]) for p in existing_pins if p.split("-")[-1].isdigit()]
             next_suffix = max(suffixes or [0]) + 1
 
             suggested_pins = [f"{prefix}-{str(next_suffix + i).zfill(3)}" for i in range(len(parts))]
 
             # === 6. Insert and log new parts safely ===
+            added_rows = []
             for idx, geom in enumerate(parts):
                 final_pin = (new_pins[idx] if new_pins and idx < len(new_pins)
                              else suggested_pins[idx])
@@ -214,7 +215,7 @@ async def subdivide_parcel(
                 new_props["pin"] = final_pin
 
                 # geometry insert
-                cur.execute(f'''
+                await cur.execute(f'''
                     INSERT INTO {full_table} ("pin", geom)
                     VALUES (%s, ST_SetSRID(%s::geometry, 4326))
                 ''', [final_pin, raw_geom])
@@ -222,25 +223,35 @@ async def subdivide_parcel(
                 # attribute insert
                 attr_cols = ', '.join(f'"{k}"' for k in new_props.keys())
                 attr_vals = ', '.join(['%s'] * len(new_props))
-                cur.execute(f'''
+                await cur.execute(f'''
                     INSERT INTO {attr_table} ({attr_cols})
                     VALUES ({attr_vals})
                 ''', list(new_props.values()))
+                added_rows.append(new_props)
 
                 # log insert safely filtered
                 loggable_props = {k: v for k, v in new_props.items() if k in log_columns}
                 log_cols = ', '.join(f'"{k}"' for k in loggable_props.keys())
                 log_vals = list(loggable_props.values())
 
-                cur.execute(f'''
+                await cur.execute(f'''
                     INSERT INTO {log_table}
                     (table_name, transaction_type, transaction_date, {log_cols}, geom)
                     VALUES (%s, %s, %s, {', '.join(['%s'] * len(loggable_props))}, ST_SetSRID(%s::geometry, 4326))
                 ''', [table, "new (subdivide)", transaction_date] + log_vals + [raw_geom])
 
-            conn.commit()
+            await conn.commit()
             print(f"✅ Subdivision saved successfully ({len(parts)} parts).")
 
+            # 🧱 Drop cached tiles covering the original parcel (parts lie inside it)
+            tile_cache.invalidate_geometries(
+                getattr(current_user, "actual_dbname", None), schema, table, [geo_row["geometry"]]
+            )
+            autocomplete_index.apply(
+                getattr(current_user, "actual_dbname", None), schema, "JoinedTable",
+                removed=[attr_row] if attr_row else [], added=added_rows
+            )
+
             return {
                 "status": "success",
                 "message": f"Created {len(parts)} subdivisions.",
@@ -249,7 +260,7 @@ async def subdivide_parcel(
 
     except Exception as e:
         try:
-            conn.rollback()
+            await conn.rollback()
         except:
             pass
         print(f"❌ Subdivide SAVE error: {str(e)}")
@@ -1,9 +1,14 @@
 # routes/sync.py
 from fastapi import APIRouter, HTTPException, Request, Depends
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import psycopg
-from auth.dependencies import get_user_main_db
+from auth.dependencies import get_user_main_db, get_user_main_async_db
+from async_db import raw_connection, raw_cursor, session_database_name
+from catalog import get_catalog, invalidate_catalog
+from metrics import InstrumentedAsyncCursor
+from autocomplete import autocomplete_index
 
 router = APIRouter()
 
@@ -43,7 +48,7 @@ def get_sync_config(schema: str, db: Session = Depends(get_user_main_db)):
 # 🔹 2. POST — Save SyncCreds
 # ============================================================
 @router.post("/sync-config")
-async def save_sync_config(request: Request, db: Session = Depends(get_user_main_db)):
+async def save_sync_config(request: Request, db: AsyncSession = Depends(get_user_main_async_db)):
     """Save or update SyncCreds with password."""
     data = await request.json()
     schema = data.get("schema")
@@ -56,7 +61,8 @@ async def save_sync_config(request: Request, db: Session = Depends(get_user_main
         raise HTTPException(status_code=400, detail="Missing required fields")
 
     try:
-        db.execute(text(f"""
+        created = not (await db.run_sync(get_catalog)).has_table(schema, "SyncCreds")
+        await db.execute(text(f"""
             CREATE TABLE IF NOT EXISTS "{schema}"."SyncCreds" (
                 id SERIAL PRIMARY KEY,
                 host TEXT,
@@ -65,15 +71,17 @@ async def save_sync_config(request: Request, db: Session = Depends(get_user_main
                 password TEXT
             )
         """))
-        db.execute(text(f"""
+        await db.execute(text(f"""
             INSERT INTO "{schema}"."SyncCreds" (host, port, username, password)
             VALUES (:host, :port, :username, :password)
         """), {"host": host, "port": port, "username": username, "password": password})
-        db.commit()
+        await db.commit()
+        if created:
+            await db.run_sync(invalidate_catalog)
         print(f"✅ SyncCreds saved for {schema}: {username}@{host}:{port}")
         return {"status": "success", "message": "Credentials saved successfully."}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error saving SyncCreds: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -82,7 +90,7 @@ async def save_sync_config(request: Request, db: Session = Depends(get_user_main
 # 🔹 3. PUSH — Match by ID (fixes PIN rename problem)
 # ============================================================
 @router.post("/sync-push")
-async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
+async def sync_push(request: Request, db: AsyncSession = Depends(get_user_main_async_db)):
     """
     Push 'id', 'pin', 'bounds', 'computed_area' from GIS → RPIS.
     Uses 'id' as the matching key to handle renamed PINs safely.
@@ -93,14 +101,14 @@ async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
         raise HTTPException(status_code=400, detail="Schema is required.")
 
     try:
-        current_db = db.execute(text("SELECT current_database()")).scalar()
+        current_db = session_database_name(db)
         print(f"🚀 PUSH triggered from {current_db}.{schema}")
 
-        creds = db.execute(text(f"""
+        creds = (await db.execute(text(f"""
             SELECT host, port, username, password
             FROM "{schema}"."SyncCreds"
             ORDER BY id DESC LIMIT 1
-        """)).mappings().first()
+        """))).mappings().first()
         if not creds:
             raise HTTPException(status_code=400, detail=f"No SyncCreds found for {schema}")
 
@@ -114,28 +122,29 @@ async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
         print(f"🔗 Target: {target_user}@{target_host}:{target_port}/{target_dbname} → {target_schema}.JoinedTable")
 
         # === Fetch GIS data (now includes ID)
-        rows = db.execute(text(f"""
+        rows = (await db.execute(text(f"""
             SELECT id, pin, bounds, computed_area
             FROM "{schema}"."JoinedTable"
             WHERE pin IS NOT NULL
-        """)).fetchall()
+        """))).fetchall()
         if not rows:
             return {"status": "empty", "message": "No data found in JoinedTable"}
 
         print(f"📦 Retrieved {len(rows)} rows from GIS.{schema}.JoinedTable")
 
         # === Connect to RPIS
-        with psycopg.connect(
+        async with await psycopg.AsyncConnection.connect(
             dbname=target_dbname,
             user=target_user,
             password=target_pass,
             host=target_host,
-            port=target_port
+            port=target_port,
+            cursor_factory=InstrumentedAsyncCursor
         ) as conn:
-            with conn.cursor() as cur:
+            async with conn.cursor() as cur:
                 # 1️⃣ Drop and recreate staging table
-                cur.execute(f'DROP TABLE IF EXISTS "{target_schema}"."_push_staging";')
-                cur.execute(f"""
+                await cur.execute(f'DROP TABLE IF EXISTS "{target_schema}"."_push_staging";')
+                await cur.execute(f"""
                     CREATE TABLE "{target_schema}"."_push_staging" (
                         id INTEGER,
                         pin TEXT,
@@ -144,22 +153,21 @@ async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
                     );
                 """)
 
-                # 2️⃣ Bulk insert GIS data
-                placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(rows))
-                flat_values = [v for r in rows for v in (r[0], r[1], r[2], r[3])]
-                cur.execute(f"""
-                    INSERT INTO "{target_schema}"."_push_staging" (id, pin, bounds, computed_area)
-                    VALUES {placeholders};
-                """, flat_values)
+                # 2️⃣ Bulk load GIS data (COPY: no bind-parameter limit)
+                async with cur.copy(
+                    f'COPY "{target_schema}"."_push_staging" (id, pin, bounds, computed_area) FROM STDIN'
+                ) as copy:
+                    for r in rows:
+                        await copy.write_row((r[0], r[1], r[2], r[3]))
 
                 # 3️⃣ Delete RPIS rows that no longer exist in GIS
-                cur.execute(f"""
+                await cur.execute(f"""
                     DELETE FROM "{target_schema}"."JoinedTable"
                     WHERE id NOT IN (SELECT id FROM "{target_schema}"."_push_staging");
                 """)
 
                 # 4️⃣ Update existing RPIS rows (match by ID)
-                cur.execute(f"""
+                await cur.execute(f"""
                     UPDATE "{target_schema}"."JoinedTable" AS rpis
                     SET
                         pin = staging.pin,
@@ -170,7 +178,7 @@ async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
                 """)
 
                 # 5️⃣ Insert new rows (new parcels)
-                cur.execute(f"""
+                await cur.execute(f"""
                     INSERT INTO "{target_schema}"."JoinedTable" (id, pin, bounds, computed_area)
                     SELECT s.id, s.pin, s.bounds, s.computed_area
                     FROM "{target_schema}"."_push_staging" s
@@ -180,8 +188,8 @@ async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
                 """)
 
                 # 6️⃣ Drop staging
-                cur.execute(f'DROP TABLE IF EXISTS "{target_schema}"."_push_staging";')
-                conn.commit()
+                await cur.execute(f'DROP TABLE IF EXISTS "{target_schema}"."_push_staging";')
+                await conn.commit()
 
         print(f"✅ Push complete — {len(rows)} records synced using ID match safely.")
 
@@ -200,7 +208,7 @@ async def sync_push(request: Request, db: Session = Depends(get_user_main_db)):
 # 🔹 4. PULL — Also use ID for updates
 # ============================================================
 @router.post("/sync-pull")
-async def sync_pull(request: Request, db: Session = Depends(get_user_main_db)):
+async def sync_pull(request: Request, db: AsyncSession = Depends(get_user_main_async_db)):
     """
     Pull data from RPIS JoinedTable and update GIS JoinedTable.
     Uses 'id' for matching so renamed PINs sync correctly.
@@ -211,14 +219,14 @@ async def sync_pull(request: Request, db: Session = Depends(get_user_main_db)):
         raise HTTPException(status_code=400, detail="Schema is required.")
 
     try:
-        current_db = db.execute(text("SELECT current_database()")).scalar()
+        current_db = session_database_name(db)
         print(f"⬇️ PULL triggered for {current_db}.{schema}")
 
-        creds = db.execute(text(f"""
+        creds = (await db.execute(text(f"""
             SELECT host, port, username, password
             FROM "{schema}"."SyncCreds"
             ORDER BY id DESC LIMIT 1
-        """)).mappings().first()
+        """))).mappings().first()
         if not creds:
             raise HTTPException(status_code=400, detail=f"No SyncCreds found for {schema}")
 
@@ -226,26 +234,33 @@ async def sync_pull(request: Request, db: Session = Depends(get_user_main_db)):
         rpis_user, rpis_pass = creds["username"], creds["password"] or ""
         rpis_db = current_db
 
-        with psycopg.connect(
+        # Local JoinedTable layout comes from the cached catalog; only columns
+        # present on both sides can be staged and updated
+        catalog = await db.run_sync(get_catalog)
+        local_cols = set(catalog.columns(schema, "JoinedTable"))
+        staging_exists = catalog.has_table(schema, "_rpis_staging")
+
+        async with await psycopg.AsyncConnection.connect(
             dbname=rpis_db,
             user=rpis_user,
             password=rpis_pass,
             host=rpis_host,
-            port=rpis_port
+            port=rpis_port,
+            cursor_factory=InstrumentedAsyncCursor
         ) as conn_remote:
-            with conn_remote.cursor() as cur:
-                cur.execute(f"""
+            async with conn_remote.cursor() as cur:
+                await cur.execute(f"""
                     SELECT column_name
                     FROM information_schema.columns
                     WHERE table_schema = %s AND table_name = 'JoinedTable'
                 """, (schema,))
-                all_cols = [r[0] for r in cur.fetchall()]
+                all_cols = [r[0] for r in await cur.fetchall() if not local_cols or r[0] in local_cols]
                 excluded = {"id", "pin", "bounds", "computed_area", "geom"}
                 cols_to_update = [c for c in all_cols if c not in excluded]
                 col_list = ", ".join(f'"{c}"' for c in all_cols)
 
-                cur.execute(f'SELECT {col_list} FROM "{schema}"."JoinedTable" WHERE id IS NOT NULL')
-                rows = cur.fetchall()
+                await cur.execute(f'SELECT {col_list} FROM "{schema}"."JoinedTable" WHERE id IS NOT NULL')
+                rows = await cur.fetchall()
                 colnames = [desc[0] for desc in cur.description]
 
         if not rows:
@@ -253,32 +268,35 @@ async def sync_pull(request: Request, db: Session = Depends(get_user_main_db)):
 
         print(f"📦 Retrieved {len(rows)} rows from RPIS.{schema}.JoinedTable")
 
-        db.execute(text(f"""
+        await db.execute(text(f"""
             CREATE TABLE IF NOT EXISTS "{schema}"."_rpis_staging"
             (LIKE "{schema}"."JoinedTable" INCLUDING ALL);
         """))
-        db.execute(text(f'TRUNCATE TABLE "{schema}"."_rpis_staging";'))
-        db.commit()
+        await db.execute(text(f'TRUNCATE TABLE "{schema}"."_rpis_staging";'))
+        await db.commit()
+        if not staging_exists:
+            await db.run_sync(invalidate_catalog)
 
-        conn = db.connection().connection
-        with conn.cursor() as cur:
+        conn = await raw_connection(db)
+        async with raw_cursor(conn) as cur:
             col_list_str = ", ".join(f'"{c}"' for c in colnames)
-            placeholders = ", ".join(["(" + ",".join(["%s"] * len(colnames)) + ")"] * len(rows))
-            flat_values = [v for row in rows for v in row]
-            cur.execute(f'INSERT INTO "{schema}"."_rpis_staging" ({col_list_str}) VALUES {placeholders}', flat_values)
-            conn.commit()
+            async with cur.copy(f'COPY "{schema}"."_rpis_staging" ({col_list_str}) FROM STDIN') as copy:
+                for row in rows:
+                    await copy.write_row(row)
+            await conn.commit()
 
         set_clause = ", ".join([f'"{c}" = staging."{c}"' for c in cols_to_update])
-        db.execute(text(f"""
+        await db.execute(text(f"""
             UPDATE "{schema}"."JoinedTable" AS gis
             SET {set_clause}
             FROM "{schema}"."_rpis_staging" AS staging
             WHERE gis.id = staging.id;
         """))
-        db.commit()
+        await db.commit()
 
-        db.execute(text(f'TRUNCATE TABLE "{schema}"."_rpis_staging";'))
-        db.commit()
+        await db.execute(text(f'TRUNCATE TABLE "{schema}"."_rpis_staging";'))
+        await db.commit()
+        autocomplete_index.invalidate(current_db, schema, "JoinedTable")
 
         print(f"✅ Pull complete — updated {len(rows)} GIS records using ID match.")
 
@@ -289,6 +307,6 @@ async def sync_pull(request: Request, db: Session = Depends(get_user_main_db)):
         }
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(f"❌ Error in /sync-pull: {e}")
         raise HTTPException(status_code=500, detail=str(e))
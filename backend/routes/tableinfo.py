@@ -1,13 +1,12 @@
 from fastapi import APIRouter, Query, HTTPException
-from db import get_connection
+from db import pooled_connection
 
 router = APIRouter()
 
 @router.get("/tables-in-schema")
 def get_tables_in_schema(schema: str = Query(...)):
     try:
-        conn = get_connection()
-        with conn.cursor() as cur:
+        with pooled_connection() as conn, conn.cursor() as cur:
             cur.execute("""
                 SELECT table_name
                 FROM information_schema.tables
@@ -27,8 +26,7 @@ def get_distinct_values(
     column: str = Query(...)
 ):
     try:
-        conn = get_connection()
-        with conn.cursor() as cur:
+        with pooled_connection() as conn, conn.cursor() as cur:
             sql = f'SELECT DISTINCT "{column}" FROM "{schema}"."{table}" WHERE "{column}" IS NOT NULL'
             cur.execute(sql)
             rows = cur.fetchall()
@@ -1,16 +1,26 @@
 # routes/thematic.py
-from fastapi import APIRouter, HTTPException
-from db import get_connection
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
+from db import pooled_connection
+from geojson_utils import aggregate_features_sql, feature_collection_bytes
 
 router = APIRouter()
 
 @router.get("/thematic-layers")
-def get_thematic_layers():
+def get_thematic_layers(
+    aggregate: bool = Query(False, description="Build the FeatureCollection in PostGIS and pass it through")
+):
     try:
-        conn = get_connection()
+        with pooled_connection() as conn:
+            return load_thematic_layers(conn, aggregate)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+def load_thematic_layers(conn, aggregate: bool):
+    """Build the thematic FeatureCollection on a borrowed (dict_row) connection."""
     thematic_features = []
 
     with conn.cursor() as cur:
@@ -23,6 +33,19 @@ def get_thematic_layers():
         """)
         tables = [row["table_name"] for row in cur.fetchall()]
 
+    # ✅ PostGIS builds the features; bytes are passed straight through
+    if aggregate:
+        parts = []
+        for table in tables:
+            with conn.cursor() as cur:
+                try:
+                    cur.execute(aggregate_features_sql(f'SELECT * FROM "{table}"'))
+                    parts.append(cur.fetchone()["features"])
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Skipping {table}: {e}")
+        return Response(content=feature_collection_bytes(parts), media_type="application/json")
+
     for table in tables:
         with conn.cursor() as cur:
             try:
@@ -32,6 +55,7 @@ def get_thematic_layers():
                 ''')
                 rows = cur.fetchall()
             except Exception as e:
+                conn.rollback()
                 print(f"Skipping {table}: {e}")
                 continue
 
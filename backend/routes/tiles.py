@@ -0,0 +1,104 @@
+from fastapi import APIRouter, HTTPException, Depends, Response
+from auth.dependencies import get_current_user, get_user_main_db
+from auth.models import User
+from auth.access_control import AccessControl
+from routes.geomdisplay import list_parcel_tables
+from tile_cache import tile_cache
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+router = APIRouter()
+
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+
+def build_tile_sql(schema: str, table: str) -> str:
+    """
+    Build the ST_AsMVT query for one parcel table.
+    Each table becomes its own layer (named after the table), so the tiles of
+    several tables can simply be concatenated into one MVT response.
+    """
+    return f'''
+        WITH bounds AS (
+            SELECT
+                ST_TileEnvelope(:z, :x, :y) AS env,
+                ST_Transform(ST_TileEnvelope(:z, :x, :y), 4326) AS env_4326
+        ),
+        mvtgeom AS (
+            SELECT
+                ST_AsMVTGeom(
+                    ST_Transform(t.geom, 3857), bounds.env, {MVT_EXTENT}, {MVT_BUFFER}, true
+                ) AS geom,
+                t."pin" AS pin,
+                CAST(:schema AS text) AS source_schema,
+                CAST(:table AS text) AS source_table
+            FROM "{schema}"."{table}" t, bounds
+            WHERE t.geom && bounds.env_4326
+        )
+        SELECT ST_AsMVT(mvtgeom.*, :table, {MVT_EXTENT}, 'geom')
+        FROM mvtgeom
+        WHERE geom IS NOT NULL
+    '''
+
+
+# ==========================================================
+# 🧱 Parcel vector tiles (Mapbox Vector Tile / ST_AsMVT)
+# ==========================================================
+@router.get("/tiles/{schema}/{z}/{x}/{y}.mvt")
+def get_parcel_tile(
+    schema: str,
+    z: int,
+    x: int,
+    y: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_user_main_db)
+):
+    """
+    Serve one vector tile of all parcel-like tables in the schema.
+    Uses the same table discovery rules as /all-barangays, but only transfers
+    the parcels that intersect the requested z/x/y tile.
+    """
+
+    # ✅ Verify user access
+    access_info = AccessControl.check_user_access(current_user)
+    if access_info["status"] == "pending_approval":
+        raise HTTPException(status_code=403, detail=access_info["message"])
+
+    if not AccessControl.validate_schema_access(schema, current_user):
+        raise HTTPException(status_code=403, detail=f"Access denied to schema: {schema}")
+
+    if z < 0 or z > 24 or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail=f"Invalid tile coordinates {z}/{x}/{y}")
+
+    try:
+        tables = list_parcel_tables(db, schema)
+    except Exception as e:
+        print(f"❌ Error listing tables in schema '{schema}': {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    database = getattr(current_user, "actual_dbname", None) or current_user.provincial_access
+    generation = tile_cache.generation()
+
+    # ✅ One layer per table; MVT layers concatenate into a single tile
+    tile = b""
+    for table in tables:
+        key = (database, schema, table, z, x, y)
+        layer = tile_cache.get(key)
+        if layer is None:
+            try:
+                result = db.execute(
+                    text(build_tile_sql(schema, table)),
+                    {"z": z, "x": x, "y": y, "schema": schema, "table": table}
+                )
+                layer = bytes(result.scalar() or b"")
+            except Exception as e:
+                db.rollback()
+                print(f"⚠️ Tile query failed on {schema}.{table} ({z}/{x}/{y}): {e}")
+                continue
+            tile_cache.put(key, layer, generation)
+
+        tile += layer
+
+    return Response(content=tile, media_type=MVT_MEDIA_TYPE)
@@ -0,0 +1,270 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from catalog import catalog_key, get_catalog
+
+# Fields the search panels filter on, per layer table
+SEARCH_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "JoinedTable": (
+        "pin", "arpn", "octtct", "td", "cct", "survey", "cad_no", "l_lastname",
+        "l_frstname", "blk_no", "lot_no", "parcel_cod", "brgy_nm", "sect_code",
+    ),
+    "Landmarks": ("name", "type", "barangay", "descr"),
+    "RoadNetwork": ("road_name", "road_type", "type", "classification"),
+    "RoadInfo": ("road_name", "road_type", "type", "classification"),
+    "BarangayBoundary": ("barangay",),
+}
+
+ROAD_TABLES = ("RoadNetwork", "RoadInfo")
+
+
+# ==========================================================
+# 🔎 Query helpers
+# ==========================================================
+def escape_like(value: str) -> str:
+    """Escape LIKE wildcards so user input is matched literally."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def contains_pattern(value: str) -> str:
+    return f"%{escape_like(str(value).strip())}%"
+
+
+def search_expression(field: str) -> str:
+    """Indexed expression of a search field (must match the GIN index definition)."""
+    return f'("{field}"::text)'
+
+
+def contains_predicate(field: str, param: str) -> str:
+    """Case-insensitive substring match served by the field's trigram index."""
+    return f"{search_expression(field)} ILIKE :{param}"
+
+
+def build_filters(filters: Dict, columns: Iterable[str]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    WHERE clauses + bind params for {field: value} filters (empty values skipped).
+    Raises ValueError for fields the table does not have.
+    """
+    known = set(columns)
+    clauses, params = [], {}
+    for i, (field, value) in enumerate(filters.items()):
+        if value is None or str(value).strip() == "":
+            continue
+        if field not in known:
+            raise ValueError(f"Unknown search field '{field}'")
+        key = f"v{i}"
+        clauses.append(contains_predicate(field, key))
+        params[key] = contains_pattern(value)
+    return clauses, params
+
+
+# ==========================================================
+# 🏗️ Index management
+# ==========================================================
+def index_name(table: str, field: str) -> str:
+    # Index names are per schema; Postgres truncates identifiers at 63 bytes
+    return f"trgm_{table.lower()}_{field.lower()}"[:63]
+
+
+# host:port/dbname → schema pg_trgm is installed in (None = not installed)
+_trigram_schemas: Dict[str, Optional[str]] = {}
+
+
+def trigram_schema(db: Session, refresh: bool = False) -> Optional[str]:
+    """Schema holding pg_trgm (often 'extensions' on Supabase), cached per database."""
+    key = catalog_key(db)
+    if refresh or key not in _trigram_schemas:
+        row = db.execute(text("""
+            SELECT n.nspname
+            FROM pg_catalog.pg_opclass o
+            JOIN pg_catalog.pg_namespace n ON n.oid = o.opcnamespace
+            JOIN pg_catalog.pg_am am ON am.oid = o.opcmethod
+            WHERE o.opcname = 'gin_trgm_ops' AND am.amname = 'gin'
+            LIMIT 1
+        """)).first()
+        _trigram_schemas[key] = row[0] if row else None
+    return _trigram_schemas[key]
+
+
+def trigram_opclass(db: Session, refresh: bool = False) -> Optional[str]:
+    """Schema-qualified gin_trgm_ops, or None if pg_trgm is missing."""
+    schema = trigram_schema(db, refresh)
+    return f'"{schema}".gin_trgm_ops' if schema else None
+
+
+def _existing_indexes(db: Session, schema: str) -> Dict[str, bool]:
+    """Index name → is valid (a failed CONCURRENTLY build leaves an invalid index)."""
+    rows = db.execute(text("""
+        SELECT c.relname, i.indisvalid
+        FROM pg_catalog.pg_index i
+        JOIN pg_catalog.pg_class c ON c.oid = i.indexrelid
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = :schema AND c.relname LIKE 'trgm\\_%'
+    """), {"schema": schema}).fetchall()
+    return {name: valid for name, valid in rows}
+
+
+def index_status(db: Session, schema: str) -> Dict:
+    """Which searchable fields of a schema have a valid trigram index."""
+    catalog = get_catalog(db)
+    existing = _existing_indexes(db, schema)
+    fields = []
+    for table, table_fields in SEARCH_FIELDS.items():
+        if not catalog.has_table(schema, table):
+            continue
+        columns = set(catalog.columns(schema, table))
+        for field in table_fields:
+            if field not in columns:
+                continue
+            name = index_name(table, field)
+            fields.append({
+                "table": table,
+                "field": field,
+                "index": name,
+                "exists": name in existing,
+                "valid": existing.get(name, False),
+            })
+    return {
+        "schema": schema,
+        "pg_trgm": trigram_opclass(db, refresh=True) is not None,
+        "fields": fields,
+        "ready": bool(fields) and all(f["valid"] for f in fields),
+    }
+
+
+def build_indexes(db: Session, schema: str, tables: Optional[List[str]] = None,
+                  concurrently: bool = True) -> Dict:
+    """
+    Create missing trigram GIN indexes on the searchable fields of a schema
+    (invalid leftovers are rebuilt). CONCURRENTLY keeps the tables writable
+    while indexes build; it runs outside a transaction on its own connection.
+    """
+    opclass = trigram_opclass(db)
+    if opclass is None:
+        db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.commit()
+        opclass = trigram_opclass(db, refresh=True)
+        if opclass is None:
+            raise RuntimeError("pg_trgm extension is not available on this database")
+
+    status = index_status(db, schema)
+    todo = [f for f in status["fields"] if not f["valid"] and (not tables or f["table"] in tables)]
+    # End the session's read transaction: CONCURRENTLY waits for open snapshots
+    db.commit()
+
+    engine: Engine = db.get_bind()
+    created, failed = [], []
+    concurrent = "CONCURRENTLY " if concurrently else ""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for f in todo:
+            try:
+                if f["exists"]:
+                    conn.execute(text(f'DROP INDEX {concurrent}IF EXISTS "{schema}"."{f["index"]}"'))
+                conn.execute(text(
+                    f'CREATE INDEX {concurrent}IF NOT EXISTS "{f["index"]}" '
+                    f'ON "{schema}"."{f["table"]}" USING gin ({search_expression(f["field"])} {opclass})'
+                ))
+                created.append(f["index"])
+                print(f"🔎 Built {schema}.{f['index']}")
+            except Exception as e:
+                failed.append({"index": f["index"], "error": str(e).splitlines()[0]})
+                print(f"❌ Failed to build {schema}.{f['index']}: {e}")
+        for table in sorted({f["table"] for f in todo}):
+            conn.execute(text(f'ANALYZE "{schema}"."{table}"'))
+
+    return {"schema": schema, "created": created, "failed": failed}
+
+
+# ==========================================================
+# 🧭 Unified (cross-layer) search
+# ==========================================================
+# layer → candidate tables (first existing wins), label column, searched fields
+UNIFIED_LAYERS: Dict[str, Dict] = {
+    "parcel": {
+        "tables": ("JoinedTable",),
+        "label": "pin",
+        "fields": ("pin", "arpn", "td", "l_lastname", "l_frstname", "brgy_nm"),
+    },
+    "road": {
+        "tables": ROAD_TABLES,
+        "label": "road_name",
+        "fields": ("road_name", "road_type", "classification"),
+    },
+    "landmark": {
+        "tables": ("Landmarks",),
+        "label": "name",
+        "fields": ("name", "type", "barangay"),
+    },
+    "barangay": {
+        "tables": ("BarangayBoundary",),
+        "label": "barangay",
+        "fields": ("barangay",),
+    },
+}
+
+
+def unified_layer_query(catalog, schema: str, layer: str, trgm_schema: Optional[str]) -> Optional[Dict]:
+    """
+    Top-N query of one layer: rows whose searched fields contain :pattern
+    (trigram-indexed ILIKE), ranked by the best trigram word similarity to :q,
+    with the geometry centroid for fly-to. None if the layer has no table.
+    """
+    config = UNIFIED_LAYERS[layer]
+    table = next((t for t in config["tables"] if catalog.has_table(schema, t)), None)
+    if table is None:
+        return None
+    columns = set(catalog.columns(schema, table))
+    fields = [f for f in config["fields"] if f in columns]
+    if not fields:
+        return None
+
+    if trgm_schema:
+        scores = [f'"{trgm_schema}".word_similarity(:q, {search_expression(f)})' for f in fields]
+    else:
+        # Without pg_trgm: prefix matches first, then shorter values
+        scores = [
+            f"CASE WHEN {search_expression(f)} ILIKE :prefix THEN 1.0 "
+            f"ELSE 0.5 / (1 + length({search_expression(f)})) END"
+            for f in fields
+        ]
+    select = [f'"{f}"' for f in fields]
+    if "id" in columns:
+        select.append('"id" AS _id')
+    if config["label"] in columns and config["label"] not in fields:
+        select.append(f'"{config["label"]}"')
+    if "geom" in columns:
+        select.append("ST_X(ST_Centroid(geom)) AS _lng, ST_Y(ST_Centroid(geom)) AS _lat")
+
+    score = scores[0] if len(scores) == 1 else f"GREATEST({', '.join(scores)})"
+    sql = f"""
+        SELECT {", ".join(select)}, {score} AS _score
+        FROM "{schema}"."{table}"
+        WHERE {" OR ".join(contains_predicate(f, "pattern") for f in fields)}
+        ORDER BY _score DESC
+        LIMIT :limit
+    """
+    return {"layer": layer, "table": table, "fields": fields, "label": config["label"], "sql": sql}
+
+
+def unified_result(query: Dict, row: Dict, q: str) -> Dict:
+    """One ranked hit: label, the field that matched, score and centroid."""
+    needle = q.lower()
+    matched = next(
+        (f for f in query["fields"] if row.get(f) is not None and needle in str(row[f]).lower()),
+        query["fields"][0],
+    )
+    label = row.get(query["label"]) or row.get(matched)
+    return {
+        "layer": query["layer"],
+        "table": query["table"],
+        "id": row.get("_id"),
+        "label": label,
+        "field": matched,
+        "value": row.get(matched),
+        "score": round(float(row["_score"] or 0), 4),
+        "lng": row.get("_lng"),
+        "lat": row.get("_lat"),
+        "properties": {f: row.get(f) for f in query["fields"]},
+    }
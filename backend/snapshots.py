@@ -0,0 +1,142 @@
+from collections import OrderedDict
+from fastapi import Request
+from fastapi.responses import Response
+from typing import Callable, Dict, Hashable, Optional, Tuple
+import hashlib
+import os
+import threading
+import time
+
+# How long a materialised snapshot is served before it is rebuilt
+SNAPSHOT_TTL_SECONDS = int(os.getenv("SNAPSHOT_TTL_SECONDS", 3600))
+SNAPSHOT_MAX_BYTES = int(os.getenv("SNAPSHOT_MAX_BYTES", 128 * 1024 * 1024))
+SNAPSHOT_MAX_ENTRIES = int(os.getenv("SNAPSHOT_MAX_ENTRIES", 500))
+
+# (database, kind, schema, variant) — variant covers zoom/precision etc.
+SnapshotKey = Tuple[str, str, Optional[str], Hashable]
+
+
+class Snapshot:
+    """Encoded response body of a rarely-changing dataset plus its ETag."""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.media_type = media_type
+        self.etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        self.created_at = time.monotonic()
+
+    @property
+    def is_expired(self) -> bool:
+        return time.monotonic() - self.created_at > SNAPSHOT_TTL_SECONDS
+
+
+class SnapshotStore:
+    """
+    In-process LRU store of pre-encoded responses (bounds, boundary GeoJSON),
+    bounded by entry count and total bytes; expired snapshots are swept on
+    insert. Builders run at most once per key at a time; failures (e.g. 404)
+    are not stored. Admins drop stale snapshots through invalidate() after edits.
+    """
+
+    def __init__(self, max_bytes: int = SNAPSHOT_MAX_BYTES, max_entries: int = SNAPSHOT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._snapshots: "OrderedDict[SnapshotKey, Snapshot]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        # key → [build lock, callers holding or waiting for it]; removed when the last one leaves
+        self._build_locks: Dict[SnapshotKey, list] = {}
+
+    def _get(self, key: SnapshotKey) -> Optional[Snapshot]:
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is None or snapshot.is_expired:
+                return None
+            self._snapshots.move_to_end(key)
+            return snapshot
+
+    def _put(self, key: SnapshotKey, snapshot: Snapshot):
+        """Store a snapshot (lock held), sweeping expired ones and evicting least recently used."""
+        old = self._snapshots.pop(key, None)
+        if old is not None:
+            self._size -= len(old.body)
+        for k in [k for k, s in self._snapshots.items() if s.is_expired]:
+            self._size -= len(self._snapshots.pop(k).body)
+        if len(snapshot.body) > self.max_bytes:
+            return
+        self._snapshots[key] = snapshot
+        self._size += len(snapshot.body)
+        while self._snapshots and (self._size > self.max_bytes or len(self._snapshots) > self.max_entries):
+            _, evicted = self._snapshots.popitem(last=False)
+            self._size -= len(evicted.body)
+            self.evictions += 1
+
+    def get_or_build(
+        self,
+        key: SnapshotKey,
+        build: Callable[[], bytes],
+        media_type: str = "application/json",
+    ) -> Snapshot:
+        snapshot = self._get(key)
+        if snapshot is not None:
+            return snapshot
+
+        with self._lock:
+            entry = self._build_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                snapshot = self._get(key)
+                if snapshot is None:
+                    snapshot = Snapshot(build(), media_type)
+                    with self._lock:
+                        self._put(key, snapshot)
+                    print(f"📸 Built snapshot {key[1]} for {key[0]}/{key[2] or '-'} ({len(snapshot.body)} bytes)")
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._build_locks[key]
+        return snapshot
+
+    def invalidate(self, database: Optional[str] = None, schema: Optional[str] = None) -> int:
+        """
+        Drop snapshots of a database (host:port/dbname or a bare dbname; all
+        databases when None), optionally of one schema. Returns the number removed.
+        """
+        with self._lock:
+            keys = [
+                k for k in self._snapshots
+                if (database is None or k[0] == database or k[0].rsplit("/", 1)[-1] == database)
+                and (schema is None or k[2] == schema)
+            ]
+            for k in keys:
+                self._size -= len(self._snapshots.pop(k).body)
+        return len(keys)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._snapshots),
+                "bytes": self._size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "building": len(self._build_locks),
+            }
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    """Serve a snapshot, answering 304 when the client already has this version."""
+    headers = {"ETag": snapshot.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if snapshot.etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.body, media_type=snapshot.media_type, headers=headers)
+
+
+# Shared process-wide snapshot store
+snapshot_store = SnapshotStore()
@@ -0,0 +1,193 @@
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import math
+import os
+import threading
+
+# (database, schema, table, z, x, y)
+TileKey = Tuple[str, str, str, int, int, int]
+# (xmin, ymin, xmax, ymax) in EPSG:4326
+BBox = Tuple[float, float, float, float]
+
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+TILE_CACHE_MAX_ENTRIES = int(os.getenv("TILE_CACHE_MAX_ENTRIES", 50000))
+
+# Rough per-entry bookkeeping cost so empty tiles still count toward the limit
+ENTRY_OVERHEAD_BYTES = 128
+
+# Tiles include features within MVT_BUFFER/MVT_EXTENT of their edge
+TILE_BUFFER_RATIO = 64 / 4096
+
+
+def tile_bounds(z: int, x: int, y: int) -> BBox:
+    """Return the lon/lat bounding box of an XYZ (Web Mercator) tile."""
+    n = 2 ** z
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return (lon_min, lat_min, lon_max, lat_max)
+
+
+def _iter_positions(coords):
+    if not coords:
+        return
+    if isinstance(coords[0], (int, float)):
+        yield coords
+        return
+    for c in coords:
+        yield from _iter_positions(c)
+
+
+def geojson_bounds(geometry: Optional[dict]) -> Optional[BBox]:
+    """Compute the bounding box of a GeoJSON geometry dict (no DB round trip)."""
+    if not geometry:
+        return None
+    if geometry.get("type") == "GeometryCollection":
+        return merge_bounds(geojson_bounds(g) for g in geometry.get("geometries", []))
+
+    xs, ys = [], []
+    for pos in _iter_positions(geometry.get("coordinates")):
+        xs.append(pos[0])
+        ys.append(pos[1])
+    if not xs:
+        return None
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def merge_bounds(boxes: Iterable[Optional[BBox]]) -> Optional[BBox]:
+    """Union of several bounding boxes, ignoring empty ones."""
+    boxes = [b for b in boxes if b]
+    if not boxes:
+        return None
+    return (
+        min(b[0] for b in boxes),
+        min(b[1] for b in boxes),
+        max(b[2] for b in boxes),
+        max(b[3] for b in boxes),
+    )
+
+
+def _intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+class TileCache:
+    """
+    In-process LRU cache of encoded MVT layers, keyed by
+    (database, schema, table, z, x, y), bounded by entry count and total bytes.
+    Writes invalidate only the cached tiles that intersect the edited bbox.
+    """
+
+    def __init__(self, max_bytes: int = TILE_CACHE_MAX_BYTES, max_entries: int = TILE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._tiles: "OrderedDict[TileKey, bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped on every invalidation so in-flight renders can't re-cache stale tiles
+        self._generation = 0
+
+    # ---------------- tiles ----------------
+    def get(self, key: TileKey) -> Optional[bytes]:
+        with self._lock:
+            data = self._tiles.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, key: TileKey, data: bytes, generation: Optional[int] = None):
+        cost = len(data) + ENTRY_OVERHEAD_BYTES
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            old = self._tiles.pop(key, None)
+            if old is not None:
+                self._size -= len(old) + ENTRY_OVERHEAD_BYTES
+            self._tiles[key] = data
+            self._size += cost
+            while self._tiles and (self._size > self.max_bytes or len(self._tiles) > self.max_entries):
+                _, evicted = self._tiles.popitem(last=False)
+                self._size -= len(evicted) + ENTRY_OVERHEAD_BYTES
+                self.evictions += 1
+
+    # ---------------- invalidation ----------------
+    def invalidate(
+        self,
+        database: Optional[str],
+        schema: str,
+        table: Optional[str] = None,
+        bbox: Optional[BBox] = None,
+    ) -> int:
+        """
+        Drop cached tiles for a database/schema (optionally one table) that
+        intersect bbox. Without a bbox every tile of that table is dropped.
+        Returns the number of tiles removed.
+        """
+        removed = 0
+        with self._lock:
+            self._generation += 1
+            for key in list(self._tiles.keys()):
+                k_db, k_schema, k_table, z, x, y = key
+                if database is not None and k_db != database:
+                    continue
+                if k_schema != schema or (table is not None and k_table != table):
+                    continue
+                if bbox is not None:
+                    tb = tile_bounds(z, x, y)
+                    pad_x = (tb[2] - tb[0]) * TILE_BUFFER_RATIO
+                    pad_y = (tb[3] - tb[1]) * TILE_BUFFER_RATIO
+                    padded = (tb[0] - pad_x, tb[1] - pad_y, tb[2] + pad_x, tb[3] + pad_y)
+                    if not _intersects(padded, bbox):
+                        continue
+                data = self._tiles.pop(key)
+                self._size -= len(data) + ENTRY_OVERHEAD_BYTES
+                removed += 1
+            self.invalidations += removed
+        return removed
+
+    def invalidate_geometries(
+        self,
+        database: Optional[str],
+        schema: str,
+        table: Optional[str],
+        geometries: Iterable[Optional[dict]],
+    ) -> int:
+        """Invalidate the tiles covered by the union bbox of GeoJSON geometries."""
+        bbox = merge_bounds(geojson_bounds(g) for g in geometries)
+        if bbox is None:
+            return 0
+        removed = self.invalidate(database, schema, table, bbox)
+        if removed:
+            print(f"🧱 Invalidated {removed} cached tile(s) for {schema}.{table or '*'}")
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._tiles),
+                "bytes": self._size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Shared process-wide tile cache
+tile_cache = TileCache()
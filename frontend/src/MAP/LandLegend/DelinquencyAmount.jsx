@@ -87,7 +87,7 @@ const DelinquencyAmount = () => {
     if (!schema) return;
 
     const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-    const attrUrl = `${API}/attribute-table?schema=${schema}`;
+    const attrUrl = `${API}/attribute-table?schema=${schema}&limit=0`;
 
     Promise.all([fetch(geoUrl), fetch(attrUrl)])
       .then(([geoRes, attrRes]) => Promise.all([geoRes.json(), attrRes.json()]))
@@ -123,7 +123,7 @@ const DelinquencyAmount = () => {
       }
 
       const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-      const attrUrl = `${API}/attribute-table?schema=${schema}`;
+      const attrUrl = `${API}/attribute-table?schema=${schema}&limit=0`;
 
       Promise.all([fetch(geoUrl), fetch(attrUrl)])
         .then(([geoRes, attrRes]) =>
@@ -72,7 +72,7 @@ const LandActualUse = () => {
     }
 
     const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-    const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated path
+    const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated path
 
     Promise.all([fetch(geoUrl), fetch(attrUrl)])
       .then(([geoRes, attrRes]) => Promise.all([geoRes.json(), attrRes.json()]))
@@ -82,7 +82,7 @@ const LandOwnership = () => {
     if (!schema) return;
 
     const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-    const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated
+    const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated
 
     Promise.all([fetch(geoUrl), fetch(attrUrl)])
       .then(([geoRes, attrRes]) => Promise.all([geoRes.json(), attrRes.json()]))
@@ -118,7 +118,7 @@ const LandOwnership = () => {
       }
 
       const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-      const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated
+      const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated
 
       Promise.all([fetch(geoUrl), fetch(attrUrl)])
         .then(([geoRes, attrRes]) =>
@@ -77,7 +77,7 @@ const LandTaxability = () => {
     if (!schema) return;
 
     const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-    const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated path
+    const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated path
 
     Promise.all([fetch(geoUrl), fetch(attrUrl)])
       .then(([geoRes, attrRes]) => Promise.all([geoRes.json(), attrRes.json()]))
@@ -113,7 +113,7 @@ const LandTaxability = () => {
       }
 
       const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-      const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated path
+      const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated path
 
       Promise.all([fetch(geoUrl), fetch(attrUrl)])
         .then(([geoRes, attrRes]) =>
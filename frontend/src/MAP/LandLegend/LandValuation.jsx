@@ -79,7 +79,7 @@ const LandValuation = () => {
     if (!schema) return;
 
     const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-    const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated path
+    const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated path
 
     Promise.all([fetch(geoUrl), fetch(attrUrl)])
       .then(([geoRes, attrRes]) => Promise.all([geoRes.json(), attrRes.json()]))
@@ -115,7 +115,7 @@ const LandValuation = () => {
       }
 
       const geoUrl = `${API}/all-barangays?schemas=${schema}`;
-      const attrUrl = `${API}/search/attribute-table?schema=${schema}`; // ✅ updated path
+      const attrUrl = `${API}/search/attribute-table?schema=${schema}&limit=0`; // ✅ updated path
 
       Promise.all([fetch(geoUrl), fetch(attrUrl)])
         .then(([geoRes, attrRes]) =>
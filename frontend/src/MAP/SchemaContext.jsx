@@ -28,7 +28,7 @@ export const SchemaProvider = ({ children }) => {
       setStatus("loading");
 
       try {
-        const res = await fetch(`${API_BASE}/search/attribute-table?schema=${schema}`);
+        const res = await fetch(`${API_BASE}/search/attribute-table?schema=${schema}&limit=0`);
         if (!res.ok) throw new Error(`Server responded with ${res.status}`);
 
         const json = await res.json();
@@ -63,7 +63,7 @@ export const SchemaProvider = ({ children }) => {
     setStatus("loading");
 
     try {
-      const res = await fetch(`${API_BASE}/search/attribute-table?schema=${schema}`);
+      const res = await fetch(`${API_BASE}/search/attribute-table?schema=${schema}&limit=0`);
       if (!res.ok) throw new Error(`Server responded with ${res.status}`);
 
       const json = await res.json();